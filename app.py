@@ -10,6 +10,15 @@ app.config.from_object(Config)
 from models import db
 db.init_app(app)
 
+from services import query_counter, perf, recipe_search, search_index, images, file_serving, event_listing
+query_counter.init_app(app)
+perf.init_app(app)
+recipe_search.init_app(app)
+search_index.init_app(app)
+event_listing.init_app(app)
+images.init_app(app)
+file_serving.init_app(app)
+
 login_manager = LoginManager(app)
 login_manager.login_view = 'auth.login'
 login_manager.login_message = 'Пожалуйста, войдите в систему для доступа к этой странице.'
@@ -22,7 +31,8 @@ def load_user(user_id):
 def init_db():
     """Создание таблиц базы данных и начальных данных"""
     from models import Category
-    db.create_all()
+    from services.schema import upgrade_schema
+    upgrade_schema()
     
     # Создание базовых категорий для финансов
     if Category.query.count() == 0:
@@ -52,6 +62,7 @@ from routes.inventory import inventory_bp
 from routes.events import events_bp
 from routes.main import main_bp
 from routes.demo import demo_bp
+from routes.admin import admin_bp
 
 # Регистрация Blueprint'ов
 app.register_blueprint(auth_bp)
@@ -63,6 +74,11 @@ app.register_blueprint(recipes_bp, url_prefix='/recipes')
 app.register_blueprint(study_bp, url_prefix='/study')
 app.register_blueprint(inventory_bp, url_prefix='/inventory')
 app.register_blueprint(events_bp, url_prefix='/events')
+app.register_blueprint(admin_bp, url_prefix='/admin')
+
+# Команды CLI
+from commands import register_commands
+register_commands(app)
 
 if __name__ == '__main__':
     with app.app_context():
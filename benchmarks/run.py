@@ -0,0 +1,188 @@
+"""Бенчмарк горячих страниц каждого модуля через тестовый клиент Flask
+
+Примеры:
+    python -m benchmarks.run --scale 0.05 --output bench.json
+    python -m benchmarks.run --db bench.db --baseline benchmarks/baseline.json --threshold 0.25
+
+База создается и заполняется при первом запуске (или с --reseed). Результат
+сохраняется в JSON; при указании --baseline медианы сравниваются с эталоном и
+команда завершается с кодом 1, если какая-то страница замедлилась больше чем на
+threshold (и больше чем на --min-delta-ms, чтобы не реагировать на шум).
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, date, timedelta
+
+# Последние четыре недели плана питания (данные бенчмарка лежат в прошлом)
+MEAL_PLAN_RANGE = f'start={date.today() - timedelta(days=27)}&end={date.today()}'
+
+# (имя, URL) - горячие страницы каждого модуля
+ENDPOINTS = [
+    ('finance.index', '/finance/'),
+    ('finance.statistics.month', '/finance/statistics?period=month'),
+    ('finance.statistics.year', '/finance/statistics?period=year'),
+    ('habits.index', '/habits/'),
+    ('habits.statistics', '/habits/statistics'),
+    ('recipes.index', '/recipes/'),
+    ('recipes.meal_planner', '/recipes/meal_planner'),
+    ('recipes.meal_planner.range', f'/recipes/meal_planner/range?{MEAL_PLAN_RANGE}'),
+    ('recipes.shopping_list', '/recipes/shopping_list'),
+    ('recipes.search', '/recipes/search?q=курица'),
+    ('recipes.search.multi', '/recipes/search?q=курицей+рис'),
+    ('main.search', '/search?q=молоко'),
+    ('main.search.module', '/search?q=концерт&module=events'),
+    ('study.index', '/study/'),
+    ('study.review', '/study/review'),
+    ('study.statistics', '/study/statistics'),
+    ('inventory.index', '/inventory/'),
+    ('inventory.statistics', '/inventory/statistics'),
+    ('inventory.warranty', '/inventory/warranty'),
+    ('inventory.search', '/inventory/search?q=диван'),
+    ('events.index', '/events/'),
+    ('events.index.month', '/events/?date=month'),
+]
+
+# Тяжелые выгрузки включаются отдельно
+HEAVY_ENDPOINTS = [
+    ('finance.export_excel', '/finance/export/excel'),
+    ('finance.export_pdf', '/finance/export/pdf'),
+]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Бенчмарк Best Personal')
+    parser.add_argument('--db', default='bench.db', help='Файл SQLite для данных бенчмарка')
+    parser.add_argument('--database-url', help='Любой URL SQLAlchemy вместо --db (например, PostgreSQL)')
+    parser.add_argument('--scale', type=float, default=1.0, help='Доля от полного объема данных')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--reseed', action='store_true', help='Пересоздать данные')
+    parser.add_argument('--repeat', type=int, default=5, help='Замеров на страницу')
+    parser.add_argument('--include-heavy', action='store_true', help='Замерять также экспорт')
+    parser.add_argument('--output', help='Куда записать результат (по умолчанию stdout)')
+    parser.add_argument('--baseline', help='JSON с эталонными результатами')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Допустимое замедление (0.2 = 20%%)')
+    parser.add_argument('--min-delta-ms', type=float, default=5.0, help='Игнорировать замедления меньше')
+    return parser.parse_args(argv)
+
+
+def measure(client, url, repeat):
+    """Прогрев и repeat замеров одной страницы"""
+    response = client.get(url)
+    status = response.status_code
+    queries = response.headers.get('X-Query-Count')
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(url)
+        response.get_data()
+        timings.append((time.perf_counter() - start) * 1000)
+        status = response.status_code
+
+    timings.sort()
+    return {
+        'status': status,
+        'queries': int(queries) if queries is not None else None,
+        'median_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+        'min_ms': round(timings[0], 3),
+    }
+
+
+def compare(results, baseline, threshold, min_delta_ms):
+    """Страницы, которые замедлились относительно эталона"""
+    regressions = []
+    for name, base in baseline.get('results', {}).items():
+        current = results.get(name)
+        if current is None:
+            continue
+        delta = current['median_ms'] - base['median_ms']
+        if delta > min_delta_ms and current['median_ms'] > base['median_ms'] * (1 + threshold):
+            regressions.append({
+                'endpoint': name,
+                'baseline_ms': base['median_ms'],
+                'current_ms': current['median_ms'],
+                'change': round(current['median_ms'] / base['median_ms'] - 1, 3) if base['median_ms'] else None,
+            })
+    return regressions
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    database_url = args.database_url or 'sqlite:///' + os.path.abspath(args.db)
+    if args.reseed and not args.database_url and os.path.exists(args.db):
+        os.remove(args.db)
+
+    # Конфигурация читается при импорте приложения
+    os.environ['DATABASE_URL'] = database_url
+    os.environ.setdefault('QUERY_COUNTER_ENABLED', '1')
+
+    from app import app, init_db
+    from benchmarks import seed
+    from models import User
+
+    log = lambda message: print(message, file=sys.stderr)
+    with app.app_context():
+        init_db()
+        if User.query.filter_by(username=seed.BENCH_USERNAME).first() is None:
+            log(f'Заполнение базы (scale={args.scale})...')
+            started = time.perf_counter()
+            seed.seed_large_user(scale=args.scale, seed=args.seed, echo=log)
+            log(f'Заполнено за {time.perf_counter() - started:.1f} с')
+
+    client = app.test_client()
+    response = client.post('/login', data={'username': seed.BENCH_USERNAME,
+                                           'password': seed.BENCH_PASSWORD})
+    if response.status_code != 302:
+        log('Не удалось войти под пользователем бенчмарка')
+        return 2
+
+    endpoints = ENDPOINTS + (HEAVY_ENDPOINTS if args.include_heavy else [])
+    results = {}
+    for name, url in endpoints:
+        results[name] = measure(client, url, args.repeat)
+        log(f"{name:30} {results[name]['median_ms']:10.1f} ms  status={results[name]['status']}")
+
+    report = {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(),
+            'scale': args.scale,
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'database': database_url.split('://')[0],
+            'python': platform.python_version(),
+        },
+        'results': results,
+    }
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.threshold, args.min_delta_ms)
+        report['regressions'] = regressions
+        for regression in regressions:
+            log(f"РЕГРЕССИЯ {regression['endpoint']}: "
+                f"{regression['baseline_ms']} -> {regression['current_ms']} ms")
+        exit_code = 1 if regressions else 0
+
+    failed = [name for name, result in results.items() if result['status'] >= 500]
+    if failed:
+        log(f"Ошибки сервера: {', '.join(failed)}")
+        exit_code = 1
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
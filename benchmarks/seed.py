@@ -0,0 +1,200 @@
+"""Генератор синтетических данных "тяжелого" пользователя для бенчмарков
+
+Объемы при scale=1.0: 500k транзакций, 200 привычек с отметками за 5 лет,
+50k карточек, 10k рецептов с планом питания, 20k предметов, 100k событий.
+Данные вставляются пачками через executemany, минуя ORM.
+"""
+import random
+from datetime import datetime, date, timedelta
+
+from sqlalchemy import insert
+
+from models import (db, User, Category, Transaction, Habit, HabitLog, Recipe, MealPlan,
+                    StudyCard, StudySession, InventoryItem, Event)
+
+BENCH_USERNAME = 'bench'
+BENCH_PASSWORD = 'bench-password'
+
+FULL_SCALE = {
+    'transactions': 500_000,
+    'habits': 200,
+    'habit_days': 5 * 365,
+    'study_cards': 50_000,
+    'study_sessions': 5_000,
+    'recipes': 10_000,
+    'meal_plan_days': 2 * 365,
+    'inventory_items': 20_000,
+    'events': 100_000,
+}
+
+WORDS = ['молоко', 'яйца', 'мука', 'сахар', 'соль', 'масло', 'курица', 'рис', 'гречка',
+         'томаты', 'огурцы', 'сыр', 'лук', 'чеснок', 'картофель', 'морковь', 'яблоки',
+         'ноутбук', 'диван', 'лампа', 'стол', 'стул', 'концерт', 'выставка', 'лекция',
+         'английский', 'математика', 'история', 'физика', 'программирование']
+TOPICS = ['Математика', 'Английский язык', 'Программирование', 'История', 'Физика']
+ROOMS = ['Гостиная', 'Спальня', 'Кухня', 'Кабинет', 'Прихожая']
+INVENTORY_CATEGORIES = ['Электроника', 'Мебель', 'Одежда', 'Бытовая техника', 'Книги']
+RECIPE_CATEGORIES = ['Завтрак', 'Обед', 'Ужин', 'Десерт', 'Перекус']
+EVENT_CATEGORIES = ['Концерт', 'Выставка', 'Спорт', 'Театр', 'Лекция']
+UNITS = ['г', 'кг', 'мл', 'л', 'шт', 'ст.л.', 'ч.л.']
+MEAL_TYPES = ['breakfast', 'lunch', 'dinner']
+
+
+def _sizes(scale):
+    sizes = {name: max(1, int(count * scale)) for name, count in FULL_SCALE.items()}
+    # Продолжительность истории не масштабируем ниже месяца, иначе серии вырождаются
+    sizes['habit_days'] = max(30, sizes['habit_days'])
+    sizes['meal_plan_days'] = max(14, sizes['meal_plan_days'])
+    return sizes
+
+
+def _insert_batches(model, rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            db.session.execute(insert(model), batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(model), batch)
+    db.session.commit()
+
+
+def _text(rnd, words):
+    return ' '.join(rnd.choice(WORDS) for _ in range(words))
+
+
+def seed_large_user(scale=1.0, seed=42, batch_size=10_000, echo=print):
+    """Создает пользователя bench с синтетическими данными; возвращает его id"""
+    rnd = random.Random(seed)
+    sizes = _sizes(scale)
+    today = date.today()
+    now = datetime.now()
+
+    user = User.query.filter_by(username=BENCH_USERNAME).first()
+    if user is not None:
+        raise RuntimeError(f'Пользователь {BENCH_USERNAME} уже существует, используйте новую базу')
+    user = User(username=BENCH_USERNAME, email='bench@example.com')
+    user.set_password(BENCH_PASSWORD)
+    db.session.add(user)
+    db.session.commit()
+    user_id = user.id
+
+    category_ids = [c.id for c in Category.query.all()]
+
+    echo(f"транзакции: {sizes['transactions']}")
+    _insert_batches(Transaction, ({
+        'user_id': user_id,
+        'category_id': rnd.choice(category_ids),
+        'amount': round(rnd.uniform(50, 50_000), 2),
+        'description': _text(rnd, 3),
+        'date': today - timedelta(days=rnd.randrange(5 * 365)),
+        'created_at': now,
+    } for _ in range(sizes['transactions'])), batch_size)
+
+    echo(f"привычки: {sizes['habits']} x {sizes['habit_days']} дней")
+    _insert_batches(Habit, ({
+        'user_id': user_id,
+        'name': f'Привычка {i}',
+        'color': '#4CAF50',
+        'created_at': now,
+    } for i in range(sizes['habits'])), batch_size)
+    habit_ids = [row[0] for row in db.session.query(Habit.id).filter_by(user_id=user_id)]
+    _insert_batches(HabitLog, ({
+        'habit_id': habit_id,
+        'date': today - timedelta(days=day),
+        'created_at': now,
+    } for habit_id in habit_ids
+      for day in range(sizes['habit_days'])
+      if rnd.random() < 0.7), batch_size)
+
+    echo(f"карточки: {sizes['study_cards']}")
+    _insert_batches(StudyCard, ({
+        'user_id': user_id,
+        'front': _text(rnd, 4),
+        'back': _text(rnd, 8),
+        'topic': rnd.choice(TOPICS),
+        'difficulty': rnd.choice([0, 2]),
+        'review_count': rnd.randrange(10),
+        'next_review': now + timedelta(days=rnd.randrange(-30, 60)),
+        'created_at': now,
+    } for _ in range(sizes['study_cards'])), batch_size)
+    _insert_batches(StudySession, ({
+        'user_id': user_id,
+        'session_type': rnd.choice(['pomodoro', 'review']),
+        'duration': 25,
+        'cards_reviewed': rnd.randrange(30),
+        'date': now - timedelta(minutes=rnd.randrange(5 * 365 * 24 * 60)),
+    } for _ in range(sizes['study_sessions'])), batch_size)
+
+    echo(f"рецепты: {sizes['recipes']}")
+    _insert_batches(Recipe, ({
+        'user_id': user_id,
+        'title': f'{_text(rnd, 2).capitalize()} {i}',
+        'description': _text(rnd, 12),
+        'ingredients': '\n'.join(f'{rnd.randint(1, 500)} {rnd.choice(UNITS)} {rnd.choice(WORDS)}'
+                                 for _ in range(rnd.randint(3, 12))),
+        'instructions': _text(rnd, 60),
+        'prep_time': rnd.randint(5, 60),
+        'cook_time': rnd.randint(0, 120),
+        'servings': rnd.randint(1, 8),
+        'category': rnd.choice(RECIPE_CATEGORIES),
+        'calories': rnd.randint(100, 1200),
+        'created_at': now,
+    } for i in range(sizes['recipes'])), batch_size)
+    recipe_ids = [row[0] for row in db.session.query(Recipe.id).filter_by(user_id=user_id)]
+    week_start = today - timedelta(days=today.weekday())
+    _insert_batches(MealPlan, ({
+        'user_id': user_id,
+        'recipe_id': rnd.choice(recipe_ids),
+        'date': week_start + timedelta(days=7) - timedelta(days=day),
+        'meal_type': meal_type,
+        'created_at': now,
+    } for day in range(sizes['meal_plan_days']) for meal_type in MEAL_TYPES), batch_size)
+
+    echo(f"имущество: {sizes['inventory_items']}")
+    _insert_batches(InventoryItem, ({
+        'user_id': user_id,
+        'name': f'{_text(rnd, 2).capitalize()} {i}',
+        'description': _text(rnd, 10),
+        'category': rnd.choice(INVENTORY_CATEGORIES),
+        'room': rnd.choice(ROOMS),
+        'purchase_price': round(rnd.uniform(100, 200_000), 2),
+        'purchase_date': today - timedelta(days=rnd.randrange(3650)),
+        'warranty_expiry': today + timedelta(days=rnd.randrange(-730, 730)) if rnd.random() < 0.6 else None,
+        'serial_number': f'SN{seed}-{i:08d}',
+        'created_at': now - timedelta(minutes=i),
+    } for i in range(sizes['inventory_items'])), batch_size)
+
+    echo(f"события: {sizes['events']}")
+    _insert_batches(Event, ({
+        'user_id': user_id if rnd.random() < 0.5 else None,
+        'title': _text(rnd, 3).capitalize(),
+        'description': _text(rnd, 15),
+        'category': rnd.choice(EVENT_CATEGORIES),
+        'date': now + timedelta(minutes=rnd.randrange(-365 * 24 * 60, 365 * 24 * 60)),
+        'location': f'Площадка {rnd.randrange(200)}',
+        'price': rnd.choice([None, 500.0, 1500.0]),
+        'price_type': rnd.choice(['free', 'paid', 'donation']),
+        'is_saved': rnd.random() < 0.1,
+        'created_at': now,
+    } for _ in range(sizes['events'])), batch_size)
+
+    echo('производные данные')
+    build_derived_data(user_id)
+    return user_id
+
+
+def build_derived_data(user_id):
+    """Пересчет агрегатов и кэшей, которые при обычной работе ведут маршруты"""
+    from services import (finance_rollup, habit_streaks, recipe_ingredients, recipe_search,
+                          search_index, streak_engine)
+
+    finance_rollup.rebuild(user_id)
+    recipe_ingredients.backfill(user_id)
+    recipe_search.rebuild(user_id)
+    search_index.rebuild()
+    if streak_engine.supported():
+        streak_engine.apply(user_id)
+    else:
+        habit_streaks.recompute_all()
@@ -0,0 +1,211 @@
+"""Служебные команды Flask CLI (запуск: flask --app app <команда>)"""
+import os
+
+import click
+from flask.cli import with_appcontext
+
+
+@click.command('finance-rollup-rebuild')
+@click.option('--user-id', type=int, default=None, help='Пересчитать только для одного пользователя')
+@with_appcontext
+def finance_rollup_rebuild(user_id):
+    """Пересборка помесячных агрегатов финансов из транзакций"""
+    from services import finance_rollup
+    finance_rollup.rebuild(user_id)
+    click.echo('Агрегаты финансов пересчитаны')
+
+
+@click.command('db-upgrade')
+@with_appcontext
+def db_upgrade():
+    """Создание недостающих таблиц, колонок и индексов в существующей базе"""
+    from services.schema import upgrade_schema
+    changes = upgrade_schema()
+    for change in changes:
+        click.echo(f'+ {change}')
+    click.echo('Схема актуальна' if not changes else f'Применено изменений: {len(changes)}')
+
+
+@click.command('index-audit')
+@click.option('--user-id', type=int, default=1, help='Пользователь для подстановки в запросы')
+@click.option('--verbose', is_flag=True, help='Печатать полный план каждого запроса')
+@with_appcontext
+def index_audit(user_id, verbose):
+    """EXPLAIN типовых запросов маршрутов; код выхода 1 при полных сканированиях"""
+    from services.index_audit import run_audit
+    failed = 0
+    for result in run_audit(user_id):
+        status = 'FULL SCAN' if result['full_scans'] else 'ok'
+        click.echo(f"[{status}] {result['route']}")
+        for scan in result['full_scans']:
+            click.echo(f'    {scan}')
+        if verbose:
+            for line in result['plan']:
+                click.echo(f'      | {line}')
+        failed += bool(result['full_scans'])
+    if failed:
+        click.echo(f'Запросов с полным сканированием: {failed}')
+        raise SystemExit(1)
+
+
+@click.command('habits-recompute-streaks')
+@with_appcontext
+def habits_recompute_streaks():
+    """Пересчет кэша серий всех привычек по истории отметок"""
+    from services import habit_streaks
+    habit_streaks.recompute_all()
+    click.echo('Серии привычек пересчитаны')
+
+
+@click.command('habits-rollover')
+@with_appcontext
+def habits_rollover():
+    """Суточный сброс прерванных серий (запускать раз в сутки после полуночи UTC)"""
+    from services import habit_streaks
+    count = habit_streaks.rollover()
+    click.echo(f'Сброшено серий: {count}')
+
+
+@click.command('habits-streaks')
+@click.option('--user-id', type=int, default=None, help='Только привычки одного пользователя')
+@click.option('--apply', 'apply_', is_flag=True, help='Записать результат в кэш серий')
+@click.option('--verify', is_flag=True, help='Сверить SQL-расчет с Python-реализацией')
+@with_appcontext
+def habits_streaks(user_id, apply_, verify):
+    """Серии всех привычек одним SQL-запросом (отчет в формате JSON Lines)"""
+    import json
+    from services import streak_engine
+    if not streak_engine.supported():
+        raise click.ClickException('База данных не поддерживает оконные функции для расчета серий')
+
+    if verify:
+        mismatches = streak_engine.verify(user_id)
+        for mismatch in mismatches:
+            click.echo(json.dumps(mismatch, default=str, ensure_ascii=False))
+        if mismatches:
+            raise click.ClickException(f'Расхождений с Python-реализацией: {len(mismatches)}')
+        click.echo('SQL-расчет совпадает с Python-реализацией')
+    elif apply_:
+        count = streak_engine.apply(user_id)
+        click.echo(f'Кэш серий обновлен, привычек с отметками: {count}')
+    else:
+        for row in streak_engine.compute_all(user_id):
+            click.echo(json.dumps(row, default=str))
+
+
+@click.command('recipes-reindex')
+@click.option('--user-id', type=int, default=None, help='Переиндексировать только одного пользователя')
+@with_appcontext
+def recipes_reindex(user_id):
+    """Пересборка полнотекстового индекса рецептов"""
+    from services import recipe_search
+    if not recipe_search.available():
+        raise click.ClickException('Полнотекстовый индекс не создан, выполните db-upgrade')
+    recipe_search.rebuild(user_id)
+    click.echo('Индекс рецептов пересобран')
+
+
+@click.command('search-reindex')
+@click.option('--module', 'modules', multiple=True, help='Модуль (можно несколько): inventory, recipes, study, events, finance')
+@with_appcontext
+def search_reindex(modules):
+    """Пересборка общего поискового индекса"""
+    from services import search_index
+    unknown = set(modules) - set(search_index.SOURCES_BY_MODULE)
+    if unknown:
+        raise click.ClickException(f"Неизвестные модули: {', '.join(sorted(unknown))}")
+    if not search_index.available():
+        raise click.ClickException('Поисковый индекс не создан, выполните db-upgrade')
+    count = search_index.rebuild(modules or None)
+    click.echo(f'Проиндексировано документов: {count}')
+
+
+@click.command('recipes-parse-ingredients')
+@click.option('--user-id', type=int, default=None, help='Только рецепты одного пользователя')
+@with_appcontext
+def recipes_parse_ingredients(user_id):
+    """Массовый разбор текста ингредиентов в таблицу recipe_ingredients"""
+    from services import recipe_ingredients
+    count = recipe_ingredients.backfill(user_id)
+    click.echo(f'Разобрано ингредиентов: {count}')
+
+
+@click.command('assets-compress')
+@with_appcontext
+def assets_compress():
+    """Сжатые .gz/.br копии CSS и JS для отдачи без сжатия на лету (запускать при сборке)"""
+    from flask import current_app
+    from services import file_serving
+    created = file_serving.compress_static(current_app.static_folder)
+    for path in created:
+        click.echo(f'+ {os.path.relpath(path, current_app.static_folder)}')
+    if file_serving.brotli is None:
+        click.echo('Пакет brotli не установлен: .br не созданы')
+    click.echo(f'Создано файлов: {len(created)}')
+
+
+@click.command('warranty-scan')
+@with_appcontext
+def warranty_scan():
+    """Уведомления о предметах, гарантия которых входит в окна WARRANTY_NOTIFY_DAYS"""
+    from services import warranty_notifications
+    count = warranty_notifications.scan()
+    click.echo(f'Новых уведомлений: {count}')
+
+
+@click.command('images-sweep')
+@with_appcontext
+def images_sweep():
+    """Удаление изображений, на которые не ссылается ни один рецепт или предмет"""
+    from services import images
+    count = images.sweep()
+    click.echo(f'Удалено изображений: {count}')
+
+
+@click.command('events-import')
+@click.option('--source', 'urls', multiple=True, help='URL источника вместо EVENT_SOURCES (можно несколько)')
+@click.option('--parser', 'parser_name', default='html', show_default=True, help='Парсер для --source')
+@with_appcontext
+def events_import(urls, parser_name):
+    """Импорт публичных событий из источников EVENT_SOURCES"""
+    from urllib.parse import urlsplit
+    from services import event_import
+    sources = [event_import.Source(urlsplit(url).netloc or url, url, parser_name) for url in urls]
+    if not sources and not event_import.configured_sources():
+        raise click.ClickException('Источники не заданы: укажите EVENT_SOURCES или --source')
+    stats = event_import.run_import(sources or None)
+    for name, error in stats.errors:
+        click.echo(f'! {name}: {error}')
+    click.echo(f'Источников: {stats.sources}, без изменений: {stats.not_modified}, '
+               f'событий: {stats.events}, дубликатов: {stats.duplicates}, без даты или названия: {stats.invalid}')
+    click.echo(f'Добавлено: {stats.created}, обновлено: {stats.updated}')
+    if stats.errors:
+        raise SystemExit(1)
+
+
+@click.command('scheduler')
+@with_appcontext
+def scheduler():
+    """Процесс планировщика: гарантии, суточный сброс серий привычек, изображения, импорт событий"""
+    from flask import current_app
+    from services import scheduler as jobs
+    click.echo('Планировщик запущен')
+    jobs.run_forever(current_app._get_current_object())
+
+
+def register_commands(app):
+    """Регистрация команд в приложении"""
+    app.cli.add_command(finance_rollup_rebuild)
+    app.cli.add_command(db_upgrade)
+    app.cli.add_command(index_audit)
+    app.cli.add_command(habits_recompute_streaks)
+    app.cli.add_command(habits_rollover)
+    app.cli.add_command(habits_streaks)
+    app.cli.add_command(recipes_reindex)
+    app.cli.add_command(search_reindex)
+    app.cli.add_command(recipes_parse_ingredients)
+    app.cli.add_command(assets_compress)
+    app.cli.add_command(warranty_scan)
+    app.cli.add_command(images_sweep)
+    app.cli.add_command(events_import)
+    app.cli.add_command(scheduler)
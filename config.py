@@ -13,7 +13,71 @@ class Config:
     # Настройки загрузки файлов
     UPLOAD_FOLDER = 'uploads'
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
+    IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', 2))  # потоков обработки изображений
+    IMAGE_RELEASE_GRACE = 3600  # секунд: недавно выданный ключ изображения не удаляется
+    # Отдача загрузок: '' - самим приложением, 'x-accel' - nginx, 'x-sendfile' - Apache/lighttpd
+    SEND_FILE_MODE = os.environ.get('SEND_FILE_MODE', '').lower()
+    X_ACCEL_UPLOADS_PREFIX = os.environ.get('X_ACCEL_UPLOADS_PREFIX', '/protected-uploads')  # internal location nginx
+    
+    # Очередь повторения карточек
+    REVIEW_BATCH_SIZE = 10  # карточек, выбираемых из самых просроченных
+    REVIEW_PREFETCH = 5  # карточек, подгружаемых клиенту заранее
+    REVIEW_SYNC_MAX_ANSWERS = 500  # ответов в одном пакете синхронизации
+    
+    # План питания
+    MEAL_PLAN_RANGE_MAX_DAYS = 93  # самый длинный период одного запроса /meal_planner/range
+    MEAL_PLAN_COPY_MAX_WEEKS = 12  # на сколько недель вперед можно размножить неделю
+    
+    # Поиск
+    RECIPE_SEARCH_PER_PAGE = 24
+    INVENTORY_PER_PAGE = 24  # предметов на странице каталога имущества
+    SEARCH_RESULTS_PER_MODULE = 5  # результатов каждого модуля в общем поиске
+    SEARCH_RESULTS_MODULE_LIMIT = 50  # при поиске внутри одного модуля
+    
+    # Контроль количества SQL-запросов на один HTTP-запрос (поиск N+1)
+    QUERY_COUNTER_ENABLED = os.environ.get('QUERY_COUNTER_ENABLED', '').lower() in ('1', 'true', 'yes')
+    QUERY_COUNTER_THRESHOLD = int(os.environ.get('QUERY_COUNTER_THRESHOLD', 5))
+    QUERY_COUNTER_RAISE = os.environ.get('QUERY_COUNTER_RAISE', '').lower() in ('1', 'true', 'yes')
+    
+    # Метрики производительности запросов (JSON: /admin/metrics)
+    PERF_METRICS_ENABLED = os.environ.get('PERF_METRICS_ENABLED', '').lower() in ('1', 'true', 'yes')
+    PERF_METRICS_WINDOW = int(os.environ.get('PERF_METRICS_WINDOW', 1000))  # запросов на endpoint
+    PERF_LOG_ENABLED = os.environ.get('PERF_LOG_ENABLED', '').lower() in ('1', 'true', 'yes')
+    
+    # Администраторы (через запятую)
+    ADMIN_USERNAMES = [name.strip() for name in os.environ.get('ADMIN_USERNAMES', '').split(',') if name.strip()]
     
     # Настройки для экспорта
     EXPORT_FOLDER = 'exports'
+    EXPORT_CHUNK_SIZE = 1000  # строк за одно чтение из базы
+    EXPORT_ASYNC_THRESHOLD = 50000  # больше строк - экспорт в фоновой задаче
+    # Папка с DejaVuSans.ttf и DejaVuSans-Bold.ttf для PDF; по умолчанию шрифты matplotlib
+    PDF_FONT_FOLDER = os.environ.get('PDF_FONT_FOLDER')
+    
+    # Импорт имущества из CSV/XLSX
+    IMPORT_BATCH_SIZE = 1000  # строк в одном INSERT (executemany)
+    IMPORT_MAX_ERRORS = 500  # ошибок строк в отчете (остальные только считаются)
+    
+    # Лента и календарь событий
+    EVENTS_PER_PAGE = 20  # событий на странице ленты и повестки
+    EVENTS_AGENDA_MAX_DAYS = 92  # самый длинный период одного запроса /events/api/agenda
+    EVENT_CATEGORIES_TTL = 300  # секунд кэша списка категорий
+    
+    # Импорт публичных событий: URL через запятую, "URL|парсер" для не-HTML источников
+    # (html - JSON-LD и микроразметка schema.org на странице, jsonld - JSON-лента)
+    EVENT_SOURCES = [entry.strip() for entry in os.environ.get('EVENT_SOURCES', '').split(',') if entry.strip()]
+    EVENT_IMPORT_WORKERS = int(os.environ.get('EVENT_IMPORT_WORKERS', 4))  # параллельных загрузок
+    EVENT_IMPORT_TIMEOUT = 15  # секунд на один источник
+    
+    # Планировщик (flask --app app scheduler), время - в UTC
+    WARRANTY_NOTIFY_DAYS = (30, 7, 1)  # за сколько дней до конца гарантии уведомлять
+    WARRANTY_SCAN_AT = os.environ.get('WARRANTY_SCAN_AT', '03:00')
+    HABITS_ROLLOVER_AT = os.environ.get('HABITS_ROLLOVER_AT', '00:05')
+    EVENT_IMPORT_EVERY_HOURS = int(os.environ.get('EVENT_IMPORT_EVERY_HOURS', 6))
+    IMAGES_SWEEP_AT = os.environ.get('IMAGES_SWEEP_AT', '04:00')
+    
+    # Графики на сервере (matplotlib в пуле процессов)
+    CHART_CACHE_FOLDER = os.environ.get('CHART_CACHE_FOLDER', os.path.join('cache', 'charts'))
+    CHART_WORKERS = int(os.environ.get('CHART_WORKERS', 2))
+    CHART_RENDER_TIMEOUT = 30  # секунд на один график
 
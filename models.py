@@ -17,6 +17,7 @@ class User(UserMixin, db.Model):
     
     # Relationships
     transactions = db.relationship('Transaction', backref='user', lazy=True, cascade='all, delete-orphan')
+    finance_rollups = db.relationship('FinanceMonthlyRollup', lazy=True, cascade='all, delete-orphan')
     habits = db.relationship('Habit', backref='user', lazy=True, cascade='all, delete-orphan')
     recipes = db.relationship('Recipe', backref='user', lazy=True, cascade='all, delete-orphan')
     meal_plans = db.relationship('MealPlan', backref='user', lazy=True, cascade='all, delete-orphan')
@@ -59,9 +60,27 @@ class Transaction(db.Model):
     date = db.Column(db.Date, nullable=False, default=datetime.utcnow)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (db.Index('ix_transactions_user_date', 'user_id', 'date'),)
+    
     def __repr__(self):
         return f'<Transaction {self.amount} {self.date}>'
 
+class FinanceMonthlyRollup(db.Model):
+    """Суммы транзакций пользователя по месяцам и категориям"""
+    __tablename__ = 'finance_monthly_rollups'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    month = db.Column(db.Date, nullable=False)  # первый день месяца
+    category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=False)
+    total = db.Column(db.Float, nullable=False, default=0)
+    tx_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (db.UniqueConstraint('user_id', 'month', 'category_id', name='unique_rollup_month_category'),)
+    
+    def __repr__(self):
+        return f'<FinanceMonthlyRollup {self.user_id} {self.month} {self.category_id}>'
+
 # ==================== HABITS MODULE ====================
 class Habit(db.Model):
     __tablename__ = 'habits'
@@ -74,23 +93,21 @@ class Habit(db.Model):
     reminder_time = db.Column(db.Time)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Кэш серий, обновляется при отметке (services/habit_streaks.py)
+    current_streak = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # 0, если серия прервана
+    longest_streak = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    last_log_date = db.Column(db.Date)
+    total_logs = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
     logs = db.relationship('HabitLog', backref='habit', lazy=True, cascade='all, delete-orphan')
     
+    __table_args__ = (db.Index('ix_habits_user_id', 'user_id'),)
+    
     def get_current_streak(self):
-        """Вычисляет текущую серию дней"""
-        logs = sorted(self.logs, key=lambda x: x.date, reverse=True)
-        if not logs or logs[0].date != datetime.utcnow().date():
+        """Текущая серия дней (серия засчитывается, если привычка отмечена сегодня)"""
+        if self.last_log_date != datetime.utcnow().date():
             return 0
-        
-        streak = 0
-        current_date = datetime.utcnow().date()
-        for log in logs:
-            if log.date == current_date:
-                streak += 1
-                current_date -= timedelta(days=1)
-            else:
-                break
-        return streak
+        return self.current_streak
     
     def __repr__(self):
         return f'<Habit {self.name}>'
@@ -104,6 +121,7 @@ class HabitLog(db.Model):
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Уникальный индекс (habit_id, date) обслуживает и выборки логов по диапазону дат
     __table_args__ = (db.UniqueConstraint('habit_id', 'date', name='unique_habit_date'),)
     
     def __repr__(self):
@@ -126,12 +144,39 @@ class Recipe(db.Model):
     calories = db.Column(db.Float)
     image_path = db.Column(db.String(255))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    meal_plans = db.relationship('MealPlan', backref='recipe', lazy=True,
+                                 cascade='all, delete-orphan')
+    template_items = db.relationship('MealPlanTemplateItem', backref='recipe', lazy=True,
+                                     cascade='all, delete-orphan')
+    parsed_ingredients = db.relationship('RecipeIngredient', backref='recipe', lazy=True,
+                                         cascade='all, delete-orphan',
+                                         order_by='RecipeIngredient.position')
     
-    meal_plans = db.relationship('MealPlan', backref='recipe', lazy=True)
+    __table_args__ = (db.Index('ix_recipes_user_category', 'user_id', 'category'),)
     
     def __repr__(self):
         return f'<Recipe {self.title}>'
 
+class RecipeIngredient(db.Model):
+    """Ингредиент рецепта, разобранный из текста: количество в базовой единице"""
+    __tablename__ = 'recipe_ingredients'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    recipe_id = db.Column(db.Integer, db.ForeignKey('recipes.id'), nullable=False)
+    position = db.Column(db.Integer, nullable=False, default=0)
+    raw = db.Column(db.String(500), nullable=False)  # исходная строка
+    name = db.Column(db.String(200), nullable=False)  # нормализованное название
+    name_key = db.Column(db.String(200), nullable=False)  # основы слов: "муки" и "мука" совпадают
+    quantity = db.Column(db.Float)  # в единице unit; None - "по вкусу"
+    unit = db.Column(db.String(20))  # г, мл, шт или None
+    
+    __table_args__ = (db.Index('ix_recipe_ingredients_recipe', 'recipe_id'),)
+    
+    def __repr__(self):
+        return f'<RecipeIngredient {self.name} {self.quantity} {self.unit}>'
+
 class MealPlan(db.Model):
     __tablename__ = 'meal_plans'
     
@@ -141,10 +186,43 @@ class MealPlan(db.Model):
     date = db.Column(db.Date, nullable=False)
     meal_type = db.Column(db.String(20))  # breakfast, lunch, dinner, snack
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Одно блюдо на прием пищи в день; нужен для INSERT ... ON CONFLICT
+    __table_args__ = (db.Index('ux_meal_plans_user_date_meal', 'user_id', 'date', 'meal_type',
+                               unique=True),)
     
     def __repr__(self):
         return f'<MealPlan {self.date} {self.meal_type}>'
 
+class MealPlanTemplate(db.Model):
+    """Сохраненный шаблон плана питания (например, типовая неделя)"""
+    __tablename__ = 'meal_plan_templates'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    name = db.Column(db.String(100), nullable=False)
+    days = db.Column(db.Integer, nullable=False, default=7)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    items = db.relationship('MealPlanTemplateItem', backref='template', lazy=True,
+                            cascade='all, delete-orphan')
+    
+    def __repr__(self):
+        return f'<MealPlanTemplate {self.name}>'
+
+class MealPlanTemplateItem(db.Model):
+    __tablename__ = 'meal_plan_template_items'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    template_id = db.Column(db.Integer, db.ForeignKey('meal_plan_templates.id'), nullable=False)
+    day_offset = db.Column(db.Integer, nullable=False)  # день от начала шаблона, с 0
+    meal_type = db.Column(db.String(20), nullable=False)
+    recipe_id = db.Column(db.Integer, db.ForeignKey('recipes.id'), nullable=False)
+    
+    __table_args__ = (db.UniqueConstraint('template_id', 'day_offset', 'meal_type',
+                                          name='unique_template_day_meal'),)
+
 # ==================== STUDY MODULE ====================
 class StudyCard(db.Model):
     __tablename__ = 'study_cards'
@@ -160,6 +238,35 @@ class StudyCard(db.Model):
     review_count = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('ix_study_cards_user_next_review', 'user_id', 'next_review'),
+        db.Index('ix_study_cards_user_topic_next_review', 'user_id', 'topic', 'next_review'),
+    )
+    
+    def apply_answer(self, quality, answered_at=None):
+        """Обновляет расписание по оценке ответа 0-5 (упрощенная версия SM-2)"""
+        answered_at = answered_at or datetime.now()
+        
+        if self.difficulty == 0:
+            self.difficulty = 2.5
+        else:
+            self.difficulty = max(0, self.difficulty + (0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02)))
+        
+        # Вычисляем интервал
+        if quality < 3:
+            interval = 1  # Повторить завтра
+        else:
+            if self.review_count == 0:
+                interval = 1
+            elif self.review_count == 1:
+                interval = 6
+            else:
+                interval = int(self.difficulty * self.review_count)
+        
+        self.last_reviewed = answered_at
+        self.next_review = answered_at + timedelta(days=interval)
+        self.review_count = (self.review_count or 0) + 1
+    
     def __repr__(self):
         return f'<StudyCard {self.id}>'
 
@@ -173,6 +280,8 @@ class StudySession(db.Model):
     cards_reviewed = db.Column(db.Integer, default=0)
     date = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (db.Index('ix_study_sessions_user_date', 'user_id', 'date'),)
+    
     def __repr__(self):
         return f'<StudySession {self.session_type} {self.date}>'
 
@@ -193,9 +302,43 @@ class InventoryItem(db.Model):
     image_path = db.Column(db.String(255))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('ix_inventory_items_user_created', 'user_id', 'created_at'),
+        db.Index('ix_inventory_items_user_warranty', 'user_id', 'warranty_expiry'),
+        db.Index('ix_inventory_items_user_category', 'user_id', 'category'),
+        db.Index('ix_inventory_items_user_room', 'user_id', 'room'),
+        # Планировщик уведомлений ищет истекающие гарантии сразу всех пользователей
+        db.Index('ix_inventory_items_warranty_expiry', 'warranty_expiry'),
+    )
+    
+    warranty_notifications = db.relationship('WarrantyNotification', backref='item', lazy=True,
+                                             cascade='all, delete-orphan')
+    
     def __repr__(self):
         return f'<InventoryItem {self.name}>'
 
+class WarrantyNotification(db.Model):
+    """Уведомление о скором окончании гарантии (записывает планировщик)"""
+    __tablename__ = 'warranty_notifications'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    item_id = db.Column(db.Integer, db.ForeignKey('inventory_items.id'), nullable=False)
+    days_before = db.Column(db.Integer, nullable=False)  # окно: 30, 7 или 1 день
+    warranty_expiry = db.Column(db.Date, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    read_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        # Одно уведомление на окно: повторное сканирование ничего не дублирует
+        db.Index('ux_warranty_notifications_item_expiry_days', 'item_id', 'warranty_expiry',
+                 'days_before', unique=True),
+        db.Index('ix_warranty_notifications_user_read', 'user_id', 'read_at'),
+    )
+    
+    def __repr__(self):
+        return f'<WarrantyNotification {self.item_id} {self.days_before}>'
+
 # ==================== EVENTS MODULE ====================
 class Event(db.Model):
     __tablename__ = 'events'
@@ -211,8 +354,40 @@ class Event(db.Model):
     price_type = db.Column(db.String(20))  # 'free', 'paid', 'donation'
     source_url = db.Column(db.String(500))
     is_saved = db.Column(db.Boolean, default=False)
+    import_key = db.Column(db.String(40))  # sha1 ключа дедупликации импортированного события
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # (user_id, date) обслуживает и публичные события: user_id IS NULL тоже ищется по индексу
+    __table_args__ = (
+        db.Index('ix_events_user_date', 'user_id', 'date'),
+        db.Index('ix_events_user_category', 'user_id', 'category'),
+        db.Index('ux_events_import_key', 'import_key', unique=True),
+    )
+    
     def __repr__(self):
         return f'<Event {self.title}>'
 
+class EventSourceState(db.Model):
+    """Валидаторы HTTP-кэша источника событий для условных запросов импорта"""
+    __tablename__ = 'event_source_states'
+    
+    url = db.Column(db.String(500), primary_key=True)
+    etag = db.Column(db.String(200))
+    last_modified = db.Column(db.String(100))
+    content_hash = db.Column(db.String(40))  # sha1 тела последнего разобранного ответа
+    fetched_at = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<EventSourceState {self.url}>'
+
+# ==================== ФОНОВЫЕ ЗАДАЧИ ====================
+class JobState(db.Model):
+    """Дата последнего успешного запуска периодической задачи планировщика"""
+    __tablename__ = 'job_states'
+    
+    name = db.Column(db.String(100), primary_key=True)
+    last_run_date = db.Column(db.Date)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<JobState {self.name} {self.last_run_date}>'
@@ -0,0 +1,24 @@
+from flask import Blueprint, jsonify, abort, current_app
+from flask_login import login_required, current_user
+from functools import wraps
+
+admin_bp = Blueprint('admin', __name__)
+
+def admin_required(view):
+    """Доступ только для пользователей из ADMIN_USERNAMES"""
+    @wraps(view)
+    @login_required
+    def wrapper(*args, **kwargs):
+        if current_user.username not in current_app.config['ADMIN_USERNAMES']:
+            abort(403)
+        return view(*args, **kwargs)
+    return wrapper
+
+@admin_bp.route('/metrics')
+@admin_required
+def metrics():
+    """Перцентили времени ответа, SQL и шаблонов по endpoint"""
+    from services import perf
+    if not current_app.config.get('PERF_METRICS_ENABLED'):
+        return jsonify({'enabled': False, 'endpoints': {}})
+    return jsonify({'enabled': True, 'endpoints': perf.store.summary()})
@@ -1,9 +1,9 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app
 from flask_login import login_required, current_user
 from models import db, Event
 from datetime import datetime, date, timedelta
-import requests
-from bs4 import BeautifulSoup
+from routes.admin import admin_required
+from services import event_import, event_listing
 
 events_bp = Blueprint('events', __name__)
 
@@ -13,49 +13,97 @@ def index():
     """Главная страница поиска событий"""
     category = request.args.get('category', '')
     date_filter = request.args.get('date', '')
+    cursor = request.args.get('cursor', '')
     
-    events_query = Event.query.filter(
-        (Event.user_id == current_user.id) | (Event.user_id.is_(None))
-    )
-    
-    if category:
-        events_query = events_query.filter_by(category=category)
-    
-    if date_filter == 'today':
-        today = date.today()
-        events_query = events_query.filter(
-            db.func.date(Event.date) == today
-        )
-    elif date_filter == 'week':
-        week_start = date.today()
-        week_end = week_start + timedelta(days=7)
-        events_query = events_query.filter(
-            db.func.date(Event.date) >= week_start,
-            db.func.date(Event.date) <= week_end
-        )
-    elif date_filter == 'month':
-        month_start = date.today().replace(day=1)
-        next_month = month_start + timedelta(days=32)
-        month_end = next_month.replace(day=1) - timedelta(days=1)
-        events_query = events_query.filter(
-            db.func.date(Event.date) >= month_start,
-            db.func.date(Event.date) <= month_end
-        )
-    
-    events = events_query.order_by(Event.date).all()
-    
-    # Получаем уникальные категории
-    categories = db.session.query(Event.category)\
-        .filter(Event.category.isnot(None))\
-        .distinct().all()
-    categories = [c[0] for c in categories if c[0]]
+    # Период - полуоткрытый диапазон [начало, конец) по индексу (user_id, date)
+    start, end = event_listing.period_range(date_filter)
+    events, next_cursor = event_listing.page(current_user.id, start, end, category, cursor,
+                                             current_app.config['EVENTS_PER_PAGE'])
     
     return render_template('events/index.html',
                          events=events,
-                         categories=categories,
+                         next_cursor=next_cursor,
+                         cursor=cursor,
+                         categories=event_listing.categories(current_user.id),
                          selected_category=category,
                          selected_date=date_filter)
 
+def _month_arg():
+    """Месяц из ?month=ГГГГ-ММ (по умолчанию текущий) или None при ошибке"""
+    value = request.args.get('month')
+    if not value:
+        return date.today().replace(day=1)
+    try:
+        return datetime.strptime(value, '%Y-%m').date()
+    except ValueError:
+        return None
+
+@events_bp.route('/calendar')
+@login_required
+def calendar():
+    """Календарь событий на месяц"""
+    category = request.args.get('category', '')
+    month = _month_arg() or date.today().replace(day=1)
+    weeks = event_listing.month_grid(current_user.id, month, category)
+    
+    return render_template('events/calendar.html',
+                         weeks=weeks,
+                         month=month,
+                         prev_month=(month - timedelta(days=1)).replace(day=1),
+                         next_month=event_listing.month_bounds(month)[1],
+                         today=date.today(),
+                         categories=event_listing.categories(current_user.id),
+                         selected_category=category)
+
+@events_bp.route('/api/calendar')
+@login_required
+def calendar_api():
+    """Сетка месяца с событиями по дням (JSON): ?month=ГГГГ-ММ&category="""
+    month = _month_arg()
+    if month is None:
+        return jsonify({'error': 'Укажите month в формате ГГГГ-ММ'}), 400
+    
+    weeks = event_listing.month_grid(current_user.id, month, request.args.get('category', ''))
+    return jsonify({
+        'month': month.strftime('%Y-%m'),
+        'weeks': [[{
+            'date': day.isoformat(),
+            'in_month': day.month == month.month,
+            'events': [event_listing.event_to_dict(event) for event in events]
+        } for day, events in week] for week in weeks]
+    })
+
+@events_bp.route('/api/agenda')
+@login_required
+def agenda_api():
+    """Повестка (JSON): события с start на days дней, страницами по курсору
+    
+    Параметры: start=ГГГГ-ММ-ДД (по умолчанию сегодня), days, category, cursor.
+    """
+    try:
+        start = datetime.strptime(request.args['start'], '%Y-%m-%d').date() \
+            if request.args.get('start') else date.today()
+    except ValueError:
+        return jsonify({'error': 'Укажите start в формате ГГГГ-ММ-ДД'}), 400
+    
+    max_days = current_app.config['EVENTS_AGENDA_MAX_DAYS']
+    days = request.args.get('days', 14, type=int)
+    if not 1 <= days <= max_days:
+        return jsonify({'error': f'Период должен быть от 1 до {max_days} дней'}), 400
+    
+    end = start + timedelta(days=days)
+    events, next_cursor = event_listing.page(current_user.id, event_listing.day_start(start),
+                                             event_listing.day_start(end),
+                                             request.args.get('category', ''),
+                                             request.args.get('cursor', ''),
+                                             current_app.config['EVENTS_PER_PAGE'])
+    return jsonify({
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'events': [event_listing.event_to_dict(event) for event in events],
+        'next_cursor': next_cursor
+    })
+
 @events_bp.route('/add', methods=['GET', 'POST'])
 @login_required
 def add_event():
@@ -140,7 +188,7 @@ def saved_events():
     events = Event.query.filter_by(user_id=current_user.id, is_saved=True)\
         .order_by(Event.date).all()
     
-    return render_template('events/saved.html', events=events)
+    return render_template('events/saved_events.html', events=events)
 
 @events_bp.route('/delete/<int:id>')
 @login_required
@@ -157,12 +205,19 @@ def delete_event(id):
     flash('Событие удалено', 'success')
     return redirect(url_for('events.index'))
 
-@events_bp.route('/import')
-@login_required
+@events_bp.route('/import', methods=['POST'])
+@admin_required
 def import_events():
-    """Импорт событий из внешних источников (заглушка)"""
-    # В реальном приложении здесь будет парсинг различных источников
-    flash('Функция импорта событий в разработке', 'info')
+    """Импорт публичных событий из источников EVENT_SOURCES"""
+    if not event_import.configured_sources():
+        flash('Источники событий не настроены (EVENT_SOURCES)', 'info')
+        return redirect(url_for('events.index'))
+    
+    stats = event_import.run_import()
+    flash(f'Импорт событий: добавлено {stats.created}, обновлено {stats.updated}, '
+          f'источников без изменений {stats.not_modified} из {stats.sources}', 'success')
+    if stats.errors:
+        flash('Не удалось загрузить: ' + ', '.join(name for name, _ in stats.errors), 'warning')
     return redirect(url_for('events.index'))
 
 @events_bp.route('/map')
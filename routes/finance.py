@@ -1,13 +1,11 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, send_file
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, send_file, \
+    current_app, abort, Response
 from flask_login import login_required, current_user
 from models import db, Transaction, Category
-from datetime import datetime, timedelta
-from sqlalchemy import func, extract
-import pandas as pd
-import io
-from openpyxl import Workbook
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
+from datetime import datetime
+from sqlalchemy.orm import joinedload
+import os
+from services import finance_export, finance_report, finance_rollup
 
 finance_bp = Blueprint('finance', __name__)
 
@@ -17,23 +15,16 @@ def index():
     """Главная страница финансового модуля"""
     # Получаем последние транзакции
     transactions = Transaction.query.filter_by(user_id=current_user.id)\
+        .options(joinedload(Transaction.category))\
         .order_by(Transaction.date.desc()).limit(10).all()
     
     # Статистика за текущий месяц
     today = datetime.now().date()
     month_start = today.replace(day=1)
     
-    income = db.session.query(func.sum(Transaction.amount))\
-        .join(Category)\
-        .filter(Transaction.user_id == current_user.id,
-                Transaction.date >= month_start,
-                Category.type == 'income').scalar() or 0
-    
-    expenses = db.session.query(func.sum(Transaction.amount))\
-        .join(Category)\
-        .filter(Transaction.user_id == current_user.id,
-                Transaction.date >= month_start,
-                Category.type == 'expense').scalar() or 0
+    totals = finance_rollup.totals_by_type(current_user.id, month_start)
+    income = totals.get('income', 0)
+    expenses = totals.get('expense', 0)
     
     balance = income - expenses
     
@@ -61,6 +52,7 @@ def add_transaction():
             date=date
         )
         db.session.add(transaction)
+        finance_rollup.record_added(transaction)
         db.session.commit()
         
         flash('Транзакция добавлена', 'success')
@@ -80,10 +72,12 @@ def edit_transaction(id):
         return redirect(url_for('finance.index'))
     
     if request.method == 'POST':
+        old_values = finance_rollup.snapshot(transaction)
         transaction.category_id = request.form.get('category_id')
         transaction.amount = float(request.form.get('amount'))
         transaction.description = request.form.get('description')
         transaction.date = datetime.strptime(request.form.get('date'), '%Y-%m-%d').date()
+        finance_rollup.record_edited(old_values, transaction)
         
         db.session.commit()
         flash('Транзакция обновлена', 'success')
@@ -105,6 +99,7 @@ def delete_transaction(id):
         return redirect(url_for('finance.index'))
     
     db.session.delete(transaction)
+    finance_rollup.record_deleted(transaction)
     db.session.commit()
     flash('Транзакция удалена', 'success')
     return redirect(url_for('finance.index'))
@@ -115,121 +110,119 @@ def statistics():
     """Статистика по периодам"""
     period = request.args.get('period', 'month')
     
-    today = datetime.now().date()
-    
-    if period == 'week':
-        start_date = today - timedelta(days=7)
-    elif period == 'month':
-        start_date = today.replace(day=1)
-    elif period == 'year':
-        start_date = today.replace(month=1, day=1)
-    else:
-        start_date = today.replace(day=1)
-    
-    # Транзакции за период
-    transactions = Transaction.query.filter_by(user_id=current_user.id)\
-        .filter(Transaction.date >= start_date).all()
-    
-    # Статистика по категориям
-    category_stats = db.session.query(
-        Category.name,
-        Category.type,
-        func.sum(Transaction.amount).label('total')
-    ).join(Transaction)\
-     .filter(Transaction.user_id == current_user.id,
-             Transaction.date >= start_date)\
-     .group_by(Category.id, Category.name, Category.type).all()
-    
-    # Данные для графика
-    chart_data = {
-        'labels': [cat[0] for cat in category_stats],
-        'data': [float(cat[2]) for cat in category_stats],
-        'types': [cat[1] for cat in category_stats]
-    }
-    
+    # График загружается отдельно с /statistics/data после отрисовки страницы
     return render_template('finance/statistics.html',
                          period=period,
-                         category_stats=category_stats,
-                         chart_data=chart_data)
+                         category_stats=finance_rollup.period_category_totals(current_user.id, period))
+
+@finance_bp.route('/statistics/data')
+@login_required
+def statistics_data():
+    """Данные графика статистики по категориям (JSON)"""
+    category_stats = finance_rollup.period_category_totals(current_user.id,
+                                                          request.args.get('period', 'month'))
+    return jsonify({
+        'labels': [cat[0] for cat in category_stats],
+        'values': [float(cat[2]) for cat in category_stats],
+        'types': [cat[1] for cat in category_stats]
+    })
 
 @finance_bp.route('/export/excel')
 @login_required
 def export_excel():
     """Экспорт данных в Excel"""
-    transactions = Transaction.query.filter_by(user_id=current_user.id)\
-        .order_by(Transaction.date.desc()).all()
-    
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Транзакции"
-    
-    # Заголовки
-    ws.append(['Дата', 'Категория', 'Тип', 'Сумма', 'Описание'])
-    
-    # Данные
-    for t in transactions:
-        ws.append([
-            t.date.strftime('%Y-%m-%d'),
-            t.category.name,
-            'Доход' if t.category.type == 'income' else 'Расход',
-            t.amount,
-            t.description or ''
-        ])
-    
-    # Сохранение в память
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
-    
-    return send_file(output, 
-                    mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    chunk_size = current_app.config['EXPORT_CHUNK_SIZE']
+    total = finance_export.count_transactions(current_user.id)
+    
+    # Большие выгрузки уходят в фоновую задачу
+    if request.args.get('background') or total > current_app.config['EXPORT_ASYNC_THRESHOLD']:
+        job_id = finance_export.start_export_job(current_app._get_current_object(),
+                                                 current_user.id, chunk_size)
+        flash('Экспорт запущен в фоновом режиме', 'info')
+        return redirect(url_for('finance.export_job', job_id=job_id))
+    
+    path = finance_export.build_export_file(current_user.id,
+                                            current_app.config['EXPORT_FOLDER'],
+                                            chunk_size)
+    filename = f'finance_export_{datetime.now().strftime("%Y%m%d")}.xlsx'
+    
+    return Response(finance_export.stream_file(path),
+                    mimetype=finance_export.XLSX_MIMETYPE,
+                    headers={
+                        'Content-Disposition': f'attachment; filename={filename}',
+                        'Content-Length': str(os.path.getsize(path))
+                    })
+
+def _get_export_job(job_id):
+    """Статус задачи экспорта с проверкой владельца"""
+    status = finance_export.read_job_status(current_app.config['EXPORT_FOLDER'], job_id)
+    if status is None or status.get('user_id') != current_user.id:
+        abort(404)
+    return status
+
+@finance_bp.route('/export/jobs/<job_id>')
+@login_required
+def export_job(job_id):
+    """Страница ожидания фонового экспорта"""
+    status = _get_export_job(job_id)
+    return render_template('finance/export_job.html', job=status)
+
+@finance_bp.route('/export/jobs/<job_id>/status')
+@login_required
+def export_job_status(job_id):
+    """Статус фонового экспорта для опроса"""
+    status = _get_export_job(job_id)
+    result = {'job_id': job_id, 'status': status['status']}
+    if status['status'] == 'done':
+        result['download_url'] = url_for('finance.export_job_download', job_id=job_id)
+    elif status['status'] == 'failed':
+        result['error'] = status.get('error')
+    return jsonify(result)
+
+@finance_bp.route('/export/jobs/<job_id>/download')
+@login_required
+def export_job_download(job_id):
+    """Скачивание результата фонового экспорта"""
+    status = _get_export_job(job_id)
+    if status['status'] != 'done':
+        abort(404)
+    
+    path = finance_export.job_result_path(current_app.config['EXPORT_FOLDER'], job_id)
+    return send_file(os.path.abspath(path),
+                    mimetype=finance_export.XLSX_MIMETYPE,
                     as_attachment=True,
-                    download_name=f'finance_export_{datetime.now().strftime("%Y%m%d")}.xlsx')
+                    download_name=f'finance_export_{status["created_at"][:10].replace("-", "")}.xlsx')
+
+def _report_date(name):
+    """Дата из параметра запроса отчета (None, если не указана)"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m-%d').date()
 
 @finance_bp.route('/export/pdf')
 @login_required
 def export_pdf():
-    """Экспорт данных в PDF"""
-    transactions = Transaction.query.filter_by(user_id=current_user.id)\
-        .order_by(Transaction.date.desc()).limit(50).all()
-    
-    buffer = io.BytesIO()
-    p = canvas.Canvas(buffer, pagesize=letter)
-    width, height = letter
-    
-    # Заголовок
-    p.setFont("Helvetica-Bold", 16)
-    p.drawString(50, height - 50, "Отчет по финансам")
-    p.setFont("Helvetica", 10)
-    p.drawString(50, height - 70, f"Пользователь: {current_user.username}")
-    p.drawString(50, height - 85, f"Дата: {datetime.now().strftime('%Y-%m-%d %H:%M')}")
-    
-    # Таблица
-    y = height - 120
-    p.setFont("Helvetica-Bold", 10)
-    p.drawString(50, y, "Дата")
-    p.drawString(150, y, "Категория")
-    p.drawString(300, y, "Сумма")
-    p.drawString(400, y, "Описание")
-    
-    y -= 20
-    p.setFont("Helvetica", 9)
-    for t in transactions:
-        if y < 50:
-            p.showPage()
-            y = height - 50
-        
-        p.drawString(50, y, t.date.strftime('%Y-%m-%d'))
-        p.drawString(150, y, t.category.name[:20])
-        p.drawString(300, y, f"{t.amount:.2f}")
-        p.drawString(400, y, (t.description or '')[:30])
-        y -= 15
+    """Отчет по финансам в PDF за период (по умолчанию - вся история)"""
+    try:
+        date_from = _report_date('from')
+        date_to = _report_date('to')
+    except ValueError:
+        flash('Неверный формат даты', 'error')
+        return redirect(url_for('finance.index'))
+    if date_from and date_to and date_from > date_to:
+        flash('Начало периода позже его окончания', 'error')
+        return redirect(url_for('finance.index'))
     
-    p.save()
-    buffer.seek(0)
+    path = finance_report.build_report(current_user,
+                                       current_app.config['EXPORT_FOLDER'],
+                                       date_from, date_to,
+                                       current_app.config['EXPORT_CHUNK_SIZE'])
+    filename = f'finance_report_{datetime.now().strftime("%Y%m%d")}.pdf'
     
-    return send_file(buffer,
+    return Response(finance_export.stream_file(path),
                     mimetype='application/pdf',
-                    as_attachment=True,
-                    download_name=f'finance_report_{datetime.now().strftime("%Y%m%d")}.pdf')
-
+                    headers={
+                        'Content-Disposition': f'attachment; filename={filename}',
+                        'Content-Length': str(os.path.getsize(path))
+                    })
@@ -2,6 +2,7 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 from flask_login import login_required, current_user
 from models import db, Habit, HabitLog
 from datetime import datetime, date, timedelta
+from services import habit_streaks
 
 habits_bp = Blueprint('habits', __name__)
 
@@ -11,11 +12,6 @@ def index():
     """Главная страница трекера привычек"""
     habits = Habit.query.filter_by(user_id=current_user.id).all()
     
-    # Добавляем информацию о текущей серии для каждой привычки
-    for habit in habits:
-        habit.current_streak = habit.get_current_streak()
-        habit.total_logs = len(habit.logs)
-    
     return render_template('habits/index.html', habits=habits)
 
 @habits_bp.route('/add', methods=['GET', 'POST'])
@@ -102,11 +98,13 @@ def log_habit(habit_id):
     
     if existing_log:
         db.session.delete(existing_log)
+        habit_streaks.record_removed(habit, log_date)
         db.session.commit()
         return jsonify({'status': 'removed', 'streak': habit.get_current_streak()})
     else:
         log = HabitLog(habit_id=habit_id, date=log_date)
         db.session.add(log)
+        habit_streaks.record_added(habit, log_date)
         db.session.commit()
         return jsonify({'status': 'added', 'streak': habit.get_current_streak()})
 
@@ -130,11 +128,11 @@ def view_habit(id):
     
     # Статистика
     current_streak = habit.get_current_streak()
-    total_days = len(habit.logs)
+    total_days = habit.total_logs
     completion_rate = (total_days / 30) * 100 if total_days > 0 else 0
     
     # Данные для календаря
-    log_dates = {log.date.isoformat() for log in logs}
+    log_dates = sorted({log.date.isoformat() for log in logs})
     
     return render_template('habits/view_habit.html',
                          habit=habit,
@@ -155,7 +153,7 @@ def statistics():
         stats.append({
             'name': habit.name,
             'current_streak': habit.get_current_streak(),
-            'total_logs': len(habit.logs),
+            'total_logs': habit.total_logs,
             'color': habit.color
         })
     
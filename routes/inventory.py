@@ -1,13 +1,13 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app, \
+    Response
 from flask_login import login_required, current_user
 from models import db, InventoryItem
+from services import search_index, images, inventory_items, inventory_import, warranty_notifications
 from datetime import datetime, date, timedelta
-from werkzeug.utils import secure_filename
-import os
 
 inventory_bp = Blueprint('inventory', __name__)
 
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -18,46 +18,35 @@ def index():
     """Главная страница учета имущества"""
     category = request.args.get('category', '')
     room = request.args.get('room', '')
+    cursor = request.args.get('cursor', '')
     
-    items_query = InventoryItem.query.filter_by(user_id=current_user.id)
+    items, next_cursor = inventory_items.page(current_user.id, category, room, cursor,
+                                              current_app.config['INVENTORY_PER_PAGE'])
     
-    if category:
-        items_query = items_query.filter_by(category=category)
-    if room:
-        items_query = items_query.filter_by(room=room)
+    # Статистика по всем страницам считается в базе
+    total_items, total_value = inventory_items.totals(current_user.id, category, room)
     
-    items = items_query.order_by(InventoryItem.created_at.desc()).all()
+    # Уникальные категории и комнаты для фильтров
+    categories = inventory_items.distinct_values(current_user.id, InventoryItem.category)
+    rooms = inventory_items.distinct_values(current_user.id, InventoryItem.room)
     
-    # Статистика
-    total_value = sum(item.purchase_price or 0 for item in items)
-    total_items = len(items)
-    
-    # Получаем уникальные категории и комнаты
-    categories = db.session.query(InventoryItem.category)\
-        .filter_by(user_id=current_user.id)\
-        .distinct().all()
-    categories = [c[0] for c in categories if c[0]]
-    
-    rooms = db.session.query(InventoryItem.room)\
-        .filter_by(user_id=current_user.id)\
-        .distinct().all()
-    rooms = [r[0] for r in rooms if r[0]]
-    
-    # Предупреждения о гарантии
-    today = date.today()
-    warranty_warnings = [item for item in items 
-                        if item.warranty_expiry 
-                        and item.warranty_expiry <= today + timedelta(days=30)]
+    # Уведомления о гарантии готовит планировщик
+    notifications = warranty_notifications.unread(current_user.id)
+    notifications_count = warranty_notifications.unread_count(current_user.id) if notifications else 0
     
     return render_template('inventory/index.html',
                          items=items,
+                         next_cursor=next_cursor,
+                         cursor=cursor,
                          total_value=total_value,
                          total_items=total_items,
                          categories=categories,
                          rooms=rooms,
                          selected_category=category,
                          selected_room=room,
-                         warranty_warnings=warranty_warnings)
+                         notifications=notifications,
+                         notifications_count=notifications_count,
+                         today=date.today())
 
 @inventory_bp.route('/add', methods=['GET', 'POST'])
 @login_required
@@ -82,14 +71,11 @@ def add_item():
         if 'image' in request.files:
             file = request.files['image']
             if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                filename = f"{timestamp}_{filename}"
-                upload_folder = os.path.join('uploads', 'inventory')
-                os.makedirs(upload_folder, exist_ok=True)
-                filepath = os.path.join(upload_folder, filename)
-                file.save(filepath)
-                image_path = filepath
+                # Варианты размеров создаются в фоне
+                image_path = images.save_upload(file)
+                if image_path is None:
+                    flash('Файл не является изображением', 'error')
+                    return render_template('inventory/add_item.html')
         
         item = InventoryItem(
             user_id=current_user.id,
@@ -105,12 +91,43 @@ def add_item():
         )
         db.session.add(item)
         db.session.commit()
+        warranty_notifications.check_item(item)
         
         flash('Предмет добавлен', 'success')
         return redirect(url_for('inventory.index'))
     
     return render_template('inventory/add_item.html')
 
+@inventory_bp.route('/import', methods=['GET', 'POST'])
+@login_required
+def import_items():
+    """Массовый импорт предметов из CSV или XLSX"""
+    if request.method == 'POST':
+        file = request.files.get('file')
+        if not file or not file.filename:
+            flash('Выберите файл для импорта', 'error')
+            return render_template('inventory/import.html')
+        
+        try:
+            result = inventory_import.import_items(current_user.id, file.stream, file.filename,
+                                                   current_app.config['IMPORT_BATCH_SIZE'],
+                                                   current_app.config['IMPORT_MAX_ERRORS'])
+        except inventory_import.ImportFileError as e:
+            flash(str(e), 'error')
+            return render_template('inventory/import.html')
+        
+        flash(f'Добавлено предметов: {result.created}', 'success')
+        return render_template('inventory/import.html', result=result)
+    
+    return render_template('inventory/import.html')
+
+@inventory_bp.route('/import/template.csv')
+@login_required
+def import_template():
+    """Пример CSV-файла для импорта"""
+    return Response(inventory_import.template_csv(), mimetype='text/csv',
+                    headers={'Content-Disposition': 'attachment; filename=inventory_import.csv'})
+
 @inventory_bp.route('/view/<int:id>')
 @login_required
 def view_item(id):
@@ -146,23 +163,22 @@ def edit_item(id):
         item.serial_number = request.form.get('serial_number')
         
         # Обработка нового изображения
+        old_image_path = None
         if 'image' in request.files:
             file = request.files['image']
             if file and allowed_file(file.filename):
-                # Удаляем старое изображение
-                if item.image_path and os.path.exists(item.image_path):
-                    os.remove(item.image_path)
-                
-                filename = secure_filename(file.filename)
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                filename = f"{timestamp}_{filename}"
-                upload_folder = os.path.join('uploads', 'inventory')
-                os.makedirs(upload_folder, exist_ok=True)
-                filepath = os.path.join(upload_folder, filename)
-                file.save(filepath)
-                item.image_path = filepath
+                image_path = images.save_upload(file)
+                if image_path is None:
+                    db.session.rollback()
+                    flash('Файл не является изображением', 'error')
+                    return render_template('inventory/edit_item.html', item=item)
+                old_image_path, item.image_path = item.image_path, image_path
         
         db.session.commit()
+        warranty_notifications.check_item(item)
+        # Старое изображение удаляется, если на него больше никто не ссылается
+        if old_image_path != item.image_path:
+            images.release(old_image_path)
         flash('Предмет обновлен', 'success')
         return redirect(url_for('inventory.view_item', id=item.id))
     
@@ -178,12 +194,11 @@ def delete_item(id):
         flash('Доступ запрещен', 'error')
         return redirect(url_for('inventory.index'))
     
-    # Удаляем изображение
-    if item.image_path and os.path.exists(item.image_path):
-        os.remove(item.image_path)
-    
+    image_path = item.image_path
     db.session.delete(item)
     db.session.commit()
+    # Изображение удаляется, если на него больше никто не ссылается
+    images.release(image_path)
     flash('Предмет удален', 'success')
     return redirect(url_for('inventory.index'))
 
@@ -196,14 +211,43 @@ def search():
     if not query:
         return redirect(url_for('inventory.index'))
     
-    items = InventoryItem.query.filter_by(user_id=current_user.id)\
-        .filter(
-            InventoryItem.name.contains(query) |
-            InventoryItem.description.contains(query) |
-            InventoryItem.serial_number.contains(query)
-        ).all()
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = current_app.config['INVENTORY_PER_PAGE']
+    serial_items = []
+    
+    if search_index.available():
+        # Общий поисковый индекс: страница id в порядке релевантности
+        ids, total = search_index.search_ids(current_user.id, query, 'inventory',
+                                             per_page, (page - 1) * per_page)
+        items_by_id = {item.id: item for item in InventoryItem.query.filter(
+            InventoryItem.user_id == current_user.id, InventoryItem.id.in_(ids))}
+        items = [items_by_id[item_id] for item_id in ids if item_id in items_by_id]
+        
+        # Индекс находит слова по началу, а серийный номер ищется и по подстроке
+        if page == 1:
+            serial_items = InventoryItem.query.filter(
+                InventoryItem.user_id == current_user.id,
+                InventoryItem.serial_number.contains(query),
+                InventoryItem.id.notin_(ids)
+            ).order_by(InventoryItem.id.desc()).limit(per_page).all()
+    else:
+        items_query = InventoryItem.query.filter_by(user_id=current_user.id)\
+            .filter(
+                InventoryItem.name.contains(query) |
+                InventoryItem.description.contains(query) |
+                InventoryItem.serial_number.contains(query)
+            )
+        total = items_query.count()
+        items = items_query.order_by(InventoryItem.id.desc())\
+            .offset((page - 1) * per_page).limit(per_page).all()
     
-    return render_template('inventory/search.html', items=items, query=query)
+    return render_template('inventory/search.html',
+                         items=items,
+                         serial_items=serial_items,
+                         query=query,
+                         total=total,
+                         page=page,
+                         pages=(total + per_page - 1) // per_page)
 
 @inventory_bp.route('/warranty')
 @login_required
@@ -225,35 +269,25 @@ def warranty():
     
     return render_template('inventory/warranty.html', items_with_days=items_with_days, days_ahead=days_ahead, today=today)
 
+@inventory_bp.route('/notifications/read', methods=['POST'])
+@login_required
+def read_notifications():
+    """Скрыть уведомления о гарантии"""
+    warranty_notifications.mark_read(current_user.id)
+    return redirect(url_for('inventory.index'))
+
 @inventory_bp.route('/statistics')
 @login_required
 def statistics():
     """Статистика по имуществу"""
-    items = InventoryItem.query.filter_by(user_id=current_user.id).all()
-    
-    # Статистика по категориям
-    category_stats = {}
-    for item in items:
-        category = item.category or 'Без категории'
-        if category not in category_stats:
-            category_stats[category] = {'count': 0, 'value': 0}
-        category_stats[category]['count'] += 1
-        category_stats[category]['value'] += item.purchase_price or 0
-    
-    # Статистика по комнатам
-    room_stats = {}
-    for item in items:
-        room = item.room or 'Не указано'
-        if room not in room_stats:
-            room_stats[room] = {'count': 0, 'value': 0}
-        room_stats[room]['count'] += 1
-        room_stats[room]['value'] += item.purchase_price or 0
-    
-    total_value = sum(item.purchase_price or 0 for item in items)
+    category_stats = inventory_items.grouped(current_user.id, InventoryItem.category,
+                                             inventory_items.NO_CATEGORY)
+    room_stats = inventory_items.grouped(current_user.id, InventoryItem.room,
+                                         inventory_items.NO_ROOM)
+    total_items, total_value = inventory_items.totals(current_user.id)
     
     return render_template('inventory/statistics.html',
                          category_stats=category_stats,
                          room_stats=room_stats,
                          total_value=total_value,
-                         total_items=len(items))
-
+                         total_items=total_items)
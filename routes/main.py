@@ -1,5 +1,6 @@
-from flask import Blueprint, render_template
+from flask import Blueprint, render_template, request, current_app, abort, send_file
 from flask_login import login_required, current_user
+from services import search_index, images, file_serving, charts
 
 main_bp = Blueprint('main', __name__)
 
@@ -14,3 +15,50 @@ def dashboard():
     """Панель управления"""
     return render_template('dashboard.html')
 
+@main_bp.route('/search')
+@login_required
+def search():
+    """Поиск по всем модулям"""
+    query = request.args.get('q', '').strip()
+    module = request.args.get('module', '')
+    
+    if module in search_index.SOURCES_BY_MODULE:
+        groups = search_index.search(current_user.id, query, modules=[module],
+                                     per_module=current_app.config['SEARCH_RESULTS_MODULE_LIMIT'])
+    else:
+        module = ''
+        groups = search_index.search(current_user.id, query,
+                                     per_module=current_app.config['SEARCH_RESULTS_PER_MODULE'])
+    
+    return render_template('search.html', groups=groups, query=query, module=module,
+                         modules=search_index.SOURCES)
+
+@main_bp.route('/uploads/<path:filename>')
+@login_required
+def uploaded_file(filename):
+    """Загруженные файлы и варианты изображений (только свои)"""
+    if not images.owned_by(current_user.id, filename):
+        abort(404)
+    root = images.upload_root()
+    if images.is_key(filename):
+        # Вариант мог еще не успеть обработаться в пуле
+        key, variant = filename.rsplit('/', 1)
+        if not images.ensure_variants(root, key):
+            abort(404)
+        # Содержимое по этому адресу не меняется: ETag - хэш исходника и имя варианта
+        return file_serving.send_upload(root, filename, etag=f"{key.rsplit('/', 1)[1]}-{variant}",
+                                        immutable=True)
+    return file_serving.send_upload(root, filename)
+
+@main_bp.route('/charts/<name>.<fmt>')
+@login_required
+def chart(name, fmt):
+    """График статистики в PNG или SVG (?period=week|month|year для финансов)"""
+    if name not in charts.CHARTS or fmt not in charts.FORMATS:
+        abort(404)
+    path, version = charts.render(current_user.id, name, request.args.get('period', ''), fmt)
+    response = send_file(path, mimetype=charts.FORMATS[fmt], conditional=True, etag=version)
+    # Картинка меняется вместе с данными - браузер каждый раз сверяет ETag
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
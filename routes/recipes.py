@@ -1,14 +1,14 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app
 from flask_login import login_required, current_user
-from models import db, Recipe, MealPlan
+from models import db, Recipe, MealPlan, MealPlanTemplate
+from services import recipe_search, recipe_ingredients, meal_plans, images
 from datetime import datetime, date, timedelta
-from werkzeug.utils import secure_filename
-import os
+from werkzeug.http import is_resource_modified
 import json
 
 recipes_bp = Blueprint('recipes', __name__)
 
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -44,14 +44,11 @@ def add_recipe():
         if 'image' in request.files:
             file = request.files['image']
             if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                filename = f"{timestamp}_{filename}"
-                upload_folder = os.path.join('uploads', 'recipes')
-                os.makedirs(upload_folder, exist_ok=True)
-                filepath = os.path.join(upload_folder, filename)
-                file.save(filepath)
-                image_path = filepath
+                # Варианты размеров создаются в фоне
+                image_path = images.save_upload(file)
+                if image_path is None:
+                    flash('Файл не является изображением', 'error')
+                    return render_template('recipes/add_recipe.html')
         
         recipe = Recipe(
             user_id=current_user.id,
@@ -66,6 +63,7 @@ def add_recipe():
             calories=float(calories) if calories else None,
             image_path=image_path
         )
+        recipe_ingredients.sync(recipe)
         db.session.add(recipe)
         db.session.commit()
         
@@ -100,6 +98,7 @@ def edit_recipe(id):
         recipe.title = request.form.get('title')
         recipe.description = request.form.get('description')
         recipe.ingredients = request.form.get('ingredients')
+        recipe_ingredients.sync(recipe)
         recipe.instructions = request.form.get('instructions')
         recipe.prep_time = int(request.form.get('prep_time')) if request.form.get('prep_time') else None
         recipe.cook_time = int(request.form.get('cook_time')) if request.form.get('cook_time') else None
@@ -108,23 +107,21 @@ def edit_recipe(id):
         recipe.calories = float(request.form.get('calories')) if request.form.get('calories') else None
         
         # Обработка нового изображения
+        old_image_path = None
         if 'image' in request.files:
             file = request.files['image']
             if file and allowed_file(file.filename):
-                # Удаляем старое изображение
-                if recipe.image_path and os.path.exists(recipe.image_path):
-                    os.remove(recipe.image_path)
-                
-                filename = secure_filename(file.filename)
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                filename = f"{timestamp}_{filename}"
-                upload_folder = os.path.join('uploads', 'recipes')
-                os.makedirs(upload_folder, exist_ok=True)
-                filepath = os.path.join(upload_folder, filename)
-                file.save(filepath)
-                recipe.image_path = filepath
+                image_path = images.save_upload(file)
+                if image_path is None:
+                    db.session.rollback()
+                    flash('Файл не является изображением', 'error')
+                    return render_template('recipes/edit_recipe.html', recipe=recipe)
+                old_image_path, recipe.image_path = recipe.image_path, image_path
         
         db.session.commit()
+        # Старое изображение удаляется, если на него больше никто не ссылается
+        if old_image_path != recipe.image_path:
+            images.release(old_image_path)
         flash('Рецепт обновлен', 'success')
         return redirect(url_for('recipes.view_recipe', id=recipe.id))
     
@@ -140,12 +137,11 @@ def delete_recipe(id):
         flash('Доступ запрещен', 'error')
         return redirect(url_for('recipes.index'))
     
-    # Удаляем изображение
-    if recipe.image_path and os.path.exists(recipe.image_path):
-        os.remove(recipe.image_path)
-    
+    image_path = recipe.image_path
     db.session.delete(recipe)
     db.session.commit()
+    # Изображение удаляется, если на него больше никто не ссылается
+    images.release(image_path)
     flash('Рецепт удален', 'success')
     return redirect(url_for('recipes.index'))
 
@@ -153,25 +149,26 @@ def delete_recipe(id):
 @login_required
 def meal_planner():
     """Планировщик питания"""
-    # Получаем план на текущую неделю
-    today = date.today()
-    week_start = today - timedelta(days=today.weekday())
+    # Неделя из параметра start (любой ее день) или текущая
+    try:
+        start = datetime.strptime(request.args.get('start', ''), '%Y-%m-%d').date()
+    except ValueError:
+        start = date.today()
+    week_start = meal_plans.week_start(start)
     week_end = week_start + timedelta(days=6)
     
-    meal_plans = MealPlan.query.filter_by(user_id=current_user.id)\
-        .filter(MealPlan.date >= week_start, MealPlan.date <= week_end)\
-        .order_by(MealPlan.date, MealPlan.meal_type).all()
+    plans = meal_plans.plans_in_range(current_user.id, week_start, week_end)
     
     # Группируем по датам
     plans_by_date = {}
-    for plan in meal_plans:
+    for plan in plans:
         date_str = plan.date.isoformat()
         if date_str not in plans_by_date:
             plans_by_date[date_str] = {}
         plans_by_date[date_str][plan.meal_type] = plan
     
-    # Получаем все рецепты для выбора
-    recipes = Recipe.query.filter_by(user_id=current_user.id).all()
+    # Рецепты для выбора - без текстов ингредиентов и инструкций
+    recipes = meal_plans.recipe_choices(current_user.id)
     
     # Создаем список дат для недели
     week_dates = []
@@ -183,7 +180,46 @@ def meal_planner():
                          recipes=recipes,
                          week_start=week_start,
                          week_end=week_end,
-                         week_dates=week_dates)
+                         week_dates=week_dates,
+                         prev_week=week_start - timedelta(days=7),
+                         next_week=week_start + timedelta(days=7),
+                         meal_types=meal_plans.MEAL_TYPES,
+                         templates=meal_plans.templates(current_user.id))
+
+@recipes_bp.route('/meal_planner/range')
+@login_required
+def meal_plan_range():
+    """План питания за период start..end включительно (JSON)
+    
+    Ответ содержит ETag и Last-Modified; неизмененный период отдается как 304.
+    """
+    try:
+        date_from = datetime.strptime(request.args.get('start', ''), '%Y-%m-%d').date()
+        date_to = datetime.strptime(request.args.get('end', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({'error': 'Укажите start и end в формате ГГГГ-ММ-ДД'}), 400
+    
+    max_days = current_app.config['MEAL_PLAN_RANGE_MAX_DAYS']
+    if date_to < date_from or (date_to - date_from).days >= max_days:
+        return jsonify({'error': f'Период должен быть от 1 до {max_days} дней'}), 400
+    
+    etag, last_modified = meal_plans.fingerprint(current_user.id, date_from, date_to)
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = current_app.response_class(status=304)
+    else:
+        plans = meal_plans.plans_in_range(current_user.id, date_from, date_to)
+        response = jsonify({
+            'start': date_from.isoformat(),
+            'end': date_to.isoformat(),
+            'plans': [meal_plans.plan_to_dict(plan) for plan in plans]
+        })
+    
+    # Браузер хранит ответ, но перед использованием всегда сверяет ETag
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
 
 @recipes_bp.route('/meal_planner/add', methods=['POST'])
 @login_required
@@ -199,27 +235,11 @@ def add_meal_plan():
     
     meal_date = datetime.strptime(meal_date, '%Y-%m-%d').date()
     
-    # Проверяем, не существует ли уже план на это время
-    existing = MealPlan.query.filter_by(
-        user_id=current_user.id,
-        date=meal_date,
-        meal_type=meal_type
-    ).first()
-    
-    if existing:
-        existing.recipe_id = recipe_id
-    else:
-        meal_plan = MealPlan(
-            user_id=current_user.id,
-            recipe_id=recipe_id,
-            date=meal_date,
-            meal_type=meal_type
-        )
-        db.session.add(meal_plan)
-    
+    # Занятый слот получает новое блюдо (UPSERT по user_id, date, meal_type)
+    meal_plans.set_meal(current_user.id, int(recipe_id), meal_date, meal_type)
     db.session.commit()
     flash('Блюдо добавлено в план', 'success')
-    return redirect(url_for('recipes.meal_planner'))
+    return redirect(url_for('recipes.meal_planner', start=meal_plans.week_start(meal_date).isoformat()))
 
 @recipes_bp.route('/meal_planner/delete/<int:id>')
 @login_required
@@ -231,9 +251,107 @@ def delete_meal_plan(id):
         flash('Доступ запрещен', 'error')
         return redirect(url_for('recipes.meal_planner'))
     
+    week = meal_plans.week_start(meal_plan.date).isoformat()
     db.session.delete(meal_plan)
     db.session.commit()
     flash('Блюдо удалено из плана', 'success')
+    return redirect(url_for('recipes.meal_planner', start=week))
+
+def _form_date(name):
+    """Дата из поля формы ГГГГ-ММ-ДД или None"""
+    try:
+        return datetime.strptime(request.form.get(name, ''), '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+@recipes_bp.route('/meal_planner/copy', methods=['POST'])
+@login_required
+def copy_meal_plan():
+    """Копирование недели плана на одну или несколько следующих недель"""
+    source = _form_date('source')
+    target = _form_date('target')
+    weeks = request.form.get('weeks', 1, type=int)
+    max_weeks = current_app.config['MEAL_PLAN_COPY_MAX_WEEKS']
+    
+    if not source or not target or not 1 <= weeks <= max_weeks:
+        flash(f'Укажите неделю и количество недель от 1 до {max_weeks}', 'error')
+        return redirect(url_for('recipes.meal_planner'))
+    
+    source = meal_plans.week_start(source)
+    target = meal_plans.week_start(target)
+    count = meal_plans.copy_range(current_user.id, source, source + timedelta(days=6),
+                                  target, repeat=weeks)
+    db.session.commit()
+    flash(f'Скопировано блюд: {count}', 'success')
+    return redirect(url_for('recipes.meal_planner', start=target.isoformat()))
+
+@recipes_bp.route('/meal_planner/clear', methods=['POST'])
+@login_required
+def clear_meal_plan():
+    """Очистка плана за период (по умолчанию - за неделю с даты start)"""
+    start = _form_date('start')
+    end = _form_date('end') or (start and start + timedelta(days=6))
+    
+    if not start or end < start:
+        flash('Укажите период', 'error')
+        return redirect(url_for('recipes.meal_planner'))
+    
+    count = meal_plans.clear_range(current_user.id, start, end)
+    db.session.commit()
+    flash(f'Удалено блюд: {count}', 'success')
+    return redirect(url_for('recipes.meal_planner', start=start.isoformat()))
+
+@recipes_bp.route('/meal_planner/templates', methods=['POST'])
+@login_required
+def save_meal_plan_template():
+    """Сохранение недели плана как шаблона"""
+    name = request.form.get('name', '').strip()
+    start = _form_date('start')
+    
+    if not name or not start:
+        flash('Укажите название шаблона', 'error')
+        return redirect(url_for('recipes.meal_planner'))
+    
+    start = meal_plans.week_start(start)
+    meal_plans.save_template(current_user.id, name[:100], start)
+    db.session.commit()
+    flash('Шаблон сохранен', 'success')
+    return redirect(url_for('recipes.meal_planner', start=start.isoformat()))
+
+@recipes_bp.route('/meal_planner/templates/<int:id>/apply', methods=['POST'])
+@login_required
+def apply_meal_plan_template(id):
+    """Применение шаблона к неделе"""
+    template = MealPlanTemplate.query.get_or_404(id)
+    
+    if template.user_id != current_user.id:
+        flash('Доступ запрещен', 'error')
+        return redirect(url_for('recipes.meal_planner'))
+    
+    start = _form_date('start')
+    if not start:
+        flash('Укажите неделю', 'error')
+        return redirect(url_for('recipes.meal_planner'))
+    
+    start = meal_plans.week_start(start)
+    count = meal_plans.apply_template(template, start)
+    db.session.commit()
+    flash(f'Шаблон "{template.name}" применен, блюд: {count}', 'success')
+    return redirect(url_for('recipes.meal_planner', start=start.isoformat()))
+
+@recipes_bp.route('/meal_planner/templates/<int:id>/delete', methods=['POST'])
+@login_required
+def delete_meal_plan_template(id):
+    """Удаление шаблона плана"""
+    template = MealPlanTemplate.query.get_or_404(id)
+    
+    if template.user_id != current_user.id:
+        flash('Доступ запрещен', 'error')
+        return redirect(url_for('recipes.meal_planner'))
+    
+    db.session.delete(template)
+    db.session.commit()
+    flash('Шаблон удален', 'success')
     return redirect(url_for('recipes.meal_planner'))
 
 @recipes_bp.route('/shopping_list')
@@ -244,21 +362,14 @@ def shopping_list():
     week_start = today - timedelta(days=today.weekday())
     week_end = week_start + timedelta(days=6)
     
-    meal_plans = MealPlan.query.filter_by(user_id=current_user.id)\
-        .filter(MealPlan.date >= week_start, MealPlan.date <= week_end)\
-        .join(Recipe).all()
-    
-    # Собираем все ингредиенты
-    all_ingredients = []
-    for plan in meal_plans:
-        ingredients = plan.recipe.ingredients.split('\n')
-        all_ingredients.extend([ing.strip() for ing in ingredients if ing.strip()])
-    
-    # Удаляем дубликаты и сортируем
-    unique_ingredients = sorted(set(all_ingredients))
+    # Суммы по разобранным ингредиентам одним GROUP BY
+    ingredients = [{
+        'name': row.name,
+        'quantity': recipe_ingredients.format_quantity(row.quantity, row.unit)
+    } for row in recipe_ingredients.shopping_list(current_user.id, week_start, week_end)]
     
     return render_template('recipes/shopping_list.html',
-                         ingredients=unique_ingredients,
+                         ingredients=ingredients,
                          week_start=week_start,
                          week_end=week_end)
 
@@ -268,20 +379,17 @@ def search():
     """Поиск рецептов"""
     query = request.args.get('q', '')
     category = request.args.get('category', '')
+    page = request.args.get('page', 1, type=int)
     
-    recipes_query = Recipe.query.filter_by(user_id=current_user.id)
-    
-    if query:
-        recipes_query = recipes_query.filter(
-            Recipe.title.contains(query) |
-            Recipe.description.contains(query) |
-            Recipe.ingredients.contains(query)
-        )
+    # Полнотекстовый индекс с ранжированием по релевантности
+    recipes_query = recipe_search.search_query(current_user.id, query)
     
     if category:
-        recipes_query = recipes_query.filter_by(category=category)
+        recipes_query = recipes_query.filter(Recipe.category == category)
     
-    recipes = recipes_query.all()
+    pagination = recipes_query.paginate(page=page, per_page=current_app.config['RECIPE_SEARCH_PER_PAGE'],
+                                        error_out=False)
     
-    return render_template('recipes/search.html', recipes=recipes, query=query, category=category)
+    return render_template('recipes/search.html', recipes=pagination.items, pagination=pagination,
+                         query=query, category=category)
 
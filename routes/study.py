@@ -1,8 +1,9 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app
 from flask_login import login_required, current_user
 from models import db, StudyCard, StudySession
-from datetime import datetime, timedelta
-import random
+from datetime import datetime
+from sqlalchemy import func
+from services import review_queue
 
 study_bp = Blueprint('study', __name__)
 
@@ -10,11 +11,9 @@ study_bp = Blueprint('study', __name__)
 @login_required
 def index():
     """Главная страница модуля обучения"""
-    cards = StudyCard.query.filter_by(user_id=current_user.id).all()
-    
     # Статистика
-    total_cards = len(cards)
-    cards_due = len([c for c in cards if c.next_review and c.next_review <= datetime.now()])
+    total_cards = review_queue.count_cards(current_user.id)
+    cards_due = review_queue.count_due(current_user.id)
     recent_sessions = StudySession.query.filter_by(user_id=current_user.id)\
         .order_by(StudySession.date.desc()).limit(5).all()
     
@@ -112,24 +111,39 @@ def review():
     """Интервальное повторение карточек"""
     topic = request.args.get('topic', '')
     
-    # Получаем карточки, которые нужно повторить
-    now = datetime.now()
-    cards_query = StudyCard.query.filter_by(user_id=current_user.id)\
-        .filter((StudyCard.next_review <= now) | (StudyCard.next_review.is_(None)))
-    
-    if topic:
-        cards_query = cards_query.filter_by(topic=topic)
-    
-    cards = cards_query.all()
+    # Берем порцию самых просроченных карточек, первую показываем, остальные
+    # отдаем клиенту, чтобы следующие карточки открывались без перезагрузки
+    batch = review_queue.next_batch(current_user.id, topic,
+                                    limit=current_app.config['REVIEW_BATCH_SIZE'],
+                                    randomize=True)
     
-    if not cards:
+    if not batch:
         flash('Нет карточек для повторения', 'info')
         return redirect(url_for('study.index'))
     
-    # Выбираем случайную карточку
-    card = random.choice(cards)
+    card = batch[0]
+    queue = [review_queue.card_to_dict(c) for c in batch[1:]]
+    total_due = review_queue.count_due(current_user.id, topic)
+    
+    return render_template('study/review.html', card=card, queue=queue,
+                         total_due=total_due, topic=topic)
+
+@study_bp.route('/review/next')
+@login_required
+def review_next():
+    """Следующие карточки очереди повторения (JSON)"""
+    topic = request.args.get('topic', '')
+    exclude_ids = [int(i) for i in request.args.get('exclude', '').split(',') if i.isdigit()]
+    # Снизу тоже ограничиваем: LIMIT -1 в SQLite означает "без ограничения"
+    limit = max(1, min(request.args.get('limit', current_app.config['REVIEW_PREFETCH'], type=int),
+                       current_app.config['REVIEW_BATCH_SIZE']))
     
-    return render_template('study/review.html', card=card, total_due=len(cards))
+    cards = review_queue.next_batch(current_user.id, topic, limit=limit,
+                                    exclude_ids=exclude_ids, randomize=True)
+    return jsonify({
+        'cards': [review_queue.card_to_dict(c) for c in cards],
+        'total_due': review_queue.count_due(current_user.id, topic)
+    })
 
 @study_bp.route('/review/<int:card_id>/answer', methods=['POST'])
 @login_required
@@ -143,25 +157,7 @@ def answer_card(card_id):
     quality = int(request.json.get('quality', 3))  # 0-5
     
     # Алгоритм интервальных повторений (упрощенная версия SM-2)
-    if card.difficulty == 0:
-        card.difficulty = 2.5
-    else:
-        card.difficulty = max(0, card.difficulty + (0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02)))
-    
-    # Вычисляем интервал
-    if quality < 3:
-        interval = 1  # Повторить завтра
-    else:
-        if card.review_count == 0:
-            interval = 1
-        elif card.review_count == 1:
-            interval = 6
-        else:
-            interval = int(card.difficulty * card.review_count)
-    
-    card.last_reviewed = datetime.now()
-    card.next_review = datetime.now() + timedelta(days=interval)
-    card.review_count += 1
+    card.apply_answer(quality)
     
     db.session.commit()
     
@@ -171,6 +167,79 @@ def answer_card(card_id):
         'difficulty': card.difficulty
     })
 
+def _parse_answer(entry, now):
+    """Проверяет один ответ пакета: (card_id, quality, answered_at)"""
+    card_id = int(entry['card_id'])
+    quality = int(entry.get('quality', 3))
+    if not 0 <= quality <= 5:
+        raise ValueError('quality должен быть от 0 до 5')
+    
+    answered_at = now
+    if entry.get('answered_at'):
+        answered_at = datetime.fromisoformat(entry['answered_at'])
+        if answered_at.tzinfo is not None:
+            answered_at = answered_at.astimezone().replace(tzinfo=None)
+        # Время из будущего (сбитые часы устройства) не должно сдвигать расписание
+        answered_at = min(answered_at, now)
+    return card_id, quality, answered_at
+
+@study_bp.route('/review/answers', methods=['POST'])
+@login_required
+def answer_cards():
+    """Пакетная обработка ответов (синхронизация офлайн-сессии)
+    
+    Ожидает {"answers": [{"card_id", "quality", "answered_at"}, ...]}.
+    Все ответы применяются в одной транзакции; если хотя бы одна карточка
+    не найдена или чужая, пакет отклоняется целиком.
+    """
+    data = request.get_json(silent=True) or {}
+    entries = data.get('answers')
+    if not isinstance(entries, list) or not entries:
+        return jsonify({'error': 'Нет ответов'}), 400
+    if len(entries) > current_app.config['REVIEW_SYNC_MAX_ANSWERS']:
+        return jsonify({'error': 'Слишком много ответов в одном пакете'}), 400
+    
+    now = datetime.now()
+    try:
+        answers = [_parse_answer(entry, now) for entry in entries]
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': f'Некорректный ответ: {e}'}), 400
+    
+    # Одна проверка владельца на весь пакет
+    card_ids = {card_id for card_id, _, _ in answers}
+    cards = {card.id: card for card in StudyCard.query.filter(
+        StudyCard.user_id == current_user.id, StudyCard.id.in_(card_ids))}
+    missing = sorted(card_ids - cards.keys())
+    if missing:
+        return jsonify({'error': 'Доступ запрещен', 'card_ids': missing}), 403
+    
+    # Повторные ответы на одну карточку применяются в порядке времени ответа
+    answers.sort(key=lambda answer: answer[2])
+    for card_id, quality, answered_at in answers:
+        cards[card_id].apply_answer(quality, answered_at)
+    
+    started, finished = answers[0][2], answers[-1][2]
+    session = StudySession(
+        user_id=current_user.id,
+        session_type='review',
+        duration=max(1, round((finished - started).total_seconds() / 60)),
+        cards_reviewed=len(answers),
+        date=finished
+    )
+    db.session.add(session)
+    db.session.commit()
+    
+    return jsonify({
+        'success': True,
+        'session_id': session.id,
+        'cards': [{
+            'card_id': card.id,
+            'next_review': card.next_review.isoformat(),
+            'difficulty': card.difficulty,
+            'review_count': card.review_count
+        } for card in cards.values()]
+    })
+
 @study_bp.route('/pomodoro')
 @login_required
 def pomodoro():
@@ -198,27 +267,20 @@ def save_pomodoro_session():
 @login_required
 def statistics():
     """Статистика обучения"""
-    cards = StudyCard.query.filter_by(user_id=current_user.id).all()
-    sessions = StudySession.query.filter_by(user_id=current_user.id).all()
-    
     # Статистика по карточкам
-    total_cards = len(cards)
-    cards_reviewed = len([c for c in cards if c.review_count > 0])
-    cards_due = len([c for c in cards if c.next_review and c.next_review <= datetime.now()])
+    total_cards = review_queue.count_cards(current_user.id)
+    cards_reviewed = db.session.query(func.count(StudyCard.id))\
+        .filter(StudyCard.user_id == current_user.id, StudyCard.review_count > 0).scalar()
+    cards_due = review_queue.count_due(current_user.id)
     
     # Статистика по сессиям
-    total_study_time = sum(s.duration for s in sessions)
-    pomodoro_sessions = len([s for s in sessions if s.session_type == 'pomodoro'])
+    total_study_time, pomodoro_sessions = db.session.query(
+        func.coalesce(func.sum(StudySession.duration), 0),
+        func.count(StudySession.id).filter(StudySession.session_type == 'pomodoro')
+    ).filter(StudySession.user_id == current_user.id).one()
     
     # Статистика по темам
-    topics = {}
-    for card in cards:
-        topic = card.topic or 'Без темы'
-        if topic not in topics:
-            topics[topic] = {'total': 0, 'reviewed': 0}
-        topics[topic]['total'] += 1
-        if card.review_count > 0:
-            topics[topic]['reviewed'] += 1
+    topics = review_queue.topic_stats(current_user.id)
     
     return render_template('study/statistics.html',
                          total_cards=total_cards,
@@ -0,0 +1,68 @@
+"""Отрисовка графика matplotlib (Agg) в файл - выполняется в процессе пула
+
+Модуль не импортирует приложение и модели: процесс пула запускается через
+spawn и загружает только matplotlib. Используется Figure без pyplot, поэтому
+глобального состояния между графиками нет.
+"""
+import os
+
+DEFAULT_COLORS = ['#0d6efd', '#dc3545', '#198754', '#ffc107', '#6f42c1', '#fd7e14',
+                  '#20c997', '#d63384', '#0dcaf0', '#6c757d', '#6610f2', '#adb5bd']
+MAX_BARS = 20  # остальные столбцы объединяются в "Прочее"
+
+
+def _top(labels, values, colors):
+    """Не больше MAX_BARS значений: самые большие плюс сумма остальных"""
+    rows = sorted(zip(values, labels, colors), reverse=True)
+    if len(rows) > MAX_BARS:
+        rest = sum(value for value, _, _ in rows[MAX_BARS - 1:])
+        rows = rows[:MAX_BARS - 1] + [(rest, 'Прочее', '#adb5bd')]
+    return [label for _, label, _ in rows], [value for value, _, _ in rows], [color for _, _, color in rows]
+
+
+def render(spec, fmt, path):
+    """Рисует график по описанию spec и атомарно записывает его в path
+
+    spec: kind ('pie' или 'barh'), title, labels, values, необязательные colors и unit.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib.figure import Figure
+
+    labels = list(spec['labels'])
+    values = [float(value) for value in spec['values']]
+    colors = list(spec.get('colors') or [DEFAULT_COLORS[i % len(DEFAULT_COLORS)]
+                                         for i in range(len(labels))])
+
+    figure = Figure(figsize=(8, 4.5), dpi=110)
+    axes = figure.add_subplot()
+    axes.set_title(spec['title'])
+
+    if not any(value > 0 for value in values):
+        axes.text(0.5, 0.5, 'Нет данных', ha='center', va='center', color='#6c757d',
+                  transform=axes.transAxes)
+        axes.set_axis_off()
+    elif spec['kind'] == 'pie':
+        rows = [(label, value, color) for label, value, color in zip(labels, values, colors) if value > 0]
+        wedges, _ = axes.pie([value for _, value, _ in rows], colors=[color for _, _, color in rows],
+                             startangle=90, counterclock=False, wedgeprops={'width': 0.42})
+        total = sum(value for _, value, _ in rows)
+        axes.legend(wedges, [f'{label} - {value / total:.1%}' for label, value, _ in rows],
+                    loc='center left', bbox_to_anchor=(1, 0.5), frameon=False)
+        axes.set_aspect('equal')
+    else:
+        labels, values, colors = _top(labels, values, colors)
+        positions = range(len(labels))
+        axes.barh(positions, values, color=colors)
+        axes.set_yticks(positions, labels)
+        axes.invert_yaxis()
+        if spec.get('unit'):
+            axes.set_xlabel(spec['unit'])
+        axes.spines[['top', 'right']].set_visible(False)
+
+    # Без даты создания в метаданных одинаковые данные дают одинаковый файл
+    metadata = {'Date': None} if fmt == 'svg' else {'Software': None}
+    temporary = f'{path}.{os.getpid()}.tmp'
+    figure.savefig(temporary, format=fmt, bbox_inches='tight', metadata=metadata)
+    os.replace(temporary, path)
+    return path
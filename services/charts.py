@@ -0,0 +1,132 @@
+"""Графики статистики в PNG/SVG на сервере (для мобильных клиентов и PDF)
+
+Данные графика - небольшой SQL-агрегат; дорогая часть - отрисовка matplotlib.
+Она выполняется в пуле процессов (CHART_WORKERS), чтобы не держать GIL потоков,
+обслуживающих запросы. Готовый файл кэшируется на диске под ключом
+(пользователь, график, период, версия данных), где версия - хэш самих данных
+графика: любое изменение строк, влияющее на график, дает новый ключ, а
+устаревший файл того же графика удаляется при записи нового.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from flask import current_app
+from sqlalchemy.orm import load_only
+
+from models import Habit, InventoryItem
+from services import chart_render, finance_rollup, inventory_items
+
+FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+# Меняется вместе с оформлением графиков, чтобы не отдавать старые картинки из кэша
+RENDER_VERSION = '1'
+
+# periods: допустимые периоды, первый - по умолчанию
+Chart = namedtuple('Chart', 'title kind periods data')
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+# ==================== ДАННЫЕ ГРАФИКОВ ====================
+def _finance_categories(user_id, period):
+    rows = finance_rollup.period_category_totals(user_id, period)
+    return {'labels': [name for name, _, _ in rows],
+            'values': [round(float(total), 2) for _, _, total in rows],
+            'unit': '₽'}
+
+
+def _inventory_value_by(column, empty_label):
+    def data(user_id, period):
+        rows = inventory_items.grouped(user_id, column, empty_label)
+        return {'labels': [label for label, _, _ in rows],
+                'values': [round(value, 2) for _, _, value in rows],
+                'unit': '₽'}
+    return data
+
+
+def _habit_streaks(user_id, period):
+    habits = Habit.query.options(load_only(Habit.name, Habit.color, Habit.current_streak,
+                                           Habit.last_log_date))\
+        .filter(Habit.user_id == user_id).order_by(Habit.id).all()
+    return {'labels': [habit.name for habit in habits],
+            'values': [habit.get_current_streak() for habit in habits],
+            'colors': [habit.color or '#4CAF50' for habit in habits],
+            'unit': 'дней'}
+
+
+CHARTS = {
+    'finance-categories': Chart('Распределение по категориям', 'pie',
+                                ('month', 'week', 'year'), _finance_categories),
+    'inventory-categories': Chart('Стоимость имущества по категориям', 'barh', ('all',),
+                                  _inventory_value_by(InventoryItem.category, inventory_items.NO_CATEGORY)),
+    'inventory-rooms': Chart('Стоимость имущества по комнатам', 'barh', ('all',),
+                             _inventory_value_by(InventoryItem.room, inventory_items.NO_ROOM)),
+    'habits-streaks': Chart('Текущие серии привычек', 'barh', ('all',), _habit_streaks),
+}
+
+
+# ==================== ОТРИСОВКА И КЭШ ====================
+def _executor():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: процесс пула не наследует потоки и соединения веб-сервера
+            _pool = ProcessPoolExecutor(max_workers=current_app.config['CHART_WORKERS'],
+                                        mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        _pool = None
+
+
+def normalize_period(chart, period):
+    return period if period in chart.periods else chart.periods[0]
+
+
+def draw(spec, fmt, path):
+    """Рисует график по описанию spec в файл path в процессе пула"""
+    try:
+        _executor().submit(chart_render.render, spec, fmt, path)\
+            .result(timeout=current_app.config['CHART_RENDER_TIMEOUT'])
+    except BrokenProcessPool:
+        # Процесс пула упал - следующий запрос создаст новый пул
+        _reset_pool()
+        raise
+    return path
+
+
+def render(user_id, name, period, fmt):
+    """Путь к файлу графика и его версия; рисует график, если его нет в кэше"""
+    chart = CHARTS[name]
+    period = normalize_period(chart, period)
+    spec = dict(chart.data(user_id, period), kind=chart.kind, title=chart.title)
+    source = json.dumps(spec, sort_keys=True, ensure_ascii=False) + RENDER_VERSION
+    version = hashlib.sha1(source.encode()).hexdigest()[:16]
+
+    directory = os.path.join(os.path.abspath(current_app.config['CHART_CACHE_FOLDER']), f'u{user_id}')
+    prefix = f'{name}-{period}-'
+    path = os.path.join(directory, f'{prefix}{version}.{fmt}')
+    if os.path.exists(path):
+        return path, version
+
+    os.makedirs(directory, exist_ok=True)
+    draw(spec, fmt, path)
+
+    # Данные изменились - картинки прежних версий больше не понадобятся
+    for filename in os.listdir(directory):
+        if filename.startswith(prefix) and filename.endswith(f'.{fmt}') and \
+                filename != os.path.basename(path):
+            try:
+                os.remove(os.path.join(directory, filename))
+            except OSError:
+                pass
+    return path, version
@@ -0,0 +1,428 @@
+"""Импорт публичных событий из внешних источников
+
+Конвейер: загрузка -> разбор -> нормализация -> дедупликация -> upsert.
+Источники загружаются параллельно (не больше EVENT_IMPORT_WORKERS потоков) через
+одну requests.Session с пулом соединений того же размера. Запросы условные:
+ETag и Last-Modified прошлого ответа уходят в If-None-Match и If-Modified-Since,
+и неизменившаяся страница (304 или то же тело) не разбирается и не пишется в базу.
+
+Страницы разбираются lxml; парсеры подключаются через реестр PARSERS. Ключ
+события (import_key) - sha1 ссылки на событие и времени начала (одна страница
+может описывать несколько сеансов), а без ссылки - нормализованных названия,
+времени и места. События вставляются пачками одним INSERT ... ON CONFLICT DO
+UPDATE по уникальному индексу import_key как публичные (user_id NULL); строка
+обновляется, только если событие на источнике изменилось. Запись в базу и
+валидаторы кэша сохраняются в одной транзакции в основном потоке.
+"""
+import hashlib
+import json
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urljoin, urlsplit, urlunsplit
+
+import lxml.html
+import requests
+from flask import current_app
+from lxml import etree
+from requests.adapters import HTTPAdapter
+from sqlalchemy import or_, select
+
+from models import db, Event, EventSourceState
+from services import event_listing, search_index, sql
+
+USER_AGENT = 'BestPersonal-EventImport/1.0'
+UPSERT_BATCH_SIZE = 500  # строк в одном INSERT (лимит параметров SQLite - 32766)
+COLUMNS = ['title', 'description', 'category', 'date', 'location', 'price', 'price_type', 'source_url']
+LIMITS = {'title': 200, 'category': 50, 'location': 200, 'source_url': 500}
+
+# Подтипы schema.org Event -> категория события
+CATEGORIES = {
+    'MusicEvent': 'Концерт', 'ExhibitionEvent': 'Выставка', 'SportsEvent': 'Спорт',
+    'TheaterEvent': 'Театр', 'DanceEvent': 'Танцы', 'ComedyEvent': 'Юмор',
+    'ScreeningEvent': 'Кино', 'Festival': 'Фестиваль', 'EducationEvent': 'Лекция',
+    'LiteraryEvent': 'Литература', 'ChildrensEvent': 'Детям', 'FoodEvent': 'Еда',
+}
+
+Source = namedtuple('Source', 'name url parser')
+# status: 200 - страница разобрана, 304 - не изменилась, None - ошибка (error)
+Fetched = namedtuple('Fetched', 'source status events etag last_modified content_hash error')
+
+PARSERS = {}
+
+
+def parser(name):
+    """Регистрирует парсер источника: func(content, base_url, encoding) -> [сырые события]
+
+    encoding - кодировка из Content-Type ответа или None.
+    """
+    def register(func):
+        PARSERS[name] = func
+        return func
+    return register
+
+
+class ImportStats:
+    """Итог импорта по всем источникам"""
+
+    def __init__(self):
+        self.sources = 0
+        self.not_modified = 0
+        self.events = 0  # разобрано событий
+        self.invalid = 0  # без названия или даты
+        self.duplicates = 0
+        self.created = 0
+        self.updated = 0
+        self.errors = []  # (источник, сообщение)
+
+    def __repr__(self):
+        return (f'<ImportStats sources={self.sources} not_modified={self.not_modified} '
+                f'created={self.created} updated={self.updated} errors={len(self.errors)}>')
+
+
+# ==================== РАЗБОР ====================
+def _types(data):
+    types = data.get('@type') or []
+    return [str(t).rsplit('/', 1)[-1] for t in (types if isinstance(types, list) else [types])]
+
+
+def _is_event(data):
+    return any(t.endswith('Event') or t == 'Festival' for t in _types(data))
+
+
+def _walk(data):
+    """Объекты событий в JSON-LD: списки, @graph и вложенные объекты"""
+    if isinstance(data, list):
+        for value in data:
+            yield from _walk(value)
+    elif isinstance(data, dict):
+        if _is_event(data):
+            yield data
+            return
+        for value in data.values():
+            yield from _walk(value)
+
+
+def _place(value):
+    """Строка места из schema.org Place/PostalAddress или текста"""
+    if isinstance(value, list):
+        value = value[0] if value else None
+    if not isinstance(value, dict):
+        return value
+    address = value.get('address')
+    if isinstance(address, dict):
+        address = ', '.join(str(address[key]) for key in ('streetAddress', 'addressLocality')
+                            if address.get(key))
+    return ', '.join(str(part) for part in (value.get('name'), address) if part) or None
+
+
+def _from_schema(data):
+    """Сырое событие из объекта schema.org Event (JSON-LD или микроразметка)"""
+    offers = data.get('offers')
+    if isinstance(offers, list):
+        offers = offers[0] if offers else None
+    category = next((CATEGORIES[t] for t in _types(data) if t in CATEGORIES), None)
+    return {
+        'title': data.get('name'),
+        'description': data.get('description'),
+        'category': category,
+        'date': data.get('startDate'),
+        'location': _place(data.get('location')),
+        'price': offers.get('price') if isinstance(offers, dict) else None,
+        'free': data.get('isAccessibleForFree'),
+        'url': data.get('url'),
+    }
+
+
+def _json_ld(document):
+    for script in document.xpath('//script[@type="application/ld+json"]/text()'):
+        try:
+            yield from _walk(json.loads(script))
+        except ValueError:
+            # Битый блок разметки не должен ронять разбор всей страницы
+            continue
+
+
+def _item_props(item):
+    """itemprop элемента микроразметки без свойств вложенных itemscope"""
+    props = {}
+    for element in item.iterdescendants():
+        name = element.get('itemprop')
+        if not name:
+            continue
+        owner = next(a for a in element.iterancestors() if a.get('itemscope') is not None)
+        if owner is item:
+            props.setdefault(name, element)
+    return props
+
+
+def _microdata_item(item):
+    data = {'@type': item.get('itemtype', '').split()}
+    for name, element in _item_props(item).items():
+        if element.get('itemscope') is not None:
+            data[name] = _microdata_item(element)
+            continue
+        for attribute in ('content', 'datetime', 'href', 'src'):
+            if element.get(attribute):
+                data[name] = element.get(attribute)
+                break
+        else:
+            data[name] = element.text_content()
+    return data
+
+
+def _microdata(document):
+    for item in document.xpath('//*[@itemscope][@itemtype]'):
+        data = _microdata_item(item)
+        if _is_event(data) and not any(a.get('itemscope') is not None and _is_event(
+                {'@type': a.get('itemtype', '').split()}) for a in item.iterancestors()):
+            yield data
+
+
+@parser('html')
+def parse_html(content, base_url, encoding=None):
+    """HTML-страница с разметкой schema.org Event: JSON-LD и микроразметка"""
+    if encoding is None and b'charset' not in content[:2048].lower():
+        # Без charset в заголовке и <meta> libxml2 читает страницу как latin-1
+        encoding = 'utf-8'
+    document = lxml.html.fromstring(content, base_url=base_url,
+                                    parser=lxml.html.HTMLParser(encoding=encoding))
+    return [_from_schema(data) for data in (*_json_ld(document), *_microdata(document))]
+
+
+@parser('jsonld')
+def parse_jsonld(content, base_url, encoding=None):
+    """JSON-лента из объектов schema.org Event"""
+    return [_from_schema(data) for data in _walk(json.loads(content))]
+
+
+# ==================== НОРМАЛИЗАЦИЯ ====================
+def _fold(value):
+    return ' '.join((value or '').casefold().split())
+
+
+def _clean(value, field=None):
+    if not isinstance(value, (str, int, float)):
+        return None
+    value = ' '.join(str(value).split())
+    if field in LIMITS:
+        value = value[:LIMITS[field]]
+    return value or None
+
+
+def _datetime(value):
+    """Время начала из ISO 8601; зона отбрасывается - храним местное время события"""
+    try:
+        return datetime.fromisoformat(str(value).strip()).replace(tzinfo=None, second=0, microsecond=0)
+    except ValueError:
+        return None
+
+
+def _price(value):
+    try:
+        price = float(str(value).replace(',', '.'))
+    except ValueError:
+        return None
+    return price if price >= 0 else None
+
+
+def _url(value, base_url):
+    """Абсолютная ссылка http(s) без фрагмента"""
+    if not isinstance(value, str) or not value.strip():
+        return None
+    parts = urlsplit(urljoin(base_url, value.strip()))
+    if parts.scheme not in ('http', 'https'):
+        return None
+    url = urlunsplit((parts.scheme, parts.netloc.lower(), parts.path or '/', parts.query, ''))
+    return url if len(url) <= LIMITS['source_url'] else None
+
+
+def import_key(row):
+    """Ключ дедупликации: ссылка и время начала, без ссылки - название, время и место"""
+    when = row['date'].isoformat(timespec='minutes')
+    if row['source_url']:
+        basis = f"url|{row['source_url']}|{when}"
+    else:
+        basis = f"event|{_fold(row['title'])}|{when}|{_fold(row['location'])}"
+    return hashlib.sha1(basis.encode('utf-8')).hexdigest()
+
+
+def normalize(raw, base_url):
+    """Строка events из сырого события или None, если нет названия или даты"""
+    title = _clean(raw.get('title'), 'title')
+    date = _datetime(raw.get('date')) if raw.get('date') else None
+    if not title or not date:
+        return None
+    price = _price(raw.get('price')) if raw.get('price') not in (None, '') else None
+    free = str(raw.get('free')).lower() == 'true'
+    row = {
+        'title': title,
+        'description': _clean(raw.get('description')),
+        'category': _clean(raw.get('category'), 'category'),
+        'date': date,
+        'location': _clean(raw.get('location'), 'location'),
+        'price': price or None,
+        'price_type': 'free' if free or price == 0 else ('paid' if price else None),
+        'source_url': _url(raw.get('url'), base_url),
+    }
+    row['import_key'] = import_key(row)
+    return row
+
+
+# ==================== ЗАГРУЗКА ====================
+def configured_sources():
+    """Источники из EVENT_SOURCES: Source или строки "URL" / "URL|парсер" """
+    sources = []
+    for entry in current_app.config['EVENT_SOURCES']:
+        if isinstance(entry, Source):
+            sources.append(entry)
+            continue
+        url, _, parser_name = entry.partition('|')
+        url = url.strip()
+        sources.append(Source(urlsplit(url).netloc or url, url, parser_name.strip() or 'html'))
+    return sources
+
+
+def _session(workers):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=1)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = USER_AGENT
+    return session
+
+
+def _charset(response):
+    _, _, charset = response.headers.get('Content-Type', '').partition('charset=')
+    return charset.split(';')[0].strip('"\' ') or None
+
+
+def fetch(session, source, validators, timeout):
+    """Условная загрузка и разбор одного источника (выполняется в потоке пула)
+
+    validators - (etag, last_modified, content_hash) прошлого ответа или None.
+    """
+    etag, last_modified, content_hash = validators or (None, None, None)
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    try:
+        response = session.get(source.url, headers=headers, timeout=timeout)
+        if response.status_code == 304:
+            return Fetched(source, 304, [], etag, last_modified, content_hash, None)
+        response.raise_for_status()
+        new_etag = response.headers.get('ETag')
+        new_last_modified = response.headers.get('Last-Modified')
+        new_hash = hashlib.sha1(response.content).hexdigest()
+        if new_hash == content_hash:
+            # Сервер без валидаторов кэша: то же тело не разбираем повторно
+            return Fetched(source, 304, [], new_etag, new_last_modified, new_hash, None)
+        events = PARSERS[source.parser](response.content, response.url, _charset(response))
+        return Fetched(source, response.status_code, events, new_etag, new_last_modified, new_hash, None)
+    except (requests.RequestException, ValueError, etree.LxmlError) as e:
+        return Fetched(source, None, [], None, None, None, str(e) or e.__class__.__name__)
+
+
+# ==================== ЗАПИСЬ ====================
+def _batches(rows, size):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def upsert(rows, now=None):
+    """Вставка и обновление публичных событий пачками; возвращает (новых, обновленных)
+
+    Строки должны быть уникальны по import_key: PostgreSQL не дает одному
+    INSERT ... ON CONFLICT изменить строку дважды.
+    """
+    table = Event.__table__
+    now = now or datetime.utcnow()
+    existing = set()
+    for batch in _batches(rows, UPSERT_BATCH_SIZE):
+        existing.update(db.session.scalars(
+            select(table.c.import_key).where(table.c.import_key.in_([row['import_key'] for row in batch]))))
+
+    changed = {}
+    for batch in _batches(rows, UPSERT_BATCH_SIZE):
+        stmt = sql.insert(table).values([dict(row, user_id=None, is_saved=False, created_at=now)
+                                         for row in batch])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['import_key'],
+            set_={name: stmt.excluded[name] for name in COLUMNS},
+            # Неизменившиеся события не переписываются и не возвращаются RETURNING
+            where=or_(*(table.c[name].is_distinct_from(stmt.excluded[name]) for name in COLUMNS)))
+        changed.update(db.session.execute(stmt.returning(table.c.import_key, table.c.id)).all())
+
+    # Массовый upsert не вызывает слушателей ORM - поисковый индекс и кэш категорий обновляются здесь
+    search_index.replace_documents(Event, list(changed.values()))
+    if changed:
+        event_listing.invalidate_categories(None)
+    created = len(changed.keys() - existing)
+    return created, len(changed) - created
+
+
+def run_import(sources=None, workers=None, timeout=None):
+    """Загружает источники, записывает события и валидаторы кэша; возвращает ImportStats"""
+    config = current_app.config
+    sources = list({source.url: source for source in (sources or configured_sources())}.values())
+    workers = workers or config['EVENT_IMPORT_WORKERS']
+    timeout = timeout or config['EVENT_IMPORT_TIMEOUT']
+    stats = ImportStats()
+    stats.sources = len(sources)
+
+    unknown = [source for source in sources if source.parser not in PARSERS]
+    for source in unknown:
+        stats.errors.append((source.name, f'неизвестный парсер "{source.parser}"'))
+    sources = [source for source in sources if source.parser in PARSERS]
+    if not sources:
+        return stats
+
+    states = {state.url: state for state in
+              EventSourceState.query.filter(EventSourceState.url.in_([source.url for source in sources]))}
+    validators = {url: (state.etag, state.last_modified, state.content_hash) for url, state in states.items()}
+
+    session = _session(workers)
+    try:
+        with ThreadPoolExecutor(max_workers=min(workers, len(sources))) as pool:
+            results = list(pool.map(
+                lambda source: fetch(session, source, validators.get(source.url), timeout), sources))
+    finally:
+        session.close()
+
+    now = datetime.utcnow()
+    rows = {}
+    try:
+        for fetched in results:
+            source = fetched.source
+            if fetched.error:
+                current_app.logger.warning('Источник событий %s: %s', source.url, fetched.error)
+                stats.errors.append((source.name, fetched.error))
+                continue
+            if fetched.status == 304:
+                stats.not_modified += 1
+            for raw in fetched.events:
+                stats.events += 1
+                row = normalize(raw, source.url)
+                if row is None:
+                    stats.invalid += 1
+                elif row['import_key'] in rows:
+                    stats.duplicates += 1
+                else:
+                    rows[row['import_key']] = row
+
+            state = states.get(source.url) or EventSourceState(url=source.url)
+            state.etag = fetched.etag
+            state.last_modified = fetched.last_modified
+            state.content_hash = fetched.content_hash
+            state.fetched_at = now
+            db.session.add(state)
+
+        if rows:
+            stats.created, stats.updated = upsert(list(rows.values()), now)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return stats
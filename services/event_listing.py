@@ -0,0 +1,169 @@
+"""Выборки событий по времени: лента с фильтрами, сетка месяца и повестка
+
+Пользователь видит свои и публичные (user_id NULL) события. Вместо OR по
+user_id каждая выборка - UNION ALL двух запросов по индексу (user_id, date),
+а период задается полуоткрытым диапазоном date >= начало AND date < конец:
+колонка не оборачивается в функцию, индекс обслуживает и условие, и порядок,
+и из базы читается только видимое окно. Лента листается по ключу (date, id).
+
+Список категорий для фильтра кэшируется в процессе на EVENT_CATEGORIES_TTL
+секунд отдельно для публичных событий и для каждого пользователя; изменение
+события через ORM сбрасывает кэш своего владельца сразу.
+"""
+import time as clock
+from datetime import datetime, date, time, timedelta
+
+from flask import current_app
+from sqlalchemy import event as orm_event, select, tuple_, union_all
+from sqlalchemy.orm import load_only
+
+from models import db, Event
+
+PERIODS = ('today', 'week', 'month')
+
+# Владелец (user_id или None для публичных) -> (момент устаревания, категории)
+_categories = {}
+
+
+# ==================== ПЕРИОДЫ ====================
+def day_start(day):
+    return datetime.combine(day, time.min)
+
+
+def month_bounds(day):
+    """Первый день месяца и первый день следующего"""
+    first = day.replace(day=1)
+    return first, (first + timedelta(days=32)).replace(day=1)
+
+
+def period_range(period, today=None):
+    """[начало, конец) периода фильтра ленты или (None, None) - все даты"""
+    today = today or date.today()
+    if period == 'today':
+        return day_start(today), day_start(today + timedelta(days=1))
+    if period == 'week':
+        # Сегодня и семь следующих дней
+        return day_start(today), day_start(today + timedelta(days=8))
+    if period == 'month':
+        first, next_first = month_bounds(today)
+        return day_start(first), day_start(next_first)
+    return None, None
+
+
+# ==================== ВЫБОРКИ ====================
+def _visible_ids(user_id, start=None, end=None, category=None, after=None, limit=None):
+    """UNION ALL (id, date) своих и публичных событий окна; каждая часть - по индексу"""
+    parts = []
+    for owner in (Event.user_id == user_id, Event.user_id.is_(None)):
+        stmt = select(Event.id, Event.date).where(owner)
+        if start:
+            stmt = stmt.where(Event.date >= start)
+        if end:
+            stmt = stmt.where(Event.date < end)
+        if category:
+            stmt = stmt.where(Event.category == category)
+        if after:
+            stmt = stmt.where(tuple_(Event.date, Event.id) > tuple_(*after))
+        if limit:
+            # Из каждой части достаточно limit первых строк
+            stmt = stmt.order_by(Event.date, Event.id).limit(limit)
+        # Подзапрос: ORDER BY и LIMIT внутри UNION ALL допустимы только так
+        parts.append(select(stmt.subquery()))
+    return union_all(*parts).subquery()
+
+
+def window(user_id, start=None, end=None, category=None, after=None, limit=None):
+    """Запрос событий окна, упорядоченных по (date, id)"""
+    ids = _visible_ids(user_id, start, end, category, after, limit)
+    query = Event.query.join(ids, Event.id == ids.c.id).order_by(ids.c.date, ids.c.id)
+    return query.limit(limit) if limit else query
+
+
+def encode_cursor(event):
+    return f'{event.date.isoformat()}_{event.id}'
+
+
+def decode_cursor(cursor):
+    """(date, id) из курсора или None, если курсор пустой или поврежден"""
+    try:
+        event_date, event_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(event_date), int(event_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def page(user_id, start=None, end=None, category=None, cursor=None, per_page=20):
+    """Страница событий после курсора и курсор следующей страницы (или None)"""
+    events = window(user_id, start, end, category, decode_cursor(cursor), per_page + 1).all()
+    if len(events) > per_page:
+        return events[:per_page], encode_cursor(events[per_page - 1])
+    return events, None
+
+
+def month_grid(user_id, month, category=None):
+    """Сетка месяца по неделям с понедельника: [[(день, [события])]]
+
+    Загружаются только события видимых дней сетки, включая дни соседних месяцев.
+    """
+    first, next_first = month_bounds(month)
+    grid_start = first - timedelta(days=first.weekday())
+    grid_end = next_first + timedelta(days=(7 - next_first.weekday()) % 7)
+
+    by_day = {}
+    events = window(user_id, day_start(grid_start), day_start(grid_end), category)\
+        .options(load_only(Event.title, Event.date, Event.category, Event.location,
+                           Event.price_type, Event.user_id)).all()
+    for event in events:
+        by_day.setdefault(event.date.date(), []).append(event)
+
+    days = [grid_start + timedelta(days=i) for i in range((grid_end - grid_start).days)]
+    return [[(day, by_day.get(day, [])) for day in days[i:i + 7]] for i in range(0, len(days), 7)]
+
+
+def event_to_dict(event):
+    return {
+        'id': event.id,
+        'title': event.title,
+        'date': event.date.isoformat(),
+        'category': event.category,
+        'location': event.location,
+        'price_type': event.price_type,
+        'public': event.user_id is None,
+    }
+
+
+# ==================== КАТЕГОРИИ ====================
+def _owner_categories(owner):
+    cached = _categories.get(owner)
+    now = clock.monotonic()
+    if cached and cached[0] > now:
+        return cached[1]
+    # DISTINCT по индексу (user_id, category) читает только записи владельца
+    rows = db.session.query(Event.category)\
+        .filter(Event.user_id == owner if owner is not None else Event.user_id.is_(None),
+                Event.category.isnot(None), Event.category != '')\
+        .distinct().all()
+    values = [value for value, in rows]
+    _categories[owner] = (now + current_app.config['EVENT_CATEGORIES_TTL'], values)
+    return values
+
+
+def categories(user_id):
+    """Категории своих и публичных событий для фильтра (из кэша)"""
+    return sorted(set(_owner_categories(None)) | set(_owner_categories(user_id)), key=str.casefold)
+
+
+def invalidate_categories(owner=None):
+    """Сбрасывает кэш категорий владельца (None - публичные события)"""
+    _categories.pop(owner, None)
+
+
+def _after_change(mapper, connection, target):
+    invalidate_categories(target.user_id)
+
+
+def init_app(app):
+    """Сброс кэша категорий при изменении событий через ORM"""
+    for name in ('after_insert', 'after_update', 'after_delete'):
+        if not orm_event.contains(Event, name, _after_change):
+            orm_event.listen(Event, name, _after_change)
@@ -0,0 +1,157 @@
+"""Отдача статики и загруженных файлов
+
+Загрузки отдаются через send_file: условные запросы (If-None-Match,
+If-Modified-Since), Range и сильный ETag. Варианты изображений лежат по адресу
+из sha256 содержимого и никогда не меняются, поэтому кэшируются на год с
+immutable. В режиме SEND_FILE_MODE = 'x-accel' (nginx) или 'x-sendfile'
+(Apache, lighttpd) приложение только проверяет доступ, а файл отправляет
+обратный прокси.
+
+К URL статики url_for добавляет отпечаток содержимого (?v=<хэш>): запрос с
+актуальным отпечатком кэшируется на год, изменение файла меняет URL. Команда
+assets-compress заранее создает рядом с CSS/JS сжатые .gz и .br (если установлен
+пакет brotli); они отдаются клиентам, которые их принимают.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+
+from flask import abort, current_app, request, send_file
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # необязательная зависимость: без нее создаются только .gz
+    brotli = None
+
+YEAR = 365 * 24 * 3600
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt', '.map')
+# Кодировка -> расширение предсжатого файла, в порядке предпочтения
+PRECOMPRESSED = (('br', '.br'), ('gzip', '.gz'))
+MIN_COMPRESS_SIZE = 512  # байт; меньшие файлы сжимать бессмысленно
+
+# Путь -> (mtime, отпечаток)
+_fingerprints = {}
+
+
+# ==================== ЗАГРУЗКИ ====================
+def send_upload(root, filename, etag=None, immutable=False):
+    """Ответ с файлом из каталога загрузок (или заголовком для прокси)"""
+    path = safe_join(root, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    if current_app.config['SEND_FILE_MODE'] == 'x-accel':
+        response = current_app.response_class()
+        prefix = current_app.config['X_ACCEL_UPLOADS_PREFIX'].rstrip('/')
+        response.headers['X-Accel-Redirect'] = f'{prefix}/{filename}'
+        response.mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    else:
+        # При USE_X_SENDFILE send_file сам ставит X-Sendfile вместо тела ответа
+        response = send_file(path, conditional=True, etag=etag or True,
+                             max_age=YEAR if immutable else None)
+
+    # Файлы доступны только после входа - общие кэши их не хранят
+    response.cache_control.public = False
+    response.cache_control.private = True
+    if immutable:
+        response.cache_control.max_age = YEAR
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+
+# ==================== СТАТИКА ====================
+def fingerprint(static_folder, filename):
+    """Короткий хэш содержимого файла статики или None, если файла нет"""
+    path = safe_join(static_folder, filename)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except (OSError, TypeError):
+        return None
+    cached = _fingerprints.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path, 'rb') as source:
+        digest = hashlib.sha256(source.read()).hexdigest()[:12]
+    _fingerprints[path] = (mtime, digest)
+    return digest
+
+
+def _precompressed(path):
+    """(кодировка, путь) предсжатого варианта, который примет клиент"""
+    mtime = os.stat(path).st_mtime_ns
+    for encoding, suffix in PRECOMPRESSED:
+        if not request.accept_encodings[encoding]:
+            continue
+        try:
+            # Вариант старше оригинала не отдаем - его забыли пересобрать
+            if os.stat(path + suffix).st_mtime_ns >= mtime:
+                return encoding, path + suffix
+        except OSError:
+            continue
+    return None, path
+
+
+def send_static(filename):
+    """Замена стандартного маршрута static с отпечатками и предсжатием"""
+    static_folder = current_app.static_folder
+    path = safe_join(static_folder, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    version = request.args.get('v')
+    immutable = bool(version) and version == fingerprint(static_folder, filename)
+
+    encoding, served_path = _precompressed(path)
+    response = send_file(served_path, conditional=True, max_age=YEAR if immutable else None,
+                         mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+
+    if immutable:
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+    return response
+
+
+def _static_url_defaults(endpoint, values):
+    if endpoint == 'static' and 'filename' in values and 'v' not in values:
+        version = fingerprint(current_app.static_folder, values['filename'])
+        if version:
+            values['v'] = version
+
+
+def compress_static(static_folder):
+    """Создает .gz (и .br) для сжимаемых файлов статики; возвращает список созданных"""
+    created = []
+    for directory, _, files in os.walk(static_folder):
+        for name in files:
+            if not name.endswith(COMPRESSIBLE):
+                continue
+            path = os.path.join(directory, name)
+            with open(path, 'rb') as source:
+                data = source.read()
+            if len(data) < MIN_COMPRESS_SIZE:
+                continue
+            variants = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+            if brotli is not None:
+                variants.append(('.br', brotli.compress(data, quality=11)))
+            for suffix, compressed in variants:
+                if len(compressed) >= len(data):
+                    continue
+                with open(path + suffix, 'wb') as output:
+                    output.write(compressed)
+                created.append(path + suffix)
+    return created
+
+
+def init_app(app):
+    """Подключает отпечатки статики, предсжатые файлы и режим отдачи через прокси"""
+    if app.config['SEND_FILE_MODE'] == 'x-sendfile':
+        app.config['USE_X_SENDFILE'] = True
+    app.url_defaults(_static_url_defaults)
+    app.view_functions['static'] = send_static
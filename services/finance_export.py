@@ -0,0 +1,151 @@
+"""Потоковый экспорт транзакций в Excel и фоновые задачи экспорта"""
+import json
+import os
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from openpyxl import Workbook
+
+from models import db, Transaction, Category
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+HEADER = ['Дата', 'Категория', 'Тип', 'Сумма', 'Описание']
+
+# Один поток на фоновые экспорты: тяжелые выгрузки не должны конкурировать
+# между собой за базу данных и диск
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='finance-export')
+_status_lock = threading.Lock()
+
+
+def count_transactions(user_id):
+    """Количество транзакций пользователя (COUNT без загрузки строк)"""
+    return db.session.query(db.func.count(Transaction.id))\
+        .filter(Transaction.user_id == user_id).scalar() or 0
+
+
+def iter_transaction_rows(user_id, chunk_size=1000):
+    """Строки для экспорта: категория присоединяется сразу, данные читаются порциями"""
+    query = db.session.query(
+        Transaction.date,
+        Category.name,
+        Category.type,
+        Transaction.amount,
+        Transaction.description
+    ).join(Category, Transaction.category_id == Category.id)\
+     .filter(Transaction.user_id == user_id)\
+     .order_by(Transaction.date.desc(), Transaction.id.desc())\
+     .yield_per(chunk_size)
+
+    for tx_date, category_name, category_type, amount, description in query:
+        yield [
+            tx_date.strftime('%Y-%m-%d'),
+            category_name,
+            'Доход' if category_type == 'income' else 'Расход',
+            amount,
+            description or ''
+        ]
+
+
+def write_workbook(path, rows):
+    """Запись строк в write-only книгу: память не зависит от числа строк"""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title='Транзакции')
+    ws.append(HEADER)
+    for row in rows:
+        ws.append(row)
+    wb.save(path)
+
+
+def build_export_file(user_id, export_folder, chunk_size=1000):
+    """Формирует временный xlsx-файл в папке экспорта и возвращает путь к нему"""
+    os.makedirs(export_folder, exist_ok=True)
+    fd, path = tempfile.mkstemp(suffix='.xlsx', dir=export_folder)
+    os.close(fd)
+    try:
+        write_workbook(path, iter_transaction_rows(user_id, chunk_size))
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
+
+def stream_file(path, chunk_size=64 * 1024, remove=True):
+    """Отдает файл порциями и удаляет его после отправки"""
+    try:
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        if remove and os.path.exists(path):
+            os.remove(path)
+
+
+# ==================== ФОНОВЫЕ ЗАДАЧИ ====================
+def _job_paths(export_folder, job_id):
+    base = os.path.join(export_folder, f'finance_{job_id}')
+    return base + '.json', base + '.xlsx'
+
+
+def _write_status(export_folder, job_id, **fields):
+    """Статус хранится в json-файле рядом с результатом, чтобы его видели все процессы"""
+    status_path, _ = _job_paths(export_folder, job_id)
+    with _status_lock:
+        status = read_job_status(export_folder, job_id) or {'job_id': job_id}
+        status.update(fields)
+        tmp_path = status_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(status, f, ensure_ascii=False)
+        os.replace(tmp_path, status_path)
+    return status
+
+
+def read_job_status(export_folder, job_id):
+    """Текущий статус задачи или None, если задача не найдена"""
+    status_path, _ = _job_paths(export_folder, job_id)
+    if not os.path.exists(status_path):
+        return None
+    with open(status_path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def job_result_path(export_folder, job_id):
+    """Путь к готовому файлу задачи"""
+    return _job_paths(export_folder, job_id)[1]
+
+
+def _run_export_job(app, user_id, job_id, chunk_size):
+    export_folder = app.config['EXPORT_FOLDER']
+    _, result_path = _job_paths(export_folder, job_id)
+    _write_status(export_folder, job_id, status='running',
+                  started_at=datetime.utcnow().isoformat())
+    with app.app_context():
+        try:
+            tmp_path = result_path + '.part'
+            write_workbook(tmp_path, iter_transaction_rows(user_id, chunk_size))
+            os.replace(tmp_path, result_path)
+            _write_status(export_folder, job_id, status='done',
+                          finished_at=datetime.utcnow().isoformat())
+        except Exception as e:
+            app.logger.exception('Ошибка фонового экспорта %s', job_id)
+            _write_status(export_folder, job_id, status='failed', error=str(e))
+        finally:
+            db.session.remove()
+
+
+def start_export_job(app, user_id, chunk_size=1000):
+    """Ставит экспорт в очередь и возвращает идентификатор задачи"""
+    export_folder = app.config['EXPORT_FOLDER']
+    os.makedirs(export_folder, exist_ok=True)
+    job_id = uuid.uuid4().hex
+    _write_status(export_folder, job_id,
+                  user_id=user_id,
+                  status='queued',
+                  created_at=datetime.utcnow().isoformat())
+    _executor.submit(_run_export_job, app, user_id, job_id, chunk_size)
+    return job_id
@@ -0,0 +1,268 @@
+"""PDF-отчет по финансам за произвольный период
+
+Отчет верстается reportlab platypus со встроенным TTF-шрифтом DejaVu Sans
+(кириллица). Транзакции читаются одним запросом с JOIN категории порциями
+(yield_per) в порядке категорий и сразу превращаются в компактные блоки по
+TABLE_ROWS уже отформатированных строк, без ORM-объектов. Память все равно
+растет с размером отчета: canvas reportlab хранит все страницы до save(),
+поэтому очень большие периоды стоит выгружать в Excel или CSV. Итоги по
+категориям считает GROUP BY, диаграмма расходов рисуется в пуле процессов
+графиков.
+"""
+import itertools
+import os
+import tempfile
+from datetime import datetime
+from xml.sax.saxutils import escape
+
+import matplotlib
+from flask import current_app
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.units import mm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.platypus import SimpleDocTemplate, Flowable, Paragraph, Spacer, Table, TableStyle, Image
+from sqlalchemy import func
+
+from models import db, Transaction, Category
+from services import charts
+
+FONT = 'DejaVuSans'
+FONT_BOLD = 'DejaVuSans-Bold'
+TABLE_ROWS = 200  # строк транзакций в одном блоке
+DESCRIPTION_CHARS = 70
+TYPE_LABELS = {'income': 'Доход', 'expense': 'Расход'}
+
+PAGE_WIDTH, PAGE_HEIGHT = A4
+MARGIN = 15 * mm
+DETAIL_COLUMNS = [25 * mm, 30 * mm, PAGE_WIDTH - 2 * MARGIN - 55 * mm]
+ROW_HEIGHT = 14
+CELL_PADDING = 6
+HEADER_BACKGROUND = colors.HexColor('#e9ecef')
+STRIPE_BACKGROUND = colors.HexColor('#f8f9fa')
+LINE_COLOR = colors.HexColor('#adb5bd')
+
+TITLE_STYLE = ParagraphStyle('title', fontName=FONT_BOLD, fontSize=16, leading=20, spaceAfter=4 * mm)
+TEXT_STYLE = ParagraphStyle('text', fontName=FONT, fontSize=9, leading=13)
+HEADING_STYLE = ParagraphStyle('heading', fontName=FONT_BOLD, fontSize=11, leading=14,
+                               spaceBefore=5 * mm, spaceAfter=2 * mm, keepWithNext=1)
+
+TABLE_STYLE = TableStyle([
+    ('FONTNAME', (0, 0), (-1, -1), FONT),
+    ('FONTNAME', (0, 0), (-1, 0), FONT_BOLD),
+    ('FONTSIZE', (0, 0), (-1, -1), 8),
+    ('LEADING', (0, 0), (-1, -1), 10),
+    ('BACKGROUND', (0, 0), (-1, 0), HEADER_BACKGROUND),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, STRIPE_BACKGROUND]),
+    ('LINEBELOW', (0, 0), (-1, 0), 0.5, LINE_COLOR),
+    ('TOPPADDING', (0, 0), (-1, -1), 2),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
+])
+TOTAL_STYLE = TableStyle([
+    ('FONTNAME', (0, 0), (-1, -1), FONT_BOLD),
+    ('FONTSIZE', (0, 0), (-1, -1), 8),
+    ('LINEABOVE', (0, 0), (-1, 0), 0.5, LINE_COLOR),
+    ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+])
+
+
+class _Rows(Flowable):
+    """Строки транзакций (дата, сумма, описание) с заголовком на каждой странице
+
+    Table рисует каждую ячейку отдельным drawString и измеряет ее при разбиении;
+    здесь высота строки фиксирована, а текст страницы выводится одним текстовым
+    объектом - на отчетах в сотни тысяч строк это в разы быстрее.
+    """
+
+    HEADER = ('Дата', 'Сумма', 'Описание')
+
+    def __init__(self, rows):
+        super().__init__()
+        self.rows = rows
+
+    def wrap(self, availWidth, availHeight):
+        self.width = sum(DETAIL_COLUMNS)
+        self.height = ROW_HEIGHT * (len(self.rows) + 1)
+        return self.width, self.height
+
+    def split(self, availWidth, availHeight):
+        fit = int(availHeight // ROW_HEIGHT) - 1
+        if fit < 1:
+            return []
+        return [_Rows(self.rows[:fit]), _Rows(self.rows[fit:])]
+
+    def draw(self):
+        canvas = self.canv
+        canvas.setFillColor(HEADER_BACKGROUND)
+        canvas.rect(0, self.height - ROW_HEIGHT, self.width, ROW_HEIGHT, stroke=0, fill=1)
+        canvas.setFillColor(STRIPE_BACKGROUND)
+        for i in range(1, len(self.rows), 2):
+            canvas.rect(0, self.height - (i + 2) * ROW_HEIGHT, self.width, ROW_HEIGHT, stroke=0, fill=1)
+        canvas.setStrokeColor(LINE_COLOR)
+        canvas.setLineWidth(0.5)
+        canvas.line(0, self.height - ROW_HEIGHT, self.width, self.height - ROW_HEIGHT)
+
+        amount_right = DETAIL_COLUMNS[0] + DETAIL_COLUMNS[1] - CELL_PADDING
+        description_left = DETAIL_COLUMNS[0] + DETAIL_COLUMNS[1] + CELL_PADDING
+        text = canvas.beginText()
+        text.setFillColor(colors.black)
+        for i, (day, amount, description) in enumerate([self.HEADER] + self.rows):
+            font = FONT_BOLD if i == 0 else FONT
+            text.setFont(font, 8)
+            baseline = self.height - (i + 1) * ROW_HEIGHT + 4
+            text.setTextOrigin(CELL_PADDING, baseline)
+            text.textOut(day)
+            text.setTextOrigin(amount_right - pdfmetrics.stringWidth(amount, font, 8), baseline)
+            text.textOut(amount)
+            text.setTextOrigin(description_left, baseline)
+            text.textOut(description)
+        canvas.drawText(text)
+
+
+def _register_fonts():
+    if FONT in pdfmetrics.getRegisteredFontNames():
+        return
+    # DejaVu Sans поставляется вместе с matplotlib
+    folder = current_app.config['PDF_FONT_FOLDER'] or \
+        os.path.join(matplotlib.get_data_path(), 'fonts', 'ttf')
+    pdfmetrics.registerFont(TTFont(FONT, os.path.join(folder, 'DejaVuSans.ttf')))
+    pdfmetrics.registerFont(TTFont(FONT_BOLD, os.path.join(folder, 'DejaVuSans-Bold.ttf')))
+    pdfmetrics.registerFontFamily(FONT, normal=FONT, bold=FONT_BOLD)
+
+
+def _in_period(query, user_id, date_from, date_to):
+    query = query.filter(Transaction.user_id == user_id)
+    if date_from:
+        query = query.filter(Transaction.date >= date_from)
+    if date_to:
+        query = query.filter(Transaction.date <= date_to)
+    return query
+
+
+def category_totals(user_id, date_from=None, date_to=None):
+    """(название, тип, количество, сумма) по категориям за период: доходы, затем расходы"""
+    query = db.session.query(Category.name, Category.type,
+                             func.count(Transaction.id), func.sum(Transaction.amount))\
+        .join(Category, Transaction.category_id == Category.id)
+    return _in_period(query, user_id, date_from, date_to)\
+        .group_by(Category.id, Category.name, Category.type)\
+        .order_by(Category.type.desc(), Category.name, Category.id).all()
+
+
+def iter_rows(user_id, date_from=None, date_to=None, chunk_size=1000):
+    """Транзакции периода с категорией одним запросом, в порядке категорий и дат"""
+    query = db.session.query(Category.id, Category.name, Category.type,
+                             Transaction.date, Transaction.amount, Transaction.description)\
+        .join(Category, Transaction.category_id == Category.id)
+    return _in_period(query, user_id, date_from, date_to)\
+        .order_by(Category.type.desc(), Category.name, Category.id,
+                  Transaction.date, Transaction.id)\
+        .yield_per(chunk_size)
+
+
+def _money(value):
+    return f'{value:,.2f}'.replace(',', ' ')
+
+
+def _short(text):
+    text = ' '.join((text or '').split())
+    return text if len(text) <= DESCRIPTION_CHARS else text[:DESCRIPTION_CHARS - 1] + '…'
+
+
+def _period_label(date_from, date_to):
+    if date_from and date_to:
+        return f'{date_from:%d.%m.%Y} - {date_to:%d.%m.%Y}'
+    if date_from:
+        return f'с {date_from:%d.%m.%Y}'
+    if date_to:
+        return f'по {date_to:%d.%m.%Y}'
+    return 'вся история'
+
+
+def _flowables(username, date_from, date_to, totals, chart_path, rows):
+    yield Paragraph('Отчет по финансам', TITLE_STYLE)
+    yield Paragraph(f'Пользователь: {escape(username)}<br/>'
+                    f'Период: {_period_label(date_from, date_to)}<br/>'
+                    f'Сформирован: {datetime.now():%d.%m.%Y %H:%M}', TEXT_STYLE)
+
+    income = sum(total for _, kind, _, total in totals if kind == 'income')
+    expense = sum(total for _, kind, _, total in totals if kind == 'expense')
+    yield Paragraph('Итоги', HEADING_STYLE)
+    summary = Table([['Доходы', _money(income)], ['Расходы', _money(expense)],
+                     ['Баланс', _money(income - expense)]], colWidths=[40 * mm, 35 * mm])
+    summary.setStyle(TableStyle([('FONTNAME', (0, 0), (-1, -1), FONT),
+                                 ('FONTNAME', (0, -1), (-1, -1), FONT_BOLD),
+                                 ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+                                 ('LINEABOVE', (0, -1), (-1, -1), 0.5, LINE_COLOR)]))
+    yield summary
+
+    if chart_path:
+        yield Spacer(1, 4 * mm)
+        yield Image(chart_path, width=150 * mm, height=85 * mm, kind='proportional')
+
+    if totals:
+        yield Paragraph('По категориям', HEADING_STYLE)
+        table = Table([['Категория', 'Тип', 'Операций', 'Сумма']] +
+                      [[name, TYPE_LABELS.get(kind, kind), count, _money(total)]
+                       for name, kind, count, total in totals],
+                      colWidths=[70 * mm, 25 * mm, 25 * mm, 35 * mm], repeatRows=1)
+        table.setStyle(TABLE_STYLE)
+        table.setStyle(TableStyle([('ALIGN', (2, 0), (-1, -1), 'RIGHT')]))
+        yield table
+
+    # Подробности: блоки по TABLE_ROWS строк и строка итога категории
+    for (_, name, kind), group in itertools.groupby(rows, key=lambda row: row[:3]):
+        yield Paragraph(f'{escape(name)} ({TYPE_LABELS.get(kind, kind).lower()})', HEADING_STYLE)
+        subtotal = 0
+        while True:
+            chunk = list(itertools.islice(group, TABLE_ROWS))
+            if not chunk:
+                break
+            subtotal += sum(row[4] for row in chunk)
+            yield _Rows([(f'{day:%d.%m.%Y}', _money(amount), _short(description))
+                         for _, _, _, day, amount, description in chunk])
+        total = Table([['Итого', _money(subtotal), '']], colWidths=DETAIL_COLUMNS)
+        total.setStyle(TOTAL_STYLE)
+        yield total
+
+
+def _footer(canvas, doc):
+    canvas.saveState()
+    canvas.setFont(FONT, 8)
+    canvas.setFillColor(colors.HexColor('#6c757d'))
+    canvas.drawRightString(PAGE_WIDTH - MARGIN, MARGIN / 2, f'Страница {doc.page}')
+    canvas.restoreState()
+
+
+def build_report(user, export_folder, date_from=None, date_to=None, chunk_size=1000):
+    """Формирует временный PDF-файл отчета в папке экспорта и возвращает путь к нему"""
+    _register_fonts()
+    os.makedirs(export_folder, exist_ok=True)
+    fd, path = tempfile.mkstemp(suffix='.pdf', dir=export_folder)
+    os.close(fd)
+    path = os.path.abspath(path)
+    chart_path = None
+    try:
+        totals = category_totals(user.id, date_from, date_to)
+        expenses = [(name, total) for name, kind, _, total in totals if kind == 'expense' and total > 0]
+        if expenses:
+            chart_path = charts.draw({'kind': 'pie', 'title': 'Расходы по категориям',
+                                      'labels': [name for name, _ in expenses],
+                                      'values': [round(float(total), 2) for _, total in expenses]},
+                                     'png', path[:-len('.pdf')] + '.png')
+
+        doc = SimpleDocTemplate(path, pagesize=A4, leftMargin=MARGIN, rightMargin=MARGIN,
+                                topMargin=MARGIN, bottomMargin=MARGIN,
+                                title='Отчет по финансам', author=user.username)
+        rows = iter_rows(user.id, date_from, date_to, chunk_size)
+        doc.build(list(_flowables(user.username, date_from, date_to, totals, chart_path, rows)),
+                  onFirstPage=_footer, onLaterPages=_footer)
+    except Exception:
+        os.remove(path)
+        raise
+    finally:
+        if chart_path and os.path.exists(chart_path):
+            os.remove(chart_path)
+    return path
@@ -0,0 +1,138 @@
+"""Помесячные агрегаты транзакций: инкрементальное обновление и пересборка"""
+from datetime import date, timedelta
+
+from sqlalchemy import func, select
+
+from models import db, Transaction, Category, FinanceMonthlyRollup
+from services import sql
+
+
+def _month(day):
+    return day.replace(day=1)
+
+
+def apply_delta(user_id, day, category_id, amount, count):
+    """Прибавляет сумму и количество к агрегату месяца (одним UPSERT)"""
+    stmt = sql.insert(FinanceMonthlyRollup).values(
+        user_id=user_id,
+        month=_month(day),
+        category_id=int(category_id),
+        total=amount,
+        tx_count=count
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_id', 'month', 'category_id'],
+        set_={
+            'total': FinanceMonthlyRollup.total + stmt.excluded.total,
+            'tx_count': FinanceMonthlyRollup.tx_count + stmt.excluded.tx_count
+        }
+    )
+    db.session.execute(stmt)
+
+    if count < 0:
+        # Пустые агрегаты не храним
+        FinanceMonthlyRollup.query.filter(
+            FinanceMonthlyRollup.user_id == user_id,
+            FinanceMonthlyRollup.month == _month(day),
+            FinanceMonthlyRollup.category_id == int(category_id),
+            FinanceMonthlyRollup.tx_count <= 0
+        ).delete(synchronize_session=False)
+
+
+def record_added(transaction):
+    """Учесть новую транзакцию"""
+    apply_delta(transaction.user_id, transaction.date, transaction.category_id,
+                transaction.amount, 1)
+
+
+def record_deleted(transaction):
+    """Учесть удаление транзакции"""
+    apply_delta(transaction.user_id, transaction.date, transaction.category_id,
+                -transaction.amount, -1)
+
+
+def snapshot(transaction):
+    """Значения транзакции, влияющие на агрегаты (до редактирования)"""
+    return (transaction.date, transaction.category_id, transaction.amount)
+
+
+def record_edited(old_snapshot, transaction):
+    """Учесть изменение транзакции: вычесть старые значения и прибавить новые"""
+    old_date, old_category_id, old_amount = old_snapshot
+    apply_delta(transaction.user_id, old_date, old_category_id, -old_amount, -1)
+    record_added(transaction)
+
+
+def totals_by_type(user_id, month_from):
+    """Суммы доходов и расходов начиная с месяца month_from"""
+    rows = db.session.query(Category.type, func.sum(FinanceMonthlyRollup.total))\
+        .join(Category, FinanceMonthlyRollup.category_id == Category.id)\
+        .filter(FinanceMonthlyRollup.user_id == user_id,
+                FinanceMonthlyRollup.month >= _month(month_from))\
+        .group_by(Category.type).all()
+    return {category_type: total or 0 for category_type, total in rows}
+
+
+def category_totals(user_id, month_from):
+    """Суммы по категориям начиная с месяца month_from: (name, type, total)"""
+    return db.session.query(
+        Category.name,
+        Category.type,
+        func.sum(FinanceMonthlyRollup.total).label('total')
+    ).join(Category, FinanceMonthlyRollup.category_id == Category.id)\
+     .filter(FinanceMonthlyRollup.user_id == user_id,
+             FinanceMonthlyRollup.month >= _month(month_from))\
+     .group_by(Category.id, Category.name, Category.type).all()
+
+
+def period_start(period, today=None):
+    """Начало периода статистики: неделя назад, текущий месяц (по умолчанию) или год"""
+    today = today or date.today()
+    if period == 'week':
+        return today - timedelta(days=7)
+    if period == 'year':
+        return today.replace(month=1, day=1)
+    return today.replace(day=1)
+
+
+def period_category_totals(user_id, period):
+    """Суммы по категориям за период статистики: (name, type, total)"""
+    start_date = period_start(period)
+    # Для целых месяцев читаем агрегаты,
+    # неделю считаем по транзакциям (она не выровнена по месяцам)
+    if period != 'week':
+        return category_totals(user_id, start_date)
+    return db.session.query(
+        Category.name,
+        Category.type,
+        func.sum(Transaction.amount).label('total')
+    ).join(Transaction)\
+     .filter(Transaction.user_id == user_id,
+             Transaction.date >= start_date)\
+     .group_by(Category.id, Category.name, Category.type).all()
+
+
+def rebuild(user_id=None):
+    """Пересчитывает агрегаты из таблицы транзакций одним INSERT ... SELECT"""
+    delete_query = FinanceMonthlyRollup.query
+    if user_id is not None:
+        delete_query = delete_query.filter(FinanceMonthlyRollup.user_id == user_id)
+    delete_query.delete(synchronize_session=False)
+
+    month = sql.month_start(Transaction.date)
+    source = select(
+        Transaction.user_id,
+        month,
+        Transaction.category_id,
+        func.sum(Transaction.amount),
+        func.count(Transaction.id)
+    ).group_by(Transaction.user_id, month, Transaction.category_id)
+    if user_id is not None:
+        source = source.where(Transaction.user_id == user_id)
+
+    db.session.execute(
+        FinanceMonthlyRollup.__table__.insert().from_select(
+            ['user_id', 'month', 'category_id', 'total', 'tx_count'], source
+        )
+    )
+    db.session.commit()
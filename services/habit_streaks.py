@@ -0,0 +1,122 @@
+"""Кэш серий привычек: инкрементальное обновление, пересчет и суточный сброс
+
+Habit.current_streak - длина серии, которая заканчивается в last_log_date, пока
+серию еще можно продолжить (последняя отметка сегодня или вчера), иначе 0.
+"""
+from datetime import datetime, timedelta
+from itertools import groupby
+
+from sqlalchemy import update
+
+from models import db, Habit, HabitLog
+
+
+def utc_today():
+    # Та же граница суток, что и в Habit.get_current_streak
+    return datetime.utcnow().date()
+
+
+def compute_streaks(dates, today=None):
+    """Серии по отсортированному по возрастанию списку дат отметок"""
+    today = today or utc_today()
+    longest = run = 0
+    previous = None
+    for day in dates:
+        if day == previous:
+            # Повторная отметка за тот же день (старые базы без уникального индекса)
+            continue
+        run = run + 1 if previous is not None and day == previous + timedelta(days=1) else 1
+        longest = max(longest, run)
+        previous = day
+    alive = previous is not None and previous >= today - timedelta(days=1)
+    return {
+        'current_streak': run if alive else 0,
+        'longest_streak': longest,
+        'last_log_date': previous,
+        'total_logs': len(dates)
+    }
+
+
+def recompute_habit(habit, today=None):
+    """Пересчет кэша одной привычки по датам ее отметок (один запрос одной колонки)"""
+    dates = [row[0] for row in db.session.query(HabitLog.date)
+             .filter(HabitLog.habit_id == habit.id)
+             .order_by(HabitLog.date)]
+    for key, value in compute_streaks(dates, today).items():
+        setattr(habit, key, value)
+
+
+def record_added(habit, log_date):
+    """Учесть новую отметку; O(1) для отметки за сегодня"""
+    today = utc_today()
+    if log_date != today or (habit.last_log_date and habit.last_log_date >= today):
+        # Отметка задним числом может склеить серии - пересчитываем
+        db.session.flush()
+        recompute_habit(habit, today)
+        return
+
+    if habit.last_log_date == today - timedelta(days=1):
+        habit.current_streak += 1
+    else:
+        habit.current_streak = 1
+    habit.last_log_date = today
+    habit.longest_streak = max(habit.longest_streak, habit.current_streak)
+    habit.total_logs += 1
+
+
+def record_removed(habit, log_date):
+    """Учесть удаление отметки: серия может разорваться где угодно, пересчитываем"""
+    db.session.flush()
+    recompute_habit(habit)
+
+
+def iter_computed(habit_ids=None, batch_size=1000, today=None):
+    """Серии всех привычек, у которых есть отметки, одним упорядоченным проходом по логам"""
+    today = today or utc_today()
+    logs = db.session.query(HabitLog.habit_id, HabitLog.date)\
+        .order_by(HabitLog.habit_id, HabitLog.date)
+    if habit_ids is not None:
+        logs = logs.filter(HabitLog.habit_id.in_(habit_ids))
+    for habit_id, rows in groupby(logs.yield_per(batch_size), key=lambda row: row[0]):
+        values = compute_streaks([row[1] for row in rows], today)
+        values['id'] = habit_id
+        yield values
+
+
+def store(computed, habit_ids=None, batch_size=1000):
+    """Записывает рассчитанные серии в кэш; привычки без отметок обнуляются"""
+    reset = update(Habit).values(current_streak=0, longest_streak=0,
+                                 last_log_date=None, total_logs=0)
+    if habit_ids is not None:
+        reset = reset.where(Habit.id.in_(habit_ids))
+    db.session.execute(reset)
+
+    batch = []
+    for values in computed:
+        batch.append(values)
+        if len(batch) >= batch_size:
+            db.session.execute(update(Habit), batch)
+            batch = []
+    if batch:
+        db.session.execute(update(Habit), batch)
+    db.session.commit()
+
+
+def recompute_all(habit_ids=None, batch_size=1000, today=None):
+    """Пересчет кэша для всех (или выбранных) привычек"""
+    # Список нужен, чтобы не писать в habits, пока открыт курсор по логам
+    computed = list(iter_computed(habit_ids, batch_size, today))
+    store(computed, habit_ids, batch_size)
+
+
+def rollover(today=None):
+    """Суточный сброс: обнуляет серии, последняя отметка которых раньше вчерашнего дня"""
+    today = today or utc_today()
+    result = db.session.execute(
+        update(Habit)
+        .where(Habit.current_streak > 0,
+               Habit.last_log_date < today - timedelta(days=1))
+        .values(current_streak=0)
+    )
+    db.session.commit()
+    return result.rowcount
@@ -0,0 +1,261 @@
+"""Загрузка изображений: варианты размеров, WebP и хранение по содержимому
+
+Загруженный файл получает ключ images/<2 символа>/<sha256 содержимого>; в каталоге
+ключа лежат варианты для каждого размера из SIZES в WebP и JPEG (JPEG - для
+браузеров без WebP). Оригинал не хранится: варианты пересжимаются с поворотом
+по EXIF и без метаданных (геометки камеры не попадают на сервер). Одинаковые
+файлы получают один ключ и обрабатываются один раз.
+
+Запрос только сохраняет исходный файл и ставит обработку в пул потоков. Если
+вариант запрошен раньше, чем пул успел его сделать (или в другом процессе),
+он создается на месте из исходного файла - см. ensure_variants.
+
+Каталог ключа удаляется, только когда на ключ не ссылается ни один рецепт или
+предмет: release вызывается после commit. Запись другого пользователя с тем же
+ключом может быть еще не сохранена, поэтому save_upload обновляет mtime каталога,
+а удаляются только каталоги старше IMAGE_RELEASE_GRACE; оставшиеся без ссылок
+каталоги позже убирает sweep (задача планировщика).
+"""
+import hashlib
+import io
+import os
+import re
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from flask import current_app, url_for
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from models import db, Recipe, InventoryItem
+
+KEY_PREFIX = 'images'
+_KEY = re.compile(rf'^{KEY_PREFIX}/[0-9a-f]{{2}}/[0-9a-f]{{64}}$')
+SOURCE_NAME = 'source'
+# Имя варианта -> наибольшая сторона в пикселях
+SIZES = {'thumb': 320, 'medium': 1024, 'large': 2048}
+FORMATS = {'webp': ('WEBP', {'quality': 80, 'method': 4}),
+           'jpg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True})}
+
+_executor = None
+_executor_lock = threading.Lock()
+# Блокировки по ключу: пул и запрос на вариант не обрабатывают один файл дважды.
+# Набор фиксированный - ключ выбирает блокировку по хэшу, память не растет с числом загрузок
+KEY_LOCKS = 64
+_key_locks = [threading.Lock() for _ in range(KEY_LOCKS)]
+
+
+def upload_root():
+    return os.path.abspath(current_app.config['UPLOAD_FOLDER'])
+
+
+def is_key(path):
+    return bool(path) and path.startswith(KEY_PREFIX + '/')
+
+
+def _key_dir(root, key):
+    return os.path.join(root, *key.split('/'))
+
+
+def variant_name(size, fmt):
+    return f'{size}.{fmt}'
+
+
+def _variants_ready(directory):
+    return all(os.path.exists(os.path.join(directory, variant_name(size, fmt)))
+               for size in SIZES for fmt in FORMATS)
+
+
+def _key_lock(key):
+    # Блокировки не вложены друг в друга, поэтому общая блокировка двух ключей безопасна
+    return _key_locks[hash(key) % KEY_LOCKS]
+
+
+# ==================== ОБРАБОТКА ====================
+def _flatten(image):
+    """RGB для JPEG: прозрачность заливается белым"""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def _process(directory):
+    """Создает все варианты из исходного файла и удаляет его"""
+    source = os.path.join(directory, SOURCE_NAME)
+    with Image.open(source) as original:
+        # Большие JPEG декодируются сразу в уменьшенном масштабе
+        original.draft('RGB', (max(SIZES.values()),) * 2)
+        image = ImageOps.exif_transpose(original)
+        has_alpha = image.mode in ('RGBA', 'LA') or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    for size, limit in sorted(SIZES.items(), key=lambda item: -item[1]):
+        variant = image.copy()
+        variant.thumbnail((limit, limit), Image.LANCZOS)
+        for fmt, (pil_format, options) in FORMATS.items():
+            target = os.path.join(directory, variant_name(size, fmt))
+            temporary = target + '.tmp'
+            # Метаданные не передаются: Pillow пишет EXIF только если его передать явно
+            (variant if fmt == 'webp' else _flatten(variant)).save(temporary, pil_format, **options)
+            os.replace(temporary, target)
+        image = variant  # следующий размер меньше - уменьшаем уже уменьшенное
+    os.remove(source)
+
+
+def ensure_variants(root, key):
+    """Гарантирует наличие вариантов ключа; False, если исходника уже нет"""
+    if not _KEY.match(key):
+        return False
+    directory = _key_dir(root, key)
+    with _key_lock(key):
+        if _variants_ready(directory):
+            return True
+        if not os.path.exists(os.path.join(directory, SOURCE_NAME)):
+            return False
+        _process(directory)
+        return True
+
+
+def _executor_instance():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=current_app.config['IMAGE_WORKERS'],
+                                           thread_name_prefix='images')
+        return _executor
+
+
+# ==================== ЗАГРУЗКА И УДАЛЕНИЕ ====================
+def save_upload(file):
+    """Сохраняет загруженный файл и ставит обработку в очередь
+
+    Возвращает ключ изображения или None, если файл не является изображением.
+    """
+    data = file.read()
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.verify()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError):
+        return None
+
+    digest = hashlib.sha256(data).hexdigest()
+    key = f'{KEY_PREFIX}/{digest[:2]}/{digest}'
+    root = upload_root()
+    directory = _key_dir(root, key)
+
+    with _key_lock(key):
+        os.makedirs(directory, exist_ok=True)
+        # Ключ только что выдан: release и sweep не тронут каталог, пока запись не сохранена
+        os.utime(directory)
+        if _variants_ready(directory):
+            return key  # такой файл уже загружали
+        # Каталог мог быть удален вместе с исходником - сохраняем исходник заново
+        source = os.path.join(directory, SOURCE_NAME)
+        if not os.path.exists(source):
+            with open(source + '.tmp', 'wb') as output:
+                output.write(data)
+            os.replace(source + '.tmp', source)
+
+    future = _executor_instance().submit(ensure_variants, root, key)
+    # Колбэк выполняется в потоке пула без контекста приложения - логгер берем сейчас
+    future.add_done_callback(partial(_log_failure, current_app.logger, key))
+    return key
+
+
+def _log_failure(logger, key, future):
+    error = future.exception()
+    if error is not None:
+        logger.error('Не удалось обработать изображение %s', key, exc_info=error)
+
+
+def _references(path):
+    return Recipe.query.filter_by(image_path=path).count() + \
+        InventoryItem.query.filter_by(image_path=path).count()
+
+
+def _remove_unreferenced(root, key, grace):
+    """Удаляет каталог ключа без ссылок, если его не выдавали последние grace секунд"""
+    directory = _key_dir(root, key)
+    with _key_lock(key):
+        try:
+            if time.time() - os.path.getmtime(directory) < grace:
+                return False
+        except OSError:
+            return False  # каталога уже нет
+        if _references(key):
+            return False
+        shutil.rmtree(directory, ignore_errors=True)
+        return True
+
+
+def release(path):
+    """Удаляет файлы изображения, если на него больше никто не ссылается"""
+    if not path:
+        return
+    if is_key(path):
+        # Свежий каталог остается до sweep: его может ждать еще не сохраненная запись
+        _remove_unreferenced(upload_root(), path, current_app.config['IMAGE_RELEASE_GRACE'])
+    elif not _references(path) and os.path.exists(path):
+        # Файл, сохраненный до появления вариантов
+        os.remove(path)
+
+
+def sweep():
+    """Удаляет каталоги ключей без ссылок старше IMAGE_RELEASE_GRACE; возвращает их число"""
+    root = upload_root()
+    grace = current_app.config['IMAGE_RELEASE_GRACE']
+    top = os.path.join(root, KEY_PREFIX)
+    removed = 0
+    for prefix in sorted(os.listdir(top)) if os.path.isdir(top) else []:
+        for digest in sorted(os.listdir(os.path.join(top, prefix))):
+            key = f'{KEY_PREFIX}/{prefix}/{digest}'
+            if _KEY.match(key) and _remove_unreferenced(root, key, grace):
+                removed += 1
+    return removed
+
+
+# ==================== ДОСТУП ====================
+def upload_paths(filename):
+    """Значения image_path, которым может соответствовать файл из каталога загрузок"""
+    if is_key(filename):
+        return [filename.rsplit('/', 1)[0]]  # ключ без имени варианта
+    # Старые записи хранят путь вида uploads/recipes/<файл>
+    folder = current_app.config['UPLOAD_FOLDER'].rstrip('/')
+    return list({f'{folder}/{filename}', os.path.join(folder, *filename.split('/'))})
+
+
+def owned_by(user_id, filename):
+    """Ссылается ли на файл рецепт или предмет пользователя
+
+    Ключ по содержимому общий для всех, кто загрузил тот же файл, поэтому
+    доступ дает только собственная запись с этим image_path.
+    """
+    paths = upload_paths(filename)
+    return any(db.session.query(model.query.filter(model.user_id == user_id,
+                                                   model.image_path.in_(paths)).exists()).scalar()
+               for model in (Recipe, InventoryItem))
+
+
+# ==================== ССЫЛКИ ====================
+def image_url(path, size='thumb', fmt='jpg'):
+    """URL варианта изображения (для старых файлов - самого файла)"""
+    if not path:
+        return None
+    if is_key(path):
+        return url_for('main.uploaded_file', filename=f'{path}/{variant_name(size, fmt)}')
+    # Старые записи хранят путь вида uploads/recipes/<файл>
+    folder = current_app.config['UPLOAD_FOLDER'].rstrip('/') + '/'
+    filename = path.replace(os.sep, '/')
+    return url_for('main.uploaded_file', filename=filename[len(folder):]
+                   if filename.startswith(folder) else filename)
+
+
+def init_app(app):
+    """Делает image_url доступной в шаблонах"""
+    app.add_template_global(image_url)
+    app.add_template_global(is_key, 'is_image_key')
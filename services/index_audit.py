@@ -0,0 +1,138 @@
+"""Аудит индексов: EXPLAIN для типовых запросов маршрутов и поиск полных сканирований"""
+from datetime import datetime, date, timedelta
+
+from sqlalchemy import func, text, tuple_
+
+from models import (db, Transaction, Category, FinanceMonthlyRollup, Habit, HabitLog,
+                    Recipe, RecipeIngredient, MealPlan, StudyCard, StudySession, InventoryItem,
+                    WarrantyNotification, Event)
+from services import event_listing
+
+# Маленькие справочники, полное чтение которых допустимо
+SMALL_TABLES = {'categories'}
+
+
+def _audit_queries(user_id):
+    """Запросы в том виде, в каком их выполняют маршруты: (маршрут, запрос)"""
+    today = date.today()
+    now = datetime.now()
+    week_start = today - timedelta(days=today.weekday())
+    week_end = week_start + timedelta(days=6)
+
+    return [
+        ('finance.index', Transaction.query.filter_by(user_id=user_id)
+            .order_by(Transaction.date.desc()).limit(10)),
+        ('finance.index', db.session.query(Category.type, func.sum(FinanceMonthlyRollup.total))
+            .join(Category, FinanceMonthlyRollup.category_id == Category.id)
+            .filter(FinanceMonthlyRollup.user_id == user_id,
+                    FinanceMonthlyRollup.month >= today.replace(day=1))
+            .group_by(Category.type)),
+        ('finance.statistics', db.session.query(Category.name, func.sum(Transaction.amount))
+            .join(Transaction)
+            .filter(Transaction.user_id == user_id,
+                    Transaction.date >= today - timedelta(days=7))
+            .group_by(Category.id, Category.name)),
+        ('finance.export_excel', db.session.query(Transaction.date, Category.name, Transaction.amount)
+            .join(Category, Transaction.category_id == Category.id)
+            .filter(Transaction.user_id == user_id)
+            .order_by(Transaction.date.desc())),
+        ('habits.index', Habit.query.filter_by(user_id=user_id)),
+        ('habits.view_habit', HabitLog.query.filter_by(habit_id=1)
+            .filter(HabitLog.date >= today - timedelta(days=30))
+            .order_by(HabitLog.date.desc())),
+        ('recipes.index', Recipe.query.filter_by(user_id=user_id)),
+        ('recipes.meal_planner', MealPlan.query.filter_by(user_id=user_id)
+            .filter(MealPlan.date >= week_start, MealPlan.date <= week_end)
+            .order_by(MealPlan.date, MealPlan.meal_type)),
+        ('recipes.meal_plan_range', db.session.query(func.count(MealPlan.id),
+                                                      func.max(Recipe.updated_at))
+            .join(Recipe, Recipe.id == MealPlan.recipe_id)
+            .filter(MealPlan.user_id == user_id, MealPlan.date >= week_start,
+                    MealPlan.date <= week_start + timedelta(days=27))),
+        ('recipes.shopping_list', RecipeIngredient.query
+            .join(MealPlan, MealPlan.recipe_id == RecipeIngredient.recipe_id)
+            .filter(MealPlan.user_id == user_id, MealPlan.date >= week_start,
+                    MealPlan.date <= week_end)),
+        ('recipes.add_meal_plan', MealPlan.query.filter_by(user_id=user_id, date=today,
+                                                           meal_type='lunch')),
+        ('study.review', StudyCard.query.filter_by(user_id=user_id)
+            .filter(StudyCard.next_review <= now)
+            .order_by(StudyCard.next_review, StudyCard.id).limit(10)),
+        ('study.review.topic', StudyCard.query.filter_by(user_id=user_id, topic='topic')
+            .filter(StudyCard.next_review <= now)
+            .order_by(StudyCard.next_review, StudyCard.id).limit(10)),
+        ('study.index', StudySession.query.filter_by(user_id=user_id)
+            .order_by(StudySession.date.desc()).limit(5)),
+        ('inventory.index', InventoryItem.query.filter_by(user_id=user_id)
+            .filter(tuple_(InventoryItem.created_at, InventoryItem.id) < tuple_(now, 1 << 30))
+            .order_by(InventoryItem.created_at.desc(), InventoryItem.id.desc()).limit(25)),
+        ('inventory.statistics', db.session.query(InventoryItem.room, func.count(InventoryItem.id))
+            .filter(InventoryItem.user_id == user_id)
+            .group_by(InventoryItem.room)),
+        ('inventory.warranty', InventoryItem.query.filter_by(user_id=user_id)
+            .filter(InventoryItem.warranty_expiry.isnot(None))
+            .filter(InventoryItem.warranty_expiry <= today + timedelta(days=30))
+            .order_by(InventoryItem.warranty_expiry)),
+        ('inventory.warranty_scan', InventoryItem.query
+            .filter(InventoryItem.warranty_expiry > today + timedelta(days=29))
+            .filter(InventoryItem.warranty_expiry <= today + timedelta(days=30))),
+        ('inventory.notifications', WarrantyNotification.query.filter_by(user_id=user_id, read_at=None)
+            .order_by(WarrantyNotification.warranty_expiry).limit(5)),
+        ('events.index', event_listing.window(user_id, *event_listing.period_range('week'),
+                                              after=(now, 1), limit=21)),
+        ('events.calendar', event_listing.window(user_id, *event_listing.period_range('month'),
+                                                 category='category')),
+        ('events.categories', db.session.query(Event.category)
+            .filter(Event.user_id.is_(None), Event.category.isnot(None)).distinct()),
+        ('events.saved_events', Event.query.filter_by(user_id=user_id, is_saved=True)
+            .order_by(Event.date)),
+    ]
+
+
+def _explain_sqlite(sql):
+    rows = db.session.execute(text('EXPLAIN QUERY PLAN ' + sql)).fetchall()
+    plan = [row[-1] for row in rows]
+    scans = []
+    for detail in plan:
+        # "SCAN t" - полное чтение таблицы; "SCAN t USING INDEX" - полный обход индекса
+        if detail.startswith('SCAN '):
+            table = detail.split()[1]
+            # SCAN anon_N - обход подзапроса, строки которого уже выбраны по индексу
+            if table in db.metadata.tables and table not in SMALL_TABLES:
+                scans.append(detail)
+    return plan, scans
+
+
+def _explain_postgresql(sql):
+    # Без данных планировщик и так выбирает Seq Scan, поэтому запрещаем его:
+    # если он все равно остался в плане, подходящего индекса нет
+    db.session.execute(text('SET LOCAL enable_seqscan = off'))
+    rows = db.session.execute(text('EXPLAIN ' + sql)).fetchall()
+    plan = [row[0] for row in rows]
+    scans = []
+    for line in plan:
+        if 'Seq Scan on ' in line:
+            table = line.split('Seq Scan on ')[1].split()[0]
+            if table not in SMALL_TABLES:
+                scans.append(line.strip())
+    return plan, scans
+
+
+def run_audit(user_id=1):
+    """Выполняет EXPLAIN для всех запросов; возвращает список результатов"""
+    dialect = db.engine.dialect
+    if dialect.name == 'sqlite':
+        explain = _explain_sqlite
+    elif dialect.name == 'postgresql':
+        explain = _explain_postgresql
+    else:
+        raise RuntimeError(f'Аудит индексов не поддерживает {dialect.name}')
+
+    results = []
+    for route, query in _audit_queries(user_id):
+        sql = str(query.statement.compile(dialect=dialect,
+                                          compile_kwargs={'literal_binds': True}))
+        plan, scans = explain(sql)
+        results.append({'route': route, 'sql': sql, 'plan': plan, 'full_scans': scans})
+    db.session.rollback()
+    return results
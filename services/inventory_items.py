@@ -0,0 +1,79 @@
+"""Запросы учета имущества: агрегаты на стороне SQL и постраничный список
+
+Список предметов листается по ключу (created_at, id) от новых к старым:
+следующая страница начинается после последней строки предыдущей, поэтому
+стоимость запроса не зависит от номера страницы и размера каталога.
+"""
+from datetime import datetime
+
+from sqlalchemy import func, tuple_
+from sqlalchemy.orm import load_only
+
+from models import db, InventoryItem
+
+NO_CATEGORY = 'Без категории'
+NO_ROOM = 'Не указано'
+
+
+def _filtered(query, user_id, category=None, room=None):
+    query = query.filter(InventoryItem.user_id == user_id)
+    if category:
+        query = query.filter(InventoryItem.category == category)
+    if room:
+        query = query.filter(InventoryItem.room == room)
+    return query
+
+
+def totals(user_id, category=None, room=None):
+    """(количество, общая стоимость) предметов одним запросом"""
+    count, value = _filtered(db.session.query(func.count(InventoryItem.id),
+                                              func.coalesce(func.sum(InventoryItem.purchase_price), 0)),
+                             user_id, category, room).one()
+    return count, float(value)
+
+
+def grouped(user_id, column, empty_label):
+    """[(значение, количество, стоимость)] с GROUP BY по колонке, по убыванию стоимости"""
+    label = func.coalesce(column, empty_label)
+    value = func.coalesce(func.sum(InventoryItem.purchase_price), 0)
+    rows = db.session.query(label, func.count(InventoryItem.id), value)\
+        .filter(InventoryItem.user_id == user_id)\
+        .group_by(label).order_by(value.desc(), label).all()
+    return [(name, count, float(total)) for name, count, total in rows]
+
+
+def distinct_values(user_id, column):
+    """Непустые значения колонки (категории или комнаты) для фильтров"""
+    rows = db.session.query(column).filter(InventoryItem.user_id == user_id, column.isnot(None),
+                                           column != '')\
+        .distinct().order_by(column).all()
+    return [value for value, in rows]
+
+
+def encode_cursor(item):
+    return f'{item.created_at.isoformat()}_{item.id}'
+
+
+def decode_cursor(cursor):
+    """(created_at, id) из курсора или None, если курсор пустой или поврежден"""
+    try:
+        created_at, item_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(created_at), int(item_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def page(user_id, category=None, room=None, cursor=None, per_page=24):
+    """Страница предметов после курсора и курсор следующей страницы (или None)"""
+    query = _filtered(InventoryItem.query.options(load_only(
+        InventoryItem.name, InventoryItem.category, InventoryItem.room,
+        InventoryItem.purchase_price, InventoryItem.image_path, InventoryItem.created_at)),
+        user_id, category, room)
+    position = decode_cursor(cursor)
+    if position:
+        query = query.filter(tuple_(InventoryItem.created_at, InventoryItem.id) < tuple_(*position))
+    items = query.order_by(InventoryItem.created_at.desc(), InventoryItem.id.desc())\
+        .limit(per_page + 1).all()
+    if len(items) > per_page:
+        return items[:per_page], encode_cursor(items[per_page - 1])
+    return items, None
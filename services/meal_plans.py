@@ -0,0 +1,164 @@
+"""План питания за произвольный период
+
+Блюда периода читаются одним запросом с проекцией только нужных колонок плана и
+рецепта (тексты ингредиентов и инструкций не загружаются). Для условных
+запросов есть отпечаток периода - один агрегат по тому же индексу
+(user_id, date, meal_type): количество и сумма id строк плана и самые поздние
+изменения плана и рецептов. Любое добавление, удаление, замена блюда или правка
+рецепта меняет отпечаток, поэтому по нему строятся ETag и Last-Modified.
+
+Массовые операции (копирование недели, применение шаблона, очистка периода)
+выполняются одним INSERT ... SELECT ... ON CONFLICT по уникальному индексу
+(user_id, date, meal_type) или одним DELETE: занятый слот получает новое блюдо.
+"""
+import hashlib
+from datetime import datetime, timedelta
+
+from sqlalchemy import Date, Integer, func, literal, select, union_all
+from sqlalchemy.orm import joinedload, load_only
+
+from models import db, Recipe, MealPlan, MealPlanTemplate, MealPlanTemplateItem
+from services import sql
+
+MEAL_TYPES = ('breakfast', 'lunch', 'dinner', 'snack')
+
+
+def week_start(day):
+    """Понедельник недели, в которую входит день"""
+    return day - timedelta(days=day.weekday())
+
+
+def _range_filter(query, user_id, date_from, date_to):
+    return query.filter(MealPlan.user_id == user_id,
+                        MealPlan.date >= date_from,
+                        MealPlan.date <= date_to)
+
+
+def plans_in_range(user_id, date_from, date_to):
+    """Блюда плана за период (включительно) с краткими данными рецептов"""
+    query = MealPlan.query.options(
+        load_only(MealPlan.id, MealPlan.date, MealPlan.meal_type, MealPlan.recipe_id),
+        joinedload(MealPlan.recipe).load_only(Recipe.id, Recipe.title, Recipe.category))
+    return _range_filter(query, user_id, date_from, date_to)\
+        .order_by(MealPlan.date, MealPlan.meal_type).all()
+
+
+def recipe_choices(user_id):
+    """Рецепты для выбора в планировщике: только id, название и категория"""
+    return Recipe.query.options(load_only(Recipe.id, Recipe.title, Recipe.category))\
+        .filter(Recipe.user_id == user_id)\
+        .order_by(Recipe.title).all()
+
+
+def fingerprint(user_id, date_from, date_to):
+    """(etag, last_modified) содержимого плана за период"""
+    plan_changed = func.max(func.coalesce(MealPlan.updated_at, MealPlan.created_at))
+    recipe_changed = func.max(func.coalesce(Recipe.updated_at, Recipe.created_at))
+    query = db.session.query(func.count(MealPlan.id), func.sum(MealPlan.id),
+                             plan_changed, recipe_changed)\
+        .join(Recipe, Recipe.id == MealPlan.recipe_id)
+    count, id_sum, plan_modified, recipe_modified = \
+        _range_filter(query, user_id, date_from, date_to).one()
+
+    last_modified = max(filter(None, (plan_modified, recipe_modified)), default=None)
+    source = f'{user_id}:{date_from}:{date_to}:{count}:{id_sum}:{plan_modified}:{recipe_modified}'
+    return hashlib.sha1(source.encode()).hexdigest(), last_modified
+
+
+def plan_to_dict(plan):
+    return {
+        'id': plan.id,
+        'date': plan.date.isoformat(),
+        'meal_type': plan.meal_type,
+        'recipe': {
+            'id': plan.recipe.id,
+            'title': plan.recipe.title,
+            'category': plan.recipe.category
+        }
+    }
+
+
+# ==================== МАССОВЫЕ ОПЕРАЦИИ ====================
+def _replace_on_conflict(stmt):
+    """Занятый слот (user_id, date, meal_type) получает новое блюдо"""
+    return stmt.on_conflict_do_update(
+        index_elements=['user_id', 'date', 'meal_type'],
+        set_={'recipe_id': stmt.excluded.recipe_id, 'updated_at': stmt.excluded.updated_at})
+
+
+def _upsert_from_select(rows):
+    """INSERT в план из SELECT (user_id, recipe_id, date, meal_type); возвращает число строк"""
+    now = datetime.utcnow()
+    rows = rows.add_columns(literal(now).label('created_at'), literal(now).label('updated_at'))
+    stmt = sql.insert(MealPlan).from_select(
+        ['user_id', 'recipe_id', 'date', 'meal_type', 'created_at', 'updated_at'], rows)
+    return db.session.execute(_replace_on_conflict(stmt)).rowcount
+
+
+def set_meal(user_id, recipe_id, day, meal_type):
+    """Ставит блюдо в слот плана (одним UPSERT)"""
+    now = datetime.utcnow()
+    stmt = sql.insert(MealPlan).values(user_id=user_id, recipe_id=recipe_id, date=day,
+                                       meal_type=meal_type, created_at=now, updated_at=now)
+    db.session.execute(_replace_on_conflict(stmt))
+
+
+def copy_range(user_id, source_from, source_to, target_from, repeat=1):
+    """Копирует план source_from..source_to в период с target_from, repeat раз подряд
+
+    Возвращает количество записанных слотов.
+    """
+    span = (source_to - source_from).days + 1
+    shift = (target_from - source_from).days
+    offsets = union_all(*[select(literal(shift + span * i, Integer).label('days'))
+                          for i in range(repeat)]).subquery('offsets')
+    rows = select(MealPlan.user_id, MealPlan.recipe_id,
+                  sql.add_days(MealPlan.date, offsets.c.days), MealPlan.meal_type)\
+        .join(offsets, literal(True))\
+        .where(MealPlan.user_id == user_id,
+               MealPlan.date >= source_from,
+               MealPlan.date <= source_to)
+    return _upsert_from_select(rows)
+
+
+def clear_range(user_id, date_from, date_to):
+    """Удаляет блюда периода; возвращает их количество"""
+    return MealPlan.query.filter(MealPlan.user_id == user_id,
+                                 MealPlan.date >= date_from,
+                                 MealPlan.date <= date_to)\
+        .delete(synchronize_session=False)
+
+
+def save_template(user_id, name, date_from, days=7):
+    """Сохраняет план days дней начиная с date_from как шаблон"""
+    template = MealPlanTemplate(user_id=user_id, name=name, days=days)
+    db.session.add(template)
+    db.session.flush()
+
+    rows = select(literal(template.id), sql.days_between(MealPlan.date, literal(date_from, Date)),
+                  MealPlan.meal_type, MealPlan.recipe_id)\
+        .where(MealPlan.user_id == user_id,
+               MealPlan.date >= date_from,
+               MealPlan.date <= date_from + timedelta(days=days - 1),
+               MealPlan.meal_type.isnot(None))
+    db.session.execute(MealPlanTemplateItem.__table__.insert().from_select(
+        ['template_id', 'day_offset', 'meal_type', 'recipe_id'], rows))
+    return template
+
+
+def apply_template(template, target_from):
+    """Раскладывает шаблон по дням начиная с target_from; возвращает число слотов"""
+    rows = select(literal(template.user_id), MealPlanTemplateItem.recipe_id,
+                  sql.add_days(literal(target_from, Date), MealPlanTemplateItem.day_offset),
+                  MealPlanTemplateItem.meal_type)\
+        .where(MealPlanTemplateItem.template_id == template.id)
+    return _upsert_from_select(rows)
+
+
+def templates(user_id):
+    """Шаблоны пользователя с количеством блюд"""
+    return db.session.query(MealPlanTemplate, func.count(MealPlanTemplateItem.id))\
+        .outerjoin(MealPlanTemplateItem)\
+        .filter(MealPlanTemplate.user_id == user_id)\
+        .group_by(MealPlanTemplate.id)\
+        .order_by(MealPlanTemplate.name).all()
@@ -0,0 +1,179 @@
+"""Метрики производительности запросов: время ответа, SQL, шаблоны, размер ответа
+
+Включается настройкой PERF_METRICS_ENABLED. Для каждого endpoint хранится окно
+последних PERF_METRICS_WINDOW запросов, по которому считаются перцентили.
+При PERF_LOG_ENABLED каждый запрос дополнительно пишется строкой JSON в лог
+best_personal.perf. Если метрики выключены, обработчики не регистрируются.
+"""
+import logging
+import math
+import threading
+import time
+from collections import defaultdict, deque
+
+from flask import g, has_request_context, request, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+FIELDS = ('wall_ms', 'sql_count', 'sql_ms', 'template_ms', 'response_bytes')
+
+perf_logger = logging.getLogger('best_personal.perf')
+
+
+def percentile(sorted_values, p):
+    """Перцентиль методом ближайшего ранга по отсортированному списку"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class MetricsStore:
+    """Скользящие окна замеров по endpoint"""
+
+    def __init__(self, window=1000):
+        self.window = window
+        self._samples = defaultdict(lambda: deque(maxlen=self.window))
+        self._totals = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, sample):
+        with self._lock:
+            self._samples[endpoint].append(sample)
+            self._totals[endpoint] += 1
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._totals.clear()
+
+    def summary(self):
+        """Перцентили p50/p95/p99 по каждому полю для всех endpoint"""
+        with self._lock:
+            snapshot = {endpoint: list(samples) for endpoint, samples in self._samples.items()}
+            totals = dict(self._totals)
+
+        result = {}
+        for endpoint, samples in snapshot.items():
+            stats = {'requests': totals[endpoint], 'window': len(samples)}
+            for field in FIELDS:
+                values = sorted(sample[field] for sample in samples)
+                stats[field] = {
+                    'p50': percentile(values, 50),
+                    'p95': percentile(values, 95),
+                    'p99': percentile(values, 99),
+                    'max': values[-1] if values else None
+                }
+            result[endpoint] = stats
+        return result
+
+
+store = MetricsStore()
+
+
+class _CountingBody:
+    """Тело потокового ответа, считающее отданные байты"""
+
+    def __init__(self, body):
+        self.body = body
+        self.sent = 0
+
+    def __iter__(self):
+        for chunk in self.body:
+            self.sent += len(chunk.encode() if isinstance(chunk, str) else chunk)
+            yield chunk
+
+    def close(self):
+        if hasattr(self.body, 'close'):
+            self.body.close()
+
+
+# ==================== ОБРАБОТЧИКИ ====================
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'perf_start' in g:
+        g.perf_sql_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'perf_sql_start' in g:
+        g.perf_sql_ms += (time.perf_counter() - g.pop('perf_sql_start')) * 1000
+        g.perf_sql_count += 1
+
+
+def _before_render(sender, template, context, **extra):
+    if 'perf_start' in g:
+        g.perf_template_start = time.perf_counter()
+
+
+def _after_render(sender, template, context, **extra):
+    if 'perf_template_start' in g:
+        g.perf_template_ms += (time.perf_counter() - g.pop('perf_template_start')) * 1000
+
+
+def _start_request():
+    g.perf_start = time.perf_counter()
+    g.perf_sql_count = 0
+    g.perf_sql_ms = 0.0
+    g.perf_template_ms = 0.0
+
+
+def _setup_json_log():
+    from pythonjsonlogger import jsonlogger
+    handler = logging.StreamHandler()
+    handler.setFormatter(jsonlogger.JsonFormatter('%(asctime)s %(name)s %(message)s'))
+    perf_logger.addHandler(handler)
+    perf_logger.setLevel(logging.INFO)
+    perf_logger.propagate = False
+
+
+def init_app(app):
+    """Подключает сбор метрик, если он включен в конфигурации"""
+    if not app.config.get('PERF_METRICS_ENABLED'):
+        return
+
+    store.window = app.config.get('PERF_METRICS_WINDOW', 1000)
+    log_enabled = app.config.get('PERF_LOG_ENABLED')
+    if log_enabled:
+        _setup_json_log()
+
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+    app.before_request(_start_request)
+
+    def record(state, details, response_bytes):
+        sample = {
+            'wall_ms': round((time.perf_counter() - state.perf_start) * 1000, 3),
+            'sql_count': state.perf_sql_count,
+            'sql_ms': round(state.perf_sql_ms, 3),
+            'template_ms': round(state.perf_template_ms, 3),
+            'response_bytes': response_bytes
+        }
+        store.record(details['endpoint'], sample)
+        if log_enabled:
+            perf_logger.info('request', extra=dict(sample, **details))
+
+    @app.after_request
+    def record_metrics(response):
+        if 'perf_start' not in g:
+            return response
+        endpoint = request.endpoint or 'unknown'
+        if endpoint == 'static':
+            return response
+
+        state = g._get_current_object()
+        details = {'endpoint': endpoint, 'method': request.method, 'status': response.status_code}
+        if response.direct_passthrough:
+            # send_file: файл отдает сервер (wsgi.file_wrapper), обработчики закрытия
+            # не вызываются - размер берем из заголовка
+            record(state, details, response.headers.get('Content-Length', 0, type=int))
+        elif response.is_streamed:
+            # Потоковый ответ (выгрузки Excel и PDF): время и размер - после отправки тела,
+            # запросы генератора тела тоже попадают в замер. calculate_content_length
+            # здесь не годится - он собрал бы весь поток в память
+            body = response.response = _CountingBody(response.response)
+            response.call_on_close(lambda: record(state, details, body.sent))
+        else:
+            record(state, details, response.calculate_content_length() or 0)
+        return response
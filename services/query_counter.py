@@ -0,0 +1,70 @@
+"""Счетчик SQL-запросов на запрос Flask и обнаружение N+1
+
+Включается настройкой QUERY_COUNTER_ENABLED. Одинаковые (с точностью до
+параметров) запросы, выполненные за один HTTP-запрос больше
+QUERY_COUNTER_THRESHOLD раз, пишутся в лог предупреждением, а при
+QUERY_COUNTER_RAISE=True запрос завершается ошибкой NPlusOneError - так
+проблему ловят тесты и бенчмарки.
+"""
+import re
+from collections import Counter
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Списки параметров IN (?, ?, ?) разной длины считаем одним запросом
+_IN_LIST = re.compile(r'\((?:\s*(?:\?|%\(\w+\)s|%s|:\w+)\s*,?)+\)')
+_SPACES = re.compile(r'\s+')
+
+
+class NPlusOneError(RuntimeError):
+    """Повторяющиеся однотипные запросы в рамках одного HTTP-запроса"""
+
+
+def normalize(statement):
+    """Текст запроса без различий в пробелах и длине списков IN"""
+    return _IN_LIST.sub('(?)', _SPACES.sub(' ', statement).strip())
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        counts = g.get('_query_counts')
+        if counts is not None:
+            counts[normalize(statement)] += 1
+
+
+def _start_counting():
+    g._query_counts = Counter()
+
+
+def repeated_statements(counts, threshold):
+    """Запросы, повторенные больше threshold раз: [(count, statement)]"""
+    return sorted(((count, statement) for statement, count in counts.items()
+                   if count > threshold), reverse=True)
+
+
+def init_app(app):
+    """Подключает счетчик, если он включен в конфигурации"""
+    if not app.config.get('QUERY_COUNTER_ENABLED'):
+        return
+
+    threshold = app.config.get('QUERY_COUNTER_THRESHOLD', 5)
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    app.before_request(_start_counting)
+
+    @app.after_request
+    def check_query_counts(response):
+        counts = g.pop('_query_counts', None)
+        if counts is None:
+            return response
+
+        response.headers['X-Query-Count'] = str(sum(counts.values()))
+        repeated = repeated_statements(counts, threshold)
+        if repeated:
+            details = '; '.join(f'{count}x {statement[:200]}' for count, statement in repeated)
+            message = f'N+1 в {request.endpoint}: {details}'
+            if app.config.get('QUERY_COUNTER_RAISE'):
+                raise NPlusOneError(message)
+            app.logger.warning(message)
+        return response
@@ -0,0 +1,169 @@
+"""Разбор ингредиентов рецептов и список покупок
+
+Строки вида "200 г муки", "Мука - 0,5 кг", "1/2 ст.л. соли", "2 яйца" разбираются
+на название, количество и единицу. Количество сразу приводится к базовой
+единице (г, мл, шт), а для названия хранится ключ из основ слов ("муки" и
+"мука" совпадают), поэтому список покупок - один GROUP BY по ключу и единице с
+суммой количеств. Строки без количества ("соль по вкусу") попадают в
+список с пустым количеством.
+"""
+import re
+
+from sqlalchemy import func, insert, select
+
+from models import db, Recipe, RecipeIngredient, MealPlan
+from services.recipe_search import stem
+
+# Синоним единицы -> (базовая единица, множитель)
+UNITS = {
+    'г': ('г', 1), 'гр': ('г', 1), 'грамм': ('г', 1), 'грамма': ('г', 1), 'граммов': ('г', 1),
+    'g': ('г', 1), 'gr': ('г', 1), 'gram': ('г', 1), 'grams': ('г', 1),
+    'кг': ('г', 1000), 'килограмм': ('г', 1000), 'килограмма': ('г', 1000), 'kg': ('г', 1000),
+    'мг': ('г', 0.001), 'mg': ('г', 0.001),
+    'мл': ('мл', 1), 'ml': ('мл', 1),
+    'л': ('мл', 1000), 'литр': ('мл', 1000), 'литра': ('мл', 1000), 'литров': ('мл', 1000),
+    'l': ('мл', 1000),
+    'ст.л': ('мл', 15), 'стл': ('мл', 15), 'tbsp': ('мл', 15),
+    'ч.л': ('мл', 5), 'чл': ('мл', 5), 'tsp': ('мл', 5),
+    'стакан': ('мл', 250), 'стакана': ('мл', 250), 'стаканов': ('мл', 250),
+    'cup': ('мл', 250), 'cups': ('мл', 250),
+    'шт': ('шт', 1), 'штука': ('шт', 1), 'штуки': ('шт', 1), 'штук': ('шт', 1),
+    'pcs': ('шт', 1), 'pc': ('шт', 1),
+    'зубчик': ('зубч.', 1), 'зубчика': ('зубч.', 1), 'зубчиков': ('зубч.', 1),
+    'пучок': ('пучок', 1), 'пучка': ('пучок', 1),
+}
+COUNT_UNIT = 'шт'  # единица для "2 яйца" без указания единицы
+
+_FRACTIONS = {'½': '1/2', '⅓': '1/3', '⅔': '2/3', '¼': '1/4', '¾': '3/4'}
+_NUMBER = r'\d+(?:[.,]\d+)?(?:\s*/\s*\d+)?(?:\s+\d+\s*/\s*\d+)?'
+_QUANTITY = rf'(?P<qty>{_NUMBER})(?:\s*[-–]\s*(?P<qty_to>{_NUMBER}))?'
+_UNIT = '(?P<unit>' + '|'.join(re.escape(unit) for unit in sorted(UNITS, key=len, reverse=True)) + r')\.?'
+# "200 г муки", "2 яйца"
+_LEADING = re.compile(rf'^{_QUANTITY}\s*(?:{_UNIT}(?=\s|$))?\s*(?P<name>.*)$', re.IGNORECASE)
+# "мука - 200 г", "яйца: 2"
+_TRAILING = re.compile(rf'^(?P<name>.+?)\s*[-–—:,]?\s+{_QUANTITY}\s*(?:{_UNIT})?$', re.IGNORECASE)
+_SPOON = re.compile(r'\b(ст|ч)\.?\s*л\b\.?', re.IGNORECASE)
+_LIST_MARKER = re.compile(r'^\s*(?:[-–—*•]|\d+[.)](?=\s))\s*')
+_NAME_TRIM = ' \t-–—:,.;'
+
+
+def _number(text):
+    """Число из "1,5", "1/2", "1 1/2" """
+    total = 0.0
+    for part in text.replace(',', '.').split():
+        if '/' in part:
+            numerator, denominator = part.split('/')
+            total += float(numerator) / float(denominator) if float(denominator) else 0
+        else:
+            total += float(part)
+    return total
+
+
+def _clean_name(name):
+    return ' '.join(name.strip(_NAME_TRIM).lower().split())
+
+
+def name_key(name):
+    """Ключ группировки: основы слов названия"""
+    return ' '.join(stem(word) for word in name.split())[:200]
+
+
+def parse_line(line):
+    """Разбор одной строки: (name, quantity, unit) или None для пустой строки"""
+    text = _LIST_MARKER.sub('', line).strip()
+    for fraction, replacement in _FRACTIONS.items():
+        text = text.replace(fraction, f' {replacement}')
+    text = _SPOON.sub(lambda m: f'{m.group(1).lower()}.л ', text).strip()
+    if not text:
+        return None
+
+    match = _LEADING.match(text) or _TRAILING.match(text)
+    if match and _clean_name(match.group('name')):
+        # Для диапазона "2-3" покупаем по верхней границе
+        quantity = _number(match.group('qty_to') or match.group('qty'))
+        unit, factor = UNITS.get((match.group('unit') or '').lower().replace(' ', ''), (COUNT_UNIT, 1))
+        return _clean_name(match.group('name'))[:200], round(quantity * factor, 3), unit
+
+    return _clean_name(text)[:200], None, None
+
+
+def parse(text):
+    """Разбор текста ингредиентов рецепта в список словарей для RecipeIngredient"""
+    rows = []
+    for line in (text or '').splitlines():
+        parsed = parse_line(line)
+        if parsed is None:
+            continue
+        name, quantity, unit = parsed
+        rows.append({
+            'position': len(rows),
+            'raw': line.strip()[:500],
+            'name': name,
+            'name_key': name_key(name),
+            'quantity': quantity,
+            'unit': unit
+        })
+    return rows
+
+
+def sync(recipe):
+    """Пересобирает разобранные ингредиенты рецепта после сохранения текста"""
+    recipe.parsed_ingredients = [RecipeIngredient(**row) for row in parse(recipe.ingredients)]
+
+
+def backfill(user_id=None, batch_size=1000):
+    """Массовый разбор ингредиентов всех (или одного пользователя) рецептов"""
+    recipe_ids = select(Recipe.id)
+    if user_id is not None:
+        recipe_ids = recipe_ids.where(Recipe.user_id == user_id)
+    db.session.execute(RecipeIngredient.__table__.delete()
+                       .where(RecipeIngredient.recipe_id.in_(recipe_ids)))
+
+    query = db.session.query(Recipe.id, Recipe.ingredients)
+    if user_id is not None:
+        query = query.filter(Recipe.user_id == user_id)
+
+    batch, count = [], 0
+    for recipe_id, ingredients in query.yield_per(batch_size):
+        for row in parse(ingredients):
+            row['recipe_id'] = recipe_id
+            batch.append(row)
+        if len(batch) >= batch_size:
+            db.session.execute(insert(RecipeIngredient), batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(RecipeIngredient), batch)
+        count += len(batch)
+    db.session.commit()
+    return count
+
+
+def shopping_list(user_id, date_from, date_to):
+    """Суммарные количества ингредиентов по плану питания за период
+
+    Рецепт, запланированный дважды, учитывается дважды.
+    """
+    return db.session.query(
+        func.min(RecipeIngredient.name).label('name'),
+        RecipeIngredient.unit,
+        func.sum(RecipeIngredient.quantity).label('quantity'),
+        func.count(RecipeIngredient.id).label('occurrences')
+    ).join(MealPlan, MealPlan.recipe_id == RecipeIngredient.recipe_id)\
+     .filter(MealPlan.user_id == user_id,
+             MealPlan.date >= date_from,
+             MealPlan.date <= date_to)\
+     .group_by(RecipeIngredient.name_key, RecipeIngredient.unit)\
+     .order_by(RecipeIngredient.name_key, RecipeIngredient.unit).all()
+
+
+def format_quantity(quantity, unit):
+    """Количество для отображения: 1500 г -> "1,5 кг", 2.0 шт -> "2 шт" """
+    if quantity is None:
+        return ''
+    if unit == 'г' and quantity >= 1000:
+        quantity, unit = quantity / 1000, 'кг'
+    elif unit == 'мл' and quantity >= 1000:
+        quantity, unit = quantity / 1000, 'л'
+    number = f'{quantity:.2f}'.rstrip('0').rstrip('.').replace('.', ',')
+    return f'{number} {unit}' if unit else number
@@ -0,0 +1,211 @@
+"""Полнотекстовый поиск рецептов
+
+SQLite: виртуальная таблица FTS5 recipes_fts (rowid = id рецепта), ранжирование
+BM25 с весами колонок. Владелец хранится токеном в отдельной колонке, поэтому
+отбор по пользователю выполняется самим индексом, а не фильтром по результатам.
+Таблица ведется слушателями маппера Recipe в той же транзакции, что и изменение.
+
+PostgreSQL: генерируемая колонка recipes.search_vector (tsvector с русской
+морфологией) с GIN-индексом, ранжирование ts_rank; синхронизацию выполняет сама
+база. На остальных СУБД и без FTS5 поиск откатывается к LIKE.
+"""
+import re
+
+from sqlalchemy import event, func, inspect, literal_column, text, Float, Integer
+from sqlalchemy.exc import OperationalError
+
+from models import db, Recipe
+
+FTS_TABLE = 'recipes_fts'
+MAX_TERMS = 10
+
+# Веса колонок title, description, ingredients, owner для bm25()
+_BM25 = f'bm25({FTS_TABLE}, 10.0, 3.0, 1.0, 0.0)'
+
+# Окончания для грубого стемминга запроса: "курицей" -> "куриц*"
+_ENDINGS = sorted(['иями', 'ями', 'ами', 'иях', 'ях', 'ах', 'ией', 'ей', 'ой', 'ий', 'ый',
+                   'ая', 'яя', 'ое', 'ее', 'ие', 'ые', 'ого', 'его', 'ому', 'ему', 'ими',
+                   'ыми', 'ую', 'юю', 'ов', 'ев', 'ам', 'ям', 'ом', 'ем', 'ию', 'ия', 'ье',
+                   'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'й', 'ь'], key=len, reverse=True)
+_MIN_STEM = 3
+
+_WORD = re.compile(r'\w+')
+
+# Наличие индекса для каждого движка (проверяется один раз на процесс)
+_available = {}
+
+
+def terms(query):
+    """Слова запроса в нижнем регистре"""
+    return _WORD.findall(query.lower())[:MAX_TERMS]
+
+
+def stem(word):
+    """Отрезает типичное русское окончание, оставляя основу не короче трех букв"""
+    for ending in _ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= _MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+def _owner(user_id):
+    return f'u{user_id}'
+
+
+def fts_match(user_id, query):
+    """Выражение MATCH для FTS5: владелец и префиксы основ всех слов"""
+    words = ' '.join(f'"{stem(word)}"*' for word in terms(query))
+    return f'owner:"{_owner(user_id)}" AND {{title description ingredients}}: ({words})'
+
+
+def tsquery(query):
+    """Выражение to_tsquery для PostgreSQL с префиксным поиском"""
+    return ' & '.join(f'{word}:*' for word in terms(query))
+
+
+# ==================== СОСТОЯНИЕ ИНДЕКСА ====================
+def available(connection=None):
+    """Есть ли в базе полнотекстовый индекс рецептов"""
+    connection = connection or db.session.connection()
+    key = connection.engine.url
+    if key not in _available:
+        if connection.dialect.name == 'sqlite':
+            _available[key] = inspect(connection).has_table(FTS_TABLE)
+        elif connection.dialect.name == 'postgresql':
+            columns = inspect(connection).get_columns(Recipe.__tablename__)
+            _available[key] = any(column['name'] == 'search_vector' for column in columns)
+        else:
+            _available[key] = False
+    return _available[key]
+
+
+def ensure_index():
+    """Создает индекс, если его нет; возвращает список изменений для upgrade_schema"""
+    connection = db.session.connection()
+    _available.pop(connection.engine.url, None)
+    if available(connection):
+        return []
+
+    if connection.dialect.name == 'sqlite':
+        try:
+            connection.execute(text(
+                f'CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5('
+                f'title, description, ingredients, owner, '
+                f"tokenize = 'unicode61 remove_diacritics 2')"))
+        except OperationalError:
+            # SQLite собран без FTS5 - остается поиск через LIKE
+            return []
+        _available[connection.engine.url] = True
+        rebuild()
+        return [f'полнотекстовый индекс {FTS_TABLE}']
+
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text(
+            "ALTER TABLE recipes ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+            "setweight(to_tsvector('russian', coalesce(title, '')), 'A') || "
+            "setweight(to_tsvector('russian', coalesce(description, '')), 'B') || "
+            "setweight(to_tsvector('russian', coalesce(ingredients, '')), 'C')) STORED"))
+        connection.execute(text(
+            'CREATE INDEX ix_recipes_search_vector ON recipes USING GIN (search_vector)'))
+        _available[connection.engine.url] = True
+        return ['полнотекстовый индекс recipes.search_vector']
+
+    return []
+
+
+def rebuild(user_id=None):
+    """Пересборка FTS5-индекса из таблицы рецептов (на PostgreSQL не требуется)"""
+    connection = db.session.connection()
+    if connection.dialect.name != 'sqlite' or not available(connection):
+        return
+
+    if user_id is None:
+        connection.execute(text(f'DELETE FROM {FTS_TABLE}'))
+    else:
+        connection.execute(text(f'DELETE FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match'),
+                           {'match': f'owner:"{_owner(user_id)}"'})
+    connection.execute(text(
+        f'INSERT INTO {FTS_TABLE} (rowid, title, description, ingredients, owner) '
+        f"SELECT id, title, coalesce(description, ''), coalesce(ingredients, ''), 'u' || user_id "
+        f'FROM recipes' + ('' if user_id is None else ' WHERE user_id = :user_id')),
+        {'user_id': user_id})
+    db.session.commit()
+
+
+# ==================== СИНХРОНИЗАЦИЯ ====================
+def _delete_row(connection, recipe_id):
+    connection.execute(text(f'DELETE FROM {FTS_TABLE} WHERE rowid = :id'), {'id': recipe_id})
+
+
+def _insert_row(connection, recipe):
+    connection.execute(text(
+        f'INSERT INTO {FTS_TABLE} (rowid, title, description, ingredients, owner) '
+        f'VALUES (:id, :title, :description, :ingredients, :owner)'), {
+        'id': recipe.id,
+        'title': recipe.title,
+        'description': recipe.description or '',
+        'ingredients': recipe.ingredients or '',
+        'owner': _owner(recipe.user_id)
+    })
+
+
+def _uses_fts(connection):
+    return connection.dialect.name == 'sqlite' and available(connection)
+
+
+def _after_insert(mapper, connection, recipe):
+    if _uses_fts(connection):
+        _insert_row(connection, recipe)
+
+
+def _after_update(mapper, connection, recipe):
+    if _uses_fts(connection):
+        _delete_row(connection, recipe.id)
+        _insert_row(connection, recipe)
+
+
+def _after_delete(mapper, connection, recipe):
+    if _uses_fts(connection):
+        _delete_row(connection, recipe.id)
+
+
+def init_app(app):
+    """Подключает синхронизацию индекса с таблицей рецептов"""
+    for name, listener in (('after_insert', _after_insert),
+                           ('after_update', _after_update),
+                           ('after_delete', _after_delete)):
+        if not event.contains(Recipe, name, listener):
+            event.listen(Recipe, name, listener)
+
+
+# ==================== ПОИСК ====================
+def search_query(user_id, query):
+    """Запрос рецептов пользователя, упорядоченный по релевантности"""
+    recipes = Recipe.query.filter(Recipe.user_id == user_id)
+    if not terms(query):
+        return recipes.order_by(Recipe.created_at.desc())
+
+    connection = db.session.connection()
+    if connection.dialect.name == 'sqlite' and available(connection):
+        matches = text(f'SELECT rowid AS recipe_id, {_BM25} AS rank '
+                       f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match')\
+            .bindparams(match=fts_match(user_id, query))\
+            .columns(recipe_id=Integer, rank=Float)\
+            .subquery('matches')
+        # Отбор по владельцу уже сделан токеном owner в индексе. Условие на
+        # recipes.user_id здесь лишнее и вредное: с ним планировщик идет от индекса
+        # рецептов и выполняет MATCH отдельно для каждой строки
+        return Recipe.query.join(matches, matches.c.recipe_id == Recipe.id)\
+            .order_by(matches.c.rank, Recipe.id)
+
+    if connection.dialect.name == 'postgresql' and available(connection):
+        vector = literal_column('recipes.search_vector')
+        ts_query = func.to_tsquery('russian', tsquery(query))
+        return recipes.filter(vector.op('@@')(ts_query))\
+            .order_by(func.ts_rank(vector, ts_query).desc(), Recipe.id)
+
+    for word in terms(query):
+        recipes = recipes.filter(Recipe.title.contains(word) |
+                                 Recipe.description.contains(word) |
+                                 Recipe.ingredients.contains(word))
+    return recipes.order_by(Recipe.created_at.desc())
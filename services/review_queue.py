@@ -0,0 +1,87 @@
+"""Очередь интервального повторения карточек
+
+Все выборки идут по индексам (user_id, next_review) и (user_id, topic, next_review):
+количество - через COUNT, следующая порция - упорядоченным запросом с LIMIT.
+"""
+import random
+from datetime import datetime
+
+from sqlalchemy import func, case
+
+from models import db, StudyCard
+
+
+def _base_query(user_id, topic=None):
+    query = StudyCard.query.filter(StudyCard.user_id == user_id)
+    if topic:
+        query = query.filter(StudyCard.topic == topic)
+    return query
+
+
+def due_condition(now):
+    """Карточка пора повторять: срок наступил или еще не назначен"""
+    return (StudyCard.next_review <= now) | (StudyCard.next_review.is_(None))
+
+
+def count_due(user_id, topic=None, now=None):
+    """Сколько карточек ждет повторения"""
+    now = now or datetime.now()
+    return _base_query(user_id, topic)\
+        .filter(due_condition(now))\
+        .with_entities(func.count(StudyCard.id)).scalar() or 0
+
+
+def count_cards(user_id):
+    """Общее количество карточек пользователя"""
+    return db.session.query(func.count(StudyCard.id))\
+        .filter(StudyCard.user_id == user_id).scalar() or 0
+
+
+def next_batch(user_id, topic=None, limit=10, exclude_ids=(), randomize=False, now=None):
+    """Следующие карточки к повторению: сначала без срока, затем самые просроченные"""
+    now = now or datetime.now()
+    exclude_ids = list(exclude_ids)
+
+    def restrict(query):
+        if exclude_ids:
+            query = query.filter(StudyCard.id.notin_(exclude_ids))
+        return query
+
+    # Два запроса вместо OR, чтобы порядок брался из индекса, а не из сортировки
+    cards = restrict(_base_query(user_id, topic).filter(StudyCard.next_review.is_(None)))\
+        .order_by(StudyCard.id).limit(limit).all()
+    if len(cards) < limit:
+        cards += restrict(_base_query(user_id, topic).filter(StudyCard.next_review <= now))\
+            .order_by(StudyCard.next_review, StudyCard.id)\
+            .limit(limit - len(cards)).all()
+
+    if randomize:
+        random.shuffle(cards)
+    return cards
+
+
+def topic_stats(user_id):
+    """Количество карточек и повторенных карточек по темам"""
+    rows = db.session.query(
+        StudyCard.topic,
+        func.count(StudyCard.id),
+        func.sum(case((StudyCard.review_count > 0, 1), else_=0))
+    ).filter(StudyCard.user_id == user_id)\
+     .group_by(StudyCard.topic).all()
+
+    topics = {}
+    for topic, total, reviewed in rows:
+        stats = topics.setdefault(topic or 'Без темы', {'total': 0, 'reviewed': 0})
+        stats['total'] += total
+        stats['reviewed'] += reviewed or 0
+    return topics
+
+
+def card_to_dict(card):
+    """Данные карточки для клиента"""
+    return {
+        'id': card.id,
+        'front': card.front,
+        'back': card.back,
+        'topic': card.topic
+    }
@@ -0,0 +1,49 @@
+"""Планировщик периодических задач (отдельный процесс: flask --app app scheduler)
+
+Задачи идемпотентны, поэтому при старте процесс сразу выполняет их все - так
+догоняются запуски, пропущенные, пока планировщик был остановлен.
+"""
+import time
+
+import schedule
+
+from models import db
+from services import event_import, habit_streaks, images, warranty_notifications
+
+
+def _job(app, name, func):
+    def run():
+        with app.app_context():
+            try:
+                result = func()
+                app.logger.info('Задача %s выполнена: %s', name, result)
+            except Exception:
+                db.session.rollback()
+                app.logger.exception('Ошибка задачи %s', name)
+            finally:
+                db.session.remove()
+    return run
+
+
+def build(app):
+    """Расписание задач приложения (время - в UTC)"""
+    scheduler = schedule.Scheduler()
+    scheduler.every().day.at(app.config['WARRANTY_SCAN_AT'], 'UTC')\
+        .do(_job(app, warranty_notifications.JOB_NAME, warranty_notifications.scan))
+    scheduler.every().day.at(app.config['HABITS_ROLLOVER_AT'], 'UTC')\
+        .do(_job(app, 'habits-rollover', habit_streaks.rollover))
+    scheduler.every().day.at(app.config['IMAGES_SWEEP_AT'], 'UTC')\
+        .do(_job(app, 'images-sweep', images.sweep))
+    if app.config['EVENT_SOURCES']:
+        # Неизменившиеся источники отвечают 304, поэтому частый опрос почти ничего не стоит
+        scheduler.every(app.config['EVENT_IMPORT_EVERY_HOURS']).hours\
+            .do(_job(app, 'events-import', event_import.run_import))
+    return scheduler
+
+
+def run_forever(app, interval=60):
+    scheduler = build(app)
+    scheduler.run_all()
+    while True:
+        scheduler.run_pending()
+        time.sleep(interval)
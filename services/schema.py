@@ -0,0 +1,113 @@
+"""Обновление схемы существующей базы данных (SQLite и PostgreSQL)
+
+Без отдельного инструмента миграций: недостающие таблицы создаются через
+create_all, недостающие колонки добавляются ALTER TABLE ADD COLUMN, недостающие
+индексы создаются по описанию моделей. Все шаги идемпотентны.
+"""
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateColumn
+
+from models import db
+
+# Индексы, замененные другими: таблица -> имена
+OBSOLETE_INDEXES = {
+    'meal_plans': ['ix_meal_plans_user_date_meal'],  # стал уникальным ux_meal_plans_user_date_meal
+    'study_cards': ['ix_study_cards_user_topic'],  # заменен ix_study_cards_user_topic_next_review
+    'events': ['ix_events_category'],  # заменен ix_events_user_category
+}
+
+
+# Кэш, который нужно пересчитать после добавления его колонок: таблица -> колонки
+CACHED_COLUMNS = {
+    'habits': {'current_streak', 'longest_streak', 'last_log_date', 'total_logs'},
+}
+
+
+def _add_missing_columns(inspector, table, changes):
+    """Добавляет недостающие колонки; возвращает множество их имен"""
+    existing = {c['name'] for c in inspector.get_columns(table.name)}
+    added = set()
+    for column in table.columns:
+        if column.name in existing:
+            continue
+        if not column.nullable and column.server_default is None:
+            changes.append(f'ПРОПУЩЕНО {table.name}.{column.name}: NOT NULL без server_default')
+            continue
+        ddl = CreateColumn(column).compile(dialect=db.engine.dialect)
+        db.session.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {ddl}'))
+        changes.append(f'колонка {table.name}.{column.name}')
+        added.add(column.name)
+    return added
+
+
+def _deduplicate(table, index, changes):
+    """Перед созданием уникального индекса оставляет по одной (последней) строке на ключ
+
+    Строки с NULL в ключе не конфликтуют в уникальном индексе и не трогаются
+    (GROUP BY свел бы их все в одну группу).
+    """
+    columns = ', '.join(column.name for column in index.columns)
+    not_null = ' AND '.join(f'{column.name} IS NOT NULL' for column in index.columns)
+    result = db.session.execute(text(
+        f'DELETE FROM {table.name} WHERE {not_null} AND id NOT IN '
+        f'(SELECT max(id) FROM {table.name} WHERE {not_null} GROUP BY {columns})'))
+    if result.rowcount:
+        changes.append(f'удалено дубликатов {table.name}: {result.rowcount}')
+
+
+def _add_missing_indexes(inspector, table, changes):
+    existing = {i['name'] for i in inspector.get_indexes(table.name)}
+    existing |= {c['name'] for c in inspector.get_unique_constraints(table.name)}
+    for name in OBSOLETE_INDEXES.get(table.name, ()):
+        if name in existing:
+            db.session.execute(text(f'DROP INDEX {name}'))
+            changes.append(f'удален индекс {name}')
+    for index in table.indexes:
+        if index.name in existing:
+            continue
+        if index.unique and 'id' in table.columns:
+            _deduplicate(table, index, changes)
+        index.create(db.session.connection())
+        changes.append(f'индекс {index.name}')
+
+
+def upgrade_schema():
+    """Приводит схему базы к описанию моделей и возвращает список изменений"""
+    existing_tables = set(inspect(db.engine).get_table_names())
+    db.create_all()
+
+    changes = []
+    stale_caches = set()
+    inspector = inspect(db.session.connection())
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            changes.append(f'таблица {table.name}')
+            continue
+        if _add_missing_columns(inspector, table, changes) & CACHED_COLUMNS.get(table.name, set()):
+            stale_caches.add(table.name)
+        _add_missing_indexes(inspector, table, changes)
+
+    # Полнотекстовые индексы описаны вне моделей
+    from services import recipe_search, search_index
+    changes += recipe_search.ensure_index()
+    changes += search_index.ensure_index()
+
+    # Разобранные ингредиенты для рецептов, созданных до появления таблицы
+    if 'recipe_ingredients' not in existing_tables and 'recipes' in existing_tables:
+        from services import recipe_ingredients
+        count = recipe_ingredients.backfill()
+        changes.append(f'разобрано ингредиентов: {count}')
+
+    # Колонки кэша серий добавлены пустыми - заполняем по истории отметок
+    if 'habits' in stale_caches:
+        from services import habit_streaks
+        habit_streaks.recompute_all()
+        changes.append('пересчитаны серии привычек')
+
+    # Помесячные агрегаты финансов для транзакций, созданных до появления таблицы
+    if 'finance_monthly_rollups' not in existing_tables and 'transactions' in existing_tables:
+        from services import finance_rollup
+        finance_rollup.rebuild()
+        changes.append('пересчитаны агрегаты финансов')
+    db.session.commit()
+    return changes
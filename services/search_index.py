@@ -0,0 +1,353 @@
+"""Общий поисковый индекс по модулям: имущество, рецепты, карточки, события, финансы
+
+Один инвертированный индекс search_index на все модули. Документ - строка
+(module, ref_id, owner, title, body), ключ документа - ref_id * 8 + код модуля,
+поэтому обновление и удаление идут по первичному ключу. Содержимое документа
+описано для каждого модуля одним SELECT: им заполняется индекс при пересборке,
+и он же выполняется слушателями маппера для одной строки после ее изменения.
+
+SQLite: виртуальная таблица FTS5 с префиксными индексами и ранжированием BM25.
+Владелец и модуль хранятся одним токеном scope ("u42recipes", "pubevents"), так
+что MATCH сразу сужается до документов пользователя в нужном модуле.
+PostgreSQL: обычная таблица с генерируемой колонкой tsvector и GIN-индексом.
+"""
+import re
+from collections import namedtuple
+
+from markupsafe import Markup, escape
+from sqlalchemy import (event, inspect, select, literal, cast, case, func, text,
+                        String, table, column)
+from sqlalchemy.exc import OperationalError
+
+from models import db, InventoryItem, Recipe, StudyCard, Event, Transaction, Category
+from services.recipe_search import terms, stem
+
+TABLE = 'search_index'
+PUBLIC_OWNER = 'pub'
+KEY_SPACE = 8
+
+# Длины префиксов, для которых FTS5 строит отдельные индексы; более длинные
+# основы в запросе обрезаются, чтобы префиксный поиск всегда шел по индексу
+PREFIX_LENGTHS = (3, 4, 5, 6)
+
+SNIPPET_WORDS = 12
+_TOKEN = re.compile(r'(\w+)')
+
+Source = namedtuple('Source', 'module code model label icon endpoint document')
+
+# Наличие индекса для каждого движка (проверяется один раз на процесс)
+_available = {}
+
+
+def _owner(user_id_column):
+    return literal('u') + cast(user_id_column, String)
+
+
+def _text(*columns):
+    """Склейка текстовых колонок через пробел с заменой NULL на пустую строку"""
+    result = func.coalesce(columns[0], '')
+    for col in columns[1:]:
+        result = result + ' ' + func.coalesce(col, '')
+    return result
+
+
+SOURCES = [
+    Source('inventory', 1, InventoryItem, 'Имущество', 'bi-box-seam', 'inventory.view_item',
+           (InventoryItem.id, _owner(InventoryItem.user_id), InventoryItem.name,
+            _text(InventoryItem.description, InventoryItem.category,
+                  InventoryItem.room, InventoryItem.serial_number))),
+    Source('recipes', 2, Recipe, 'Рецепты', 'bi-book', 'recipes.view_recipe',
+           (Recipe.id, _owner(Recipe.user_id), Recipe.title,
+            _text(Recipe.description, Recipe.ingredients, Recipe.category))),
+    Source('study', 3, StudyCard, 'Карточки', 'bi-card-text', 'study.edit_card',
+           (StudyCard.id, _owner(StudyCard.user_id), StudyCard.front,
+            _text(StudyCard.back, StudyCard.topic))),
+    Source('events', 4, Event, 'События', 'bi-calendar-event', 'events.view_event',
+           (Event.id, case((Event.user_id.is_(None), PUBLIC_OWNER), else_=_owner(Event.user_id)),
+            Event.title, _text(Event.description, Event.location, Event.category))),
+    Source('finance', 5, Transaction, 'Финансы', 'bi-wallet2', 'finance.edit_transaction',
+           (Transaction.id, _owner(Transaction.user_id),
+            select(Category.name).where(Category.id == Transaction.category_id).scalar_subquery(),
+            _text(Transaction.description))),
+]
+SOURCES_BY_MODEL = {source.model: source for source in SOURCES}
+SOURCES_BY_MODULE = {source.module: source for source in SOURCES}
+
+
+def _key_column(dialect):
+    return 'rowid' if dialect == 'sqlite' else 'id'
+
+
+def _index_table(dialect):
+    owner = 'scope' if dialect == 'sqlite' else 'owner'
+    return table(TABLE, column(_key_column(dialect)), column('module'), column('ref_id'),
+                 column(owner), column('title'), column('body'))
+
+
+def _documents(source, dialect):
+    """SELECT документов модуля в порядке колонок индекса"""
+    ref_id, owner, title, body = source.document
+    if dialect == 'sqlite':
+        owner = owner + source.module
+    return select(ref_id * KEY_SPACE + source.code, literal(source.module), ref_id,
+                  owner, func.coalesce(title, ''), body)
+
+
+def _scope(user_id, source):
+    """Токены scope документов, доступных пользователю в модуле"""
+    scopes = [f'"u{user_id}{source.module}"']
+    if source.model is Event:
+        scopes.append(f'"{PUBLIC_OWNER}{source.module}"')
+    return ' OR '.join(scopes)
+
+
+# ==================== СОСТОЯНИЕ ИНДЕКСА ====================
+def available(connection=None):
+    """Создан ли поисковый индекс в базе"""
+    connection = connection or db.session.connection()
+    key = connection.engine.url
+    if key not in _available:
+        _available[key] = (connection.dialect.name in ('sqlite', 'postgresql') and
+                           inspect(connection).has_table(TABLE))
+    return _available[key]
+
+
+def ensure_index():
+    """Создает индекс, если его нет; возвращает список изменений для upgrade_schema"""
+    connection = db.session.connection()
+    _available.pop(connection.engine.url, None)
+    if available(connection):
+        return []
+
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        try:
+            connection.execute(text(
+                f'CREATE VIRTUAL TABLE {TABLE} USING fts5('
+                f'title, body, scope, module, ref_id UNINDEXED, '
+                f"tokenize = 'unicode61 remove_diacritics 2', prefix = '{' '.join(map(str, PREFIX_LENGTHS))}')"))
+        except OperationalError:
+            # SQLite собран без FTS5 - общий поиск недоступен
+            return []
+    elif dialect == 'postgresql':
+        connection.execute(text(
+            f'CREATE TABLE {TABLE} ('
+            f'id BIGINT PRIMARY KEY, module VARCHAR(20) NOT NULL, ref_id INTEGER NOT NULL, '
+            f'owner VARCHAR(20) NOT NULL, title TEXT NOT NULL, body TEXT NOT NULL, '
+            f"document tsvector GENERATED ALWAYS AS ("
+            f"setweight(to_tsvector('russian', title), 'A') || "
+            f"setweight(to_tsvector('russian', body), 'B')) STORED)"))
+        connection.execute(text(f'CREATE INDEX ix_{TABLE}_document ON {TABLE} USING GIN (document)'))
+        connection.execute(text(f'CREATE INDEX ix_{TABLE}_owner ON {TABLE} (owner)'))
+    else:
+        return []
+
+    _available[connection.engine.url] = True
+    rebuild()
+    return [f'поисковый индекс {TABLE}']
+
+
+def rebuild(modules=None):
+    """Пересборка индекса целиком или только указанных модулей; возвращает число документов"""
+    connection = db.session.connection()
+    if not available(connection):
+        return 0
+
+    dialect = connection.dialect.name
+    index = _index_table(dialect)
+    total = 0
+    for source in SOURCES:
+        if modules and source.module not in modules:
+            continue
+        if dialect == 'sqlite':
+            connection.execute(text(f'DELETE FROM {TABLE} WHERE {TABLE} MATCH :match'),
+                               {'match': f'module: {source.module}'})
+        else:
+            connection.execute(index.delete().where(index.c.module == source.module))
+        result = connection.execute(index.insert().from_select(list(index.c),
+                                                               _documents(source, dialect)))
+        total += result.rowcount or 0
+    db.session.commit()
+    return total
+
+
+# ==================== СИНХРОНИЗАЦИЯ ====================
+def _delete_document(connection, source, ref_id):
+    index = _index_table(connection.dialect.name)
+    key = index.c[_key_column(connection.dialect.name)]
+    connection.execute(index.delete().where(key == ref_id * KEY_SPACE + source.code))
+
+
+def _insert_documents(connection, source, *criteria):
+    index = _index_table(connection.dialect.name)
+    documents = _documents(source, connection.dialect.name).where(*criteria)
+    return connection.execute(index.insert().from_select(list(index.c), documents)).rowcount
+
+
+def add_documents(model, *criteria):
+    """Индексирует строки, вставленные в обход ORM (массовая вставка не вызывает слушателей)"""
+    connection = db.session.connection()
+    if not available(connection):
+        return 0
+    return _insert_documents(connection, SOURCES_BY_MODEL[model], *criteria)
+
+
+def replace_documents(model, ids):
+    """Переиндексирует строки, вставленные или измененные массовым upsert"""
+    connection = db.session.connection()
+    if not available(connection) or not ids:
+        return 0
+    source = SOURCES_BY_MODEL[model]
+    index = _index_table(connection.dialect.name)
+    key = index.c[_key_column(connection.dialect.name)]
+    connection.execute(index.delete().where(key.in_([ref_id * KEY_SPACE + source.code for ref_id in ids])))
+    return _insert_documents(connection, source, source.model.id.in_(ids))
+
+
+def _after_insert(mapper, connection, target):
+    if available(connection):
+        source = SOURCES_BY_MODEL[mapper.class_]
+        _insert_documents(connection, source, source.model.id == target.id)
+
+
+def _after_update(mapper, connection, target):
+    if available(connection):
+        source = SOURCES_BY_MODEL[mapper.class_]
+        _delete_document(connection, source, target.id)
+        _insert_documents(connection, source, source.model.id == target.id)
+
+
+def _after_delete(mapper, connection, target):
+    if available(connection):
+        _delete_document(connection, SOURCES_BY_MODEL[mapper.class_], target.id)
+
+
+def init_app(app):
+    """Подключает обновление индекса при изменении записей всех модулей"""
+    for source in SOURCES:
+        for name, listener in (('after_insert', _after_insert),
+                               ('after_update', _after_update),
+                               ('after_delete', _after_delete)):
+            if not event.contains(source.model, name, listener):
+                event.listen(source.model, name, listener)
+
+
+# ==================== ПОИСК ====================
+def snippet(body, stems, words=SNIPPET_WORDS):
+    """Фрагмент текста вокруг первого совпадения с подсветкой <mark>
+
+    Строится в Python по уже выбранным документам: snippet() FTS5 при отборе
+    по ключам читает все совпавшие документы и на частых словах стоит дороже
+    самого поиска.
+    """
+    parts = _TOKEN.split(body or '')
+    # Нечетные элементы - слова, четные - разделители между ними
+    matched = {i for i in range(1, len(parts), 2) if parts[i].lower().startswith(stems)}
+    first = min(matched, default=1)
+    start = max(0, first - words)
+    end = min(len(parts), start + 2 * words)
+
+    html = ''.join(f'<mark>{escape(part)}</mark>' if i in matched else str(escape(part))
+                   for i, part in enumerate(parts[start:end], start))
+    prefix = '… ' if start > 0 else ''
+    suffix = ' …' if end < len(parts) else ''
+    return Markup(prefix + ' '.join(html.split()) + suffix)
+
+
+def _prefix(word):
+    """Префикс слова для MATCH: основа, обрезанная до длины префиксного индекса
+
+    Слова с цифрами (серийные номера, артикулы) не обрезаются - для них важна точность.
+    """
+    if any(char.isdigit() for char in word):
+        return word
+    return stem(word)[:PREFIX_LENGTHS[-1]]
+
+
+def _search_sqlite(user_id, query, modules, per_module, offset):
+    words = ' '.join(f'"{_prefix(word)}"*' for word in terms(query))
+    sources = [SOURCES_BY_MODULE[module] for module in modules] if modules else SOURCES
+    params = {'per_module': per_module, 'offset': offset}
+
+    # По каждому модулю: лучшие по BM25 среди всех совпадений (title весит больше
+    # body) и общее количество совпадений. ORDER BY rank с LIMIT FTS5 выполняет
+    # сам, держа в памяти только per_module + offset лучших документов
+    ranked_parts, total_parts = [], []
+    for source in sources:
+        params[f'match_{source.code}'] = f'scope: ({_scope(user_id, source)}) AND {{title body}}: ({words})'
+        ranked_parts.append(
+            f'SELECT * FROM ('
+            f'  SELECT rowid AS key, rank AS score FROM {TABLE}'
+            f'  WHERE {TABLE} MATCH :match_{source.code}'
+            f"    AND rank MATCH 'bm25(5.0, 1.0, 0.0, 0.0, 0.0)'"
+            f'  ORDER BY rank LIMIT :per_module OFFSET :offset)')
+        total_parts.append(f'SELECT {source.code}, count(*) FROM {TABLE} '
+                           f'WHERE {TABLE} MATCH :match_{source.code}')
+    ranked = db.session.execute(text(' UNION ALL '.join(ranked_parts)), params).all()
+    if not ranked:
+        return []
+    totals = dict(db.session.execute(text(' UNION ALL '.join(total_parts)), params).all())
+
+    # Заголовки и тексты найденных документов - по первичному ключу
+    keys = ', '.join(str(key) for key, _ in ranked)
+    documents = {key: (title, body) for key, title, body in db.session.execute(text(
+        f'SELECT rowid, title, body FROM {TABLE} WHERE rowid IN ({keys})'))}
+
+    codes = {source.code: source.module for source in SOURCES}
+    return [(codes[key % KEY_SPACE], key // KEY_SPACE, *documents[key], totals[key % KEY_SPACE])
+            for key, _ in ranked]
+
+
+def _search_postgresql(user_id, query, modules, per_module, offset):
+    params = {'query': ' & '.join(f'{word}:*' for word in terms(query)),
+              'owners': [f'u{user_id}', PUBLIC_OWNER], 'per_module': per_module,
+              'offset': offset, 'modules': list(modules or SOURCES_BY_MODULE)}
+    return db.session.execute(text(
+        f'SELECT module, ref_id, title, body, total FROM ('
+        f'  SELECT module, ref_id, title, body,'
+        f"    row_number() OVER (PARTITION BY module ORDER BY ts_rank(document, to_tsquery('russian', :query)) DESC) AS position,"
+        f'    count(*) OVER (PARTITION BY module) AS total'
+        f'  FROM {TABLE}'
+        f"  WHERE owner = ANY(:owners) AND module = ANY(:modules)"
+        f"    AND document @@ to_tsquery('russian', :query)"
+        f') ranked WHERE position > :offset AND position <= :offset + :per_module'
+        f' ORDER BY module, position'), params)
+
+
+def search(user_id, query, modules=None, per_module=5, offset=0):
+    """Результаты, сгруппированные по модулям:
+    [{'module', 'label', 'icon', 'total', 'hits': [{'id', 'title', 'snippet', 'endpoint'}]}]
+
+    offset - сколько лучших результатов каждого модуля пропустить (страницы).
+    """
+    if not terms(query) or not available():
+        return []
+
+    dialect = db.session.connection().dialect.name
+    runner = _search_sqlite if dialect == 'sqlite' else _search_postgresql
+    groups = {}
+    stems = tuple(stem(word) for word in terms(query))
+    for module, ref_id, title, body, total in runner(user_id, query, modules, per_module, offset):
+        source = SOURCES_BY_MODULE[module]
+        group = groups.setdefault(module, {
+            'module': module,
+            'label': source.label,
+            'icon': source.icon,
+            'total': total,
+            'hits': []
+        })
+        group['hits'].append({
+            'id': ref_id,
+            'title': title,
+            'snippet': snippet(body, stems),
+            'endpoint': source.endpoint
+        })
+    return [groups[source.module] for source in SOURCES if source.module in groups]
+
+
+def search_ids(user_id, query, module, limit=100, offset=0):
+    """Страница id записей одного модуля в порядке релевантности и общее число совпадений"""
+    groups = search(user_id, query, modules=[module], per_module=limit, offset=offset)
+    if not groups:
+        return [], 0
+    return [hit['id'] for hit in groups[0]['hits']], groups[0]['total']
@@ -0,0 +1,38 @@
+"""Диалектно-зависимые SQL-конструкции (SQLite и PostgreSQL)"""
+from sqlalchemy import func, cast, Date, Integer
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db
+
+
+def dialect_name():
+    """Имя диалекта текущего подключения"""
+    return db.engine.dialect.name
+
+
+def insert(model):
+    """INSERT с поддержкой ON CONFLICT для текущего диалекта"""
+    if dialect_name() == 'postgresql':
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+
+def month_start(column):
+    """Первый день месяца для колонки с датой"""
+    if dialect_name() == 'postgresql':
+        return cast(func.date_trunc('month', column), Date)
+    return func.date(column, 'start of month')
+
+
+def add_days(day, days):
+    """Дата плюс число дней (колонка или значение, число - тоже выражение)"""
+    if dialect_name() == 'postgresql':
+        return cast(day, Date) + days
+    return func.date(day, func.printf('%+d days', days))
+
+
+def days_between(day, start):
+    """Целое число дней от start до day"""
+    if dialect_name() == 'postgresql':
+        return cast(day, Date) - cast(start, Date)
+    return cast(func.julianday(day) - func.julianday(start), Integer)
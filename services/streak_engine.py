@@ -0,0 +1,100 @@
+"""Расчет серий всех привычек одним SQL-запросом (gaps-and-islands)
+
+Отметки одной привычки, идущие подряд, дают одинаковое значение
+"дата минус порядковый номер отметки" - это и есть номер острова (серии).
+Дальше остается сгруппировать острова и взять самый длинный и самый поздний.
+Результат совпадает с habit_streaks.compute_streaks и может записываться в кэш.
+"""
+from datetime import timedelta
+
+from sqlalchemy import text, bindparam, Integer, Date
+
+from models import db, Habit
+from services import habit_streaks
+
+# Номер острова: у SQLite даты хранятся строками, переводим в юлианские дни;
+# в PostgreSQL date - integer снова дает date. DENSE_RANK, а не ROW_NUMBER:
+# повторная отметка за тот же день не должна разрывать серию
+_ISLAND_KEY = {
+    'sqlite': 'julianday(date) - DENSE_RANK() OVER (PARTITION BY habit_id ORDER BY date)',
+    'postgresql': 'date - CAST(DENSE_RANK() OVER (PARTITION BY habit_id ORDER BY date) AS integer)',
+}
+
+_STREAKS_SQL = """
+WITH numbered AS (
+    SELECT habit_id, date, {island_key} AS island
+    FROM habit_logs
+    {where}
+),
+islands AS (
+    SELECT habit_id, COUNT(DISTINCT date) AS length, COUNT(*) AS logs, MAX(date) AS end_date
+    FROM numbered
+    GROUP BY habit_id, island
+),
+ranked AS (
+    SELECT habit_id, length, logs, end_date,
+           ROW_NUMBER() OVER (PARTITION BY habit_id ORDER BY end_date DESC) AS recency
+    FROM islands
+)
+SELECT habit_id AS id,
+       MAX(CASE WHEN recency = 1 AND end_date >= :yesterday THEN length ELSE 0 END) AS current_streak,
+       MAX(length) AS longest_streak,
+       MAX(end_date) AS last_log_date,
+       SUM(logs) AS total_logs
+FROM ranked
+GROUP BY habit_id
+ORDER BY habit_id
+"""
+
+
+def supported():
+    """Поддерживает ли текущая база расчет в SQL"""
+    return db.engine.dialect.name in _ISLAND_KEY
+
+
+def compute_all(user_id=None, today=None):
+    """Серии всех привычек с отметками (или привычек одного пользователя)"""
+    dialect = db.engine.dialect.name
+    if dialect not in _ISLAND_KEY:
+        raise RuntimeError(f'Расчет серий в SQL не поддерживает {dialect}')
+
+    today = today or habit_streaks.utc_today()
+    where = ''
+    params = {'yesterday': today - timedelta(days=1)}
+    if user_id is not None:
+        where = 'WHERE habit_id IN (SELECT id FROM habits WHERE user_id = :user_id)'
+        params['user_id'] = user_id
+
+    stmt = text(_STREAKS_SQL.format(island_key=_ISLAND_KEY[dialect], where=where))\
+        .bindparams(bindparam('yesterday', type_=Date))\
+        .columns(id=Integer, current_streak=Integer, longest_streak=Integer,
+                 last_log_date=Date, total_logs=Integer)
+    return [dict(row._mapping) for row in db.session.execute(stmt, params)]
+
+
+def _habit_ids(user_id):
+    if user_id is None:
+        return None
+    return [row[0] for row in db.session.query(Habit.id).filter(Habit.user_id == user_id)]
+
+
+def apply(user_id=None, today=None):
+    """Пересчитывает кэш серий в таблице habits; возвращает число привычек с отметками"""
+    computed = compute_all(user_id, today)
+    habit_streaks.store(computed, _habit_ids(user_id))
+    return len(computed)
+
+
+def verify(user_id=None, today=None):
+    """Сравнивает SQL-расчет с Python-реализацией; возвращает список расхождений"""
+    today = today or habit_streaks.utc_today()
+    computed = habit_streaks.iter_computed(_habit_ids(user_id), today=today)
+    expected = {row['id']: row for row in computed}
+    actual = {row['id']: row for row in compute_all(user_id, today)}
+    mismatches = []
+    for habit_id in sorted(expected.keys() | actual.keys()):
+        if expected.get(habit_id) != actual.get(habit_id):
+            mismatches.append({'id': habit_id,
+                               'python': expected.get(habit_id),
+                               'sql': actual.get(habit_id)})
+    return mismatches
@@ -0,0 +1,119 @@
+"""Уведомления об окончании гарантии
+
+Планировщик раз в сутки находит предметы всех пользователей, вошедшие в окна
+WARRANTY_NOTIFY_DAYS (например, за 30, 7 и 1 день до конца гарантии), и
+записывает строки warranty_notifications - страницы только читают их.
+
+Предмет входит в окно N дней в день warranty_expiry - N, поэтому с прошлого
+успешного запуска (last) до сегодня в окно вошли предметы с warranty_expiry в
+(last + N, today + N]. Этот диапазон выбирается по индексу warranty_expiry:
+стоимость сканирования зависит от числа истекающих гарантий, а не от размера
+каталогов. Предмет, уже попавший в более узкое окно, в широком не отмечается.
+
+Вставка - INSERT ... SELECT ... ON CONFLICT DO NOTHING по уникальному ключу
+(предмет, дата окончания, окно), а дата запуска сохраняется в той же
+транзакции. Повторный запуск ничего не дублирует, прерванный откатывается
+целиком, а после простоя сканирование догоняет пропущенные дни.
+"""
+from datetime import date, datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func, literal, select, Integer
+
+from models import db, InventoryItem, JobState, WarrantyNotification
+from services import sql
+
+JOB_NAME = 'warranty-scan'
+CONFLICT_KEY = ['item_id', 'warranty_expiry', 'days_before']
+
+
+def _windows():
+    """Окна по убыванию с нижней границей полосы каждого: [(N, ближайшее меньшее окно)]"""
+    days = sorted(set(current_app.config['WARRANTY_NOTIFY_DAYS']), reverse=True)
+    # Для самого узкого окна граница -1: уведомляем и в последний день гарантии
+    return list(zip(days, days[1:] + [-1]))
+
+
+def _insert(select_rows):
+    stmt = sql.insert(WarrantyNotification).from_select(
+        ['user_id', 'item_id', 'days_before', 'warranty_expiry', 'created_at'], select_rows)
+    return db.session.execute(stmt.on_conflict_do_nothing(index_elements=CONFLICT_KEY)).rowcount
+
+
+def _notify(today, last_run_date=None, *criteria):
+    now = datetime.utcnow()
+    created = 0
+    for days, narrower in _windows():
+        lower = today + timedelta(days=narrower)
+        if last_run_date:
+            lower = max(lower, last_run_date + timedelta(days=days))
+        created += _insert(
+            select(InventoryItem.user_id, InventoryItem.id, literal(days, Integer),
+                   InventoryItem.warranty_expiry, literal(now))
+            .where(InventoryItem.warranty_expiry > lower,
+                   InventoryItem.warranty_expiry <= today + timedelta(days=days), *criteria))
+    return created
+
+
+def scan(today=None):
+    """Записывает уведомления о предметах, вошедших в окна с прошлого запуска
+
+    Возвращает количество новых уведомлений.
+    """
+    today = today or date.today()
+    state = db.session.get(JobState, JOB_NAME) or JobState(name=JOB_NAME)
+    if state.last_run_date and state.last_run_date >= today:
+        return 0
+
+    created = _notify(today, state.last_run_date)
+    state.last_run_date = today
+    db.session.add(state)
+    db.session.commit()
+    return created
+
+
+def notify_new(*criteria, today=None):
+    """Уведомления для новых предметов, гарантия которых уже в окне (без commit)
+
+    Планировщик замечает предмет только в день входа в окно, поэтому предмет,
+    сразу попавший в окно, отмечается при сохранении - в самом узком окне.
+    """
+    return _notify(today or date.today(), None, *criteria)
+
+
+def check_item(item, today=None):
+    """Уведомления для добавленного или измененного предмета
+
+    Уведомления о прежней дате окончания гарантии удаляются.
+    """
+    stale = WarrantyNotification.query.filter(WarrantyNotification.item_id == item.id)
+    if item.warranty_expiry:
+        stale = stale.filter(WarrantyNotification.warranty_expiry != item.warranty_expiry)
+    stale.delete(synchronize_session=False)
+    if item.warranty_expiry:
+        notify_new(InventoryItem.id == item.id, today=today)
+    db.session.commit()
+
+
+def unread(user_id, limit=5):
+    """Непрочитанные уведомления пользователя с названиями предметов, ближайшие первыми"""
+    return db.session.query(WarrantyNotification, InventoryItem.name)\
+        .join(InventoryItem, InventoryItem.id == WarrantyNotification.item_id)\
+        .filter(WarrantyNotification.user_id == user_id, WarrantyNotification.read_at.is_(None))\
+        .order_by(WarrantyNotification.warranty_expiry, WarrantyNotification.id)\
+        .limit(limit).all()
+
+
+def unread_count(user_id):
+    return db.session.query(func.count(WarrantyNotification.id))\
+        .filter(WarrantyNotification.user_id == user_id,
+                WarrantyNotification.read_at.is_(None)).scalar()
+
+
+def mark_read(user_id):
+    """Отмечает все уведомления пользователя прочитанными; возвращает их количество"""
+    count = WarrantyNotification.query.filter(WarrantyNotification.user_id == user_id,
+                                              WarrantyNotification.read_at.is_(None))\
+        .update({WarrantyNotification.read_at: datetime.utcnow()}, synchronize_session=False)
+    db.session.commit()
+    return count
@@ -0,0 +1,117 @@
+/*
+ * Легкие SVG-графики вместо Plotly.
+ *
+ * Подключается только страницами с блоком charts. Каждый элемент с атрибутом
+ * data-chart-url после первой отрисовки страницы загружает JSON
+ * {labels: [...], values: [...]} и рисует график типа data-chart-type (pie).
+ */
+(function () {
+    'use strict';
+
+    const SVG_NS = 'http://www.w3.org/2000/svg';
+    const PALETTE = ['#0d6efd', '#dc3545', '#198754', '#ffc107', '#6f42c1', '#fd7e14',
+                     '#20c997', '#d63384', '#0dcaf0', '#6c757d', '#6610f2', '#adb5bd'];
+
+    function svgElement(name, attributes, parent) {
+        const element = document.createElementNS(SVG_NS, name);
+        for (const [key, value] of Object.entries(attributes)) {
+            element.setAttribute(key, value);
+        }
+        if (parent) {
+            parent.appendChild(element);
+        }
+        return element;
+    }
+
+    function formatNumber(value) {
+        return value.toLocaleString('ru-RU', {maximumFractionDigits: 2});
+    }
+
+    function arcPath(cx, cy, radius, inner, start, end) {
+        const point = (r, angle) => [cx + r * Math.sin(angle), cy - r * Math.cos(angle)];
+        const large = end - start > Math.PI ? 1 : 0;
+        const [x1, y1] = point(radius, start);
+        const [x2, y2] = point(radius, end);
+        const [x3, y3] = point(inner, end);
+        const [x4, y4] = point(inner, start);
+        return `M${x1},${y1} A${radius},${radius} 0 ${large} 1 ${x2},${y2} ` +
+               `L${x3},${y3} A${inner},${inner} 0 ${large} 0 ${x4},${y4} Z`;
+    }
+
+    function drawPie(container, data) {
+        const slices = data.labels
+            .map((label, i) => ({label: label, value: Number(data.values[i]) || 0}))
+            .filter(slice => slice.value > 0);
+        const total = slices.reduce((sum, slice) => sum + slice.value, 0);
+
+        const wrapper = document.createElement('div');
+        wrapper.className = 'd-flex flex-wrap align-items-center gap-4 h-100';
+        const size = Math.min(container.clientHeight || 300, 320);
+        const svg = svgElement('svg', {viewBox: '0 0 200 200', width: size, height: size,
+                                       role: 'img', 'aria-label': data.title || ''});
+        const legend = document.createElement('ul');
+        legend.className = 'list-unstyled mb-0 small';
+
+        let angle = 0;
+        slices.forEach((slice, i) => {
+            const color = PALETTE[i % PALETTE.length];
+            const share = slice.value / total;
+            // Полный круг дугой не рисуется - немного не доводим
+            const end = angle + Math.min(share, 0.9999) * 2 * Math.PI;
+            const path = svgElement('path', {d: arcPath(100, 100, 95, 55, angle, end), fill: color}, svg);
+            const tooltip = svgElement('title', {}, path);
+            tooltip.textContent = `${slice.label}: ${formatNumber(slice.value)} (${(share * 100).toFixed(1)}%)`;
+            angle = end;
+
+            const item = document.createElement('li');
+            const swatch = document.createElement('span');
+            swatch.className = 'd-inline-block rounded me-2';
+            swatch.style.cssText = `width: 0.8em; height: 0.8em; background: ${color}`;
+            item.append(swatch, `${slice.label} - ${(share * 100).toFixed(1)}%`);
+            legend.appendChild(item);
+        });
+
+        const center = svgElement('text', {x: 100, y: 106, 'text-anchor': 'middle',
+                                           'font-size': 16, fill: '#212529'}, svg);
+        center.textContent = formatNumber(total);
+
+        wrapper.append(svg, legend);
+        container.appendChild(wrapper);
+    }
+
+    const RENDERERS = {pie: drawPie};
+
+    function load(container) {
+        const draw = RENDERERS[container.dataset.chartType || 'pie'];
+        return fetch(container.dataset.chartUrl, {credentials: 'same-origin'})
+            .then(response => response.ok ? response.json() : Promise.reject(response.status))
+            .then(data => {
+                container.replaceChildren();
+                if (!data.values || !data.values.some(value => value > 0)) {
+                    container.textContent = container.dataset.chartEmpty || 'Нет данных за период';
+                    return;
+                }
+                draw(container, data);
+            })
+            .catch(() => {
+                container.textContent = 'Не удалось загрузить график';
+            });
+    }
+
+    function init() {
+        document.querySelectorAll('[data-chart-url]').forEach(load);
+    }
+
+    // Данные запрашиваются после первой отрисовки, чтобы не задерживать страницу
+    function afterPaint() {
+        requestAnimationFrame(() => setTimeout(init, 0));
+    }
+
+    if (document.readyState === 'loading') {
+        document.addEventListener('DOMContentLoaded', afterPaint);
+    } else {
+        afterPaint();
+    }
+
+    window.Charts = {load: load, renderers: RENDERERS};
+})();
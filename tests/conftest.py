@@ -0,0 +1,68 @@
+import os
+import sys
+
+import pytest
+
+# База в памяти; настройки читаются из окружения при импорте config.
+# Счетчик запросов включен с ошибкой: N+1 на любой странице роняет тест
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ['QUERY_COUNTER_ENABLED'] = '1'
+os.environ['QUERY_COUNTER_RAISE'] = '1'
+os.environ['PERF_METRICS_ENABLED'] = '1'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask.testing import FlaskClient  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+
+from app import app as flask_app, init_db  # noqa: E402
+from models import db, User  # noqa: E402
+
+
+class ContextClient(FlaskClient):
+    """Каждый запрос в своем контексте приложения
+
+    Фикстура app держит контекст открытым на весь тест, а flask_login
+    кэширует пользователя в g - без этого второй клиент видел бы первого.
+    """
+
+    def open(self, *args, **kwargs):
+        with self.application.app_context():
+            return super().open(*args, **kwargs)
+
+
+@pytest.fixture
+def app():
+    flask_app.config['TESTING'] = True
+    flask_app.test_client_class = ContextClient
+    with flask_app.app_context():
+        init_db()
+        yield flask_app
+        db.session.remove()
+        db.drop_all()
+        # Полнотекстовые индексы создаются вне metadata, drop_all их не видит
+        virtual = db.session.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND sql LIKE 'CREATE VIRTUAL TABLE%'"
+        )).scalars().all()
+        for name in virtual:
+            db.session.execute(text(f'DROP TABLE IF EXISTS "{name}"'))
+        db.session.commit()
+
+
+@pytest.fixture
+def user(app):
+    user = User(username='tester', email='tester@example.org')
+    user.set_password('secret')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+@pytest.fixture
+def login(app):
+    """Клиент, вошедший под указанным пользователем"""
+    def login(username='tester', password='secret'):
+        client = app.test_client()
+        response = client.post('/login', data={'username': username, 'password': password})
+        assert response.status_code == 302
+        return client
+    return login
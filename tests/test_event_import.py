@@ -0,0 +1,83 @@
+import hashlib
+import shutil
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+from models import Event
+from services import event_import
+from services.event_import import Source
+
+FIXTURES = Path(__file__).parent / 'fixtures' / 'events'
+CONTENT_TYPES = {'.html': 'text/html; charset=utf-8', '.json': 'application/json'}
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    """Отдает файлы каталога root с ETag и отвечает 304 на If-None-Match"""
+    root = None
+
+    def do_GET(self):
+        path = self.root / self.path.lstrip('/')
+        if not path.is_file():
+            self.send_error(404)
+            return
+        body = path.read_bytes()
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPES[path.suffix])
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def pages(tmp_path):
+    """Копия страниц-фикстур (тест их меняет) и адрес локального сервера"""
+    root = tmp_path / 'events'
+    shutil.copytree(FIXTURES, root)
+    handler = type('Handler', (FixtureHandler,), {'root': root})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield root, f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def test_run_import_created_updated_not_modified(app, pages):
+    root, base = pages
+    sources = [Source('afisha', f'{base}/afisha.html', 'html'),
+               Source('feed', f'{base}/feed.json', 'jsonld'),
+               Source('missing', f'{base}/missing.html', 'html')]
+
+    first = event_import.run_import(sources)
+    # Джаз, Выставка, Гамлет, Забег; "Без даты" отброшено, Выставка из ленты - дубль
+    assert (first.created, first.updated, first.not_modified) == (4, 0, 0)
+    assert (first.events, first.invalid, first.duplicates) == (6, 1, 1)
+    assert [name for name, _ in first.errors] == ['missing']
+    assert Event.query.filter(Event.user_id.is_(None)).count() == 4
+
+    second = event_import.run_import(sources)
+    assert (second.created, second.updated, second.not_modified) == (0, 0, 2)
+    assert second.events == 0
+    assert Event.query.count() == 4
+
+    # Изменилась только афиша: лента отвечает 304, Гамлет обновляется на месте
+    afisha = root / 'afisha.html'
+    afisha.write_text(afisha.read_text(encoding='utf-8').replace('content="Спектакль"', 'content="Премьера"'),
+                      encoding='utf-8')
+    third = event_import.run_import(sources)
+    assert (third.created, third.updated, third.not_modified) == (0, 1, 1)
+    assert Event.query.filter_by(title='Гамлет').one().description == 'Премьера'
+    assert Event.query.count() == 4
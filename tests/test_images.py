@@ -0,0 +1,97 @@
+import io
+import os
+import time
+
+import pytest
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+
+from models import db, Recipe
+from services import images
+
+
+def _png(color=(200, 30, 30)):
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 48), color).save(buffer, 'PNG')
+    buffer.seek(0)
+    return FileStorage(buffer, filename='photo.png', content_type='image/png')
+
+
+def _upload(color=(200, 30, 30)):
+    key = images.save_upload(_png(color))
+    assert images.ensure_variants(images.upload_root(), key)
+    return key
+
+
+def _age(key, seconds):
+    """Делает каталог ключа старше на seconds (как будто его выдали давно)"""
+    directory = os.path.join(images.upload_root(), *key.split('/'))
+    past = time.time() - seconds
+    os.utime(directory, (past, past))
+    return directory
+
+
+def _recipe(user, key):
+    recipe = Recipe(user_id=user.id, title='Пирог', ingredients='мука', instructions='печь', image_path=key)
+    db.session.add(recipe)
+    db.session.commit()
+    return recipe
+
+
+@pytest.fixture(autouse=True)
+def uploads(app, monkeypatch, tmp_path):
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path / 'uploads'))
+
+
+def test_release_keeps_key_claimed_by_uncommitted_upload(app, user):
+    key = _upload()
+    recipe = _recipe(user, key)
+    directory = _age(key, 2 * app.config['IMAGE_RELEASE_GRACE'])
+
+    # Второй пользователь загружает те же байты, но запись еще не сохранена
+    assert images.save_upload(_png()) == key
+    db.session.delete(recipe)
+    db.session.commit()
+    images.release(key)
+
+    assert images._variants_ready(directory)
+    _recipe(user, key)
+    assert images.ensure_variants(images.upload_root(), key)
+
+
+def test_release_and_sweep_remove_only_stale_unreferenced(app, user):
+    released = _upload((10, 10, 10))
+    recipe = _recipe(user, released)
+    released_dir = _age(released, 2 * app.config['IMAGE_RELEASE_GRACE'])
+    db.session.delete(recipe)
+    db.session.commit()
+    images.release(released)
+    assert not os.path.exists(released_dir)
+
+    referenced = _upload((20, 20, 20))
+    _recipe(user, referenced)
+    referenced_dir = _age(referenced, 2 * app.config['IMAGE_RELEASE_GRACE'])
+    orphan_dir = _age(_upload((30, 30, 30)), 2 * app.config['IMAGE_RELEASE_GRACE'])
+    fresh = _upload((40, 40, 40))
+
+    assert images.sweep() == 1
+    assert not os.path.exists(orphan_dir)
+    assert os.path.exists(referenced_dir)
+    assert images.ensure_variants(images.upload_root(), fresh)
+
+    # Удаленный каталог создается заново при повторной загрузке тех же байтов
+    assert _upload((10, 10, 10)) == released
+
+
+def test_failed_processing_is_logged(app, monkeypatch, caplog):
+    def broken(directory):
+        raise OSError('диск заполнен')
+
+    monkeypatch.setattr(images, '_process', broken)
+    key = images.save_upload(_png((50, 50, 50)))
+    deadline = time.time() + 5  # обработка идет в пуле потоков
+    while not any('Не удалось обработать изображение' in r.getMessage() for r in caplog.records):
+        assert time.time() < deadline
+        time.sleep(0.01)
+    record = next(r for r in caplog.records if key in r.getMessage())
+    assert record.exc_info[1].args == ('диск заполнен',)
@@ -0,0 +1,51 @@
+from datetime import date, timedelta
+
+import pytest
+
+from models import db, Category, Transaction, Recipe
+from services import perf
+
+
+@pytest.fixture
+def transactions(app, user, monkeypatch, tmp_path):
+    monkeypatch.setitem(app.config, 'EXPORT_FOLDER', str(tmp_path / 'exports'))
+    category = Category.query.filter_by(type='expense').first()
+    db.session.add_all(Transaction(user_id=user.id, category_id=category.id, amount=10 + i,
+                                   description=f'Покупка {i}', date=date.today() - timedelta(days=i))
+                       for i in range(50))
+    db.session.commit()
+
+
+@pytest.mark.parametrize('url, endpoint', [('/finance/export/excel', 'finance.export_excel'),
+                                           ('/finance/export/pdf', 'finance.export_pdf')])
+def test_streamed_export_size_is_recorded(login, transactions, url, endpoint):
+    client = login()
+    perf.store.reset()
+
+    response = client.get(url, buffered=True)
+    assert response.status_code == 200
+
+    stats = perf.store.summary()[endpoint]
+    assert stats['requests'] == 1
+    assert stats['response_bytes']['max'] == len(response.data) > 0
+
+
+def test_page_size_is_recorded(login, user):
+    client = login()
+    perf.store.reset()
+    response = client.get('/finance/')
+    assert perf.store.summary()['finance.index']['response_bytes']['max'] == len(response.data)
+
+
+def test_send_file_size_is_recorded(app, login, user, monkeypatch, tmp_path):
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    (tmp_path / 'recipes').mkdir()
+    (tmp_path / 'recipes' / 'soup.jpg').write_bytes(b'x' * 3000)
+    db.session.add(Recipe(user_id=user.id, title='Суп', ingredients='вода', instructions='варить',
+                          image_path=str(tmp_path / 'recipes' / 'soup.jpg')))
+    db.session.commit()
+    client = login()
+    perf.store.reset()
+
+    assert len(client.get('/uploads/recipes/soup.jpg', buffered=True).data) == 3000
+    assert perf.store.summary()['main.uploaded_file']['response_bytes']['max'] == 3000
@@ -0,0 +1,68 @@
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy.orm import lazyload
+
+import routes.finance
+from models import db, Category, Transaction, Recipe, MealPlan
+from services import meal_plans, recipe_ingredients
+from services.query_counter import NPlusOneError
+
+TODAY = date.today()
+WEEK_START = TODAY - timedelta(days=TODAY.weekday())
+
+
+def _seed_transactions(user, start, count):
+    categories = Category.query.order_by(Category.id).all()
+    for i in range(start, start + count):
+        category = categories[i % len(categories)]
+        db.session.add(Transaction(user_id=user.id, category_id=category.id, amount=100 + i,
+                                   description=f'Операция {i}', date=TODAY - timedelta(days=i % 20)))
+    db.session.commit()
+
+
+def _seed_meal_plans(user, start, count):
+    """count новых рецептов с ингредиентами, запланированных на текущую неделю"""
+    slots = [(WEEK_START + timedelta(days=day), meal_type)
+             for day in range(7) for meal_type in meal_plans.MEAL_TYPES]
+    for i in range(start, start + count):
+        recipe = Recipe(user_id=user.id, title=f'Рецепт {i}', instructions='готовить',
+                        ingredients=f'мука {i + 1} г\nмолоко 200 мл\nяйцо{i} 2 шт')
+        recipe_ingredients.sync(recipe)
+        db.session.add(recipe)
+        db.session.flush()
+        day, meal_type = slots[i]
+        db.session.add(MealPlan(user_id=user.id, recipe_id=recipe.id, date=day, meal_type=meal_type))
+    db.session.commit()
+
+
+PAGES = [
+    ('/finance/', _seed_transactions, 3),
+    ('/recipes/meal_planner', _seed_meal_plans, 2),
+    ('/recipes/shopping_list', _seed_meal_plans, 2),
+]
+
+
+def _query_count(client, url):
+    response = client.get(url)
+    assert response.status_code == 200
+    return int(response.headers['X-Query-Count'])
+
+
+@pytest.mark.parametrize('url, seed, n', PAGES, ids=[url for url, _, _ in PAGES])
+def test_query_count_does_not_grow_with_data(login, user, url, seed, n):
+    client = login()
+    seed(user, 0, n)
+    client.get(url)  # прогрев кэшей уровня процесса
+    small = _query_count(client, url)
+
+    seed(user, n, 9 * n)
+    assert _query_count(client, url) == small
+
+
+def test_lazy_loading_in_loop_raises(login, user, monkeypatch):
+    _seed_transactions(user, 0, 10)
+    client = login()
+    monkeypatch.setattr(routes.finance, 'joinedload', lazyload)
+    with pytest.raises(NPlusOneError):
+        client.get('/finance/')
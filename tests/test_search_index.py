@@ -0,0 +1,41 @@
+import pytest
+
+from models import db, InventoryItem
+from services import search_index
+
+
+@pytest.fixture
+def items(user):
+    # Самый старый предмет - лучший по BM25 (слово в названии), остальные
+    # упоминают слово только в описании
+    best = InventoryItem(user_id=user.id, name='Кабель питания', description='кабель')
+    db.session.add(best)
+    db.session.add_all(InventoryItem(user_id=user.id, name=f'Коробка {i}',
+                                     description=f'Разное {i}: кабель и мелочи')
+                       for i in range(700))
+    db.session.commit()
+    return best
+
+
+def test_overview_ranks_all_matches(user, items):
+    if not search_index.available():
+        pytest.skip('Поисковый индекс недоступен')
+
+    groups = search_index.search(user.id, 'кабель', per_module=5)
+    inventory = next(group for group in groups if group['module'] == 'inventory')
+    assert inventory['total'] == 701
+    assert inventory['hits'][0]['id'] == items.id
+    assert len(inventory['hits']) == 5
+
+
+def test_module_pages_cover_all_matches(user, items):
+    if not search_index.available():
+        pytest.skip('Поисковый индекс недоступен')
+
+    seen = []
+    for offset in range(0, 701, 100):
+        ids, total = search_index.search_ids(user.id, 'кабель', 'inventory', limit=100, offset=offset)
+        assert total == 701
+        seen.extend(ids)
+    assert seen[0] == items.id
+    assert len(set(seen)) == 701
@@ -0,0 +1,87 @@
+import random
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import text
+
+from models import db, Habit, HabitLog
+from services import habit_streaks, streak_engine
+
+TODAY = date(2026, 10, 17)
+
+
+def _drop_unique_constraint():
+    """habit_logs как в базах, созданных до уникального индекса (habit_id, date)"""
+    db.session.execute(text('DROP TABLE habit_logs'))
+    db.session.execute(text(
+        'CREATE TABLE habit_logs (id INTEGER PRIMARY KEY, habit_id INTEGER NOT NULL, '
+        'date DATE NOT NULL, notes TEXT, created_at DATETIME)'
+    ))
+    db.session.commit()
+
+
+def _random_dates(rng, last):
+    """Даты отметок с разрывами и повторами, последняя - last"""
+    dates = []
+    day = last
+    for _ in range(rng.randint(1, 60)):
+        dates.append(day)
+        if rng.random() < 0.1:
+            dates.append(day)
+        day -= timedelta(days=1 if rng.random() < 0.7 else rng.randint(2, 5))
+    rng.shuffle(dates)
+    return dates
+
+
+@pytest.fixture
+def habits(user):
+    _drop_unique_constraint()
+    rng = random.Random(20261017)
+    # Серии, которые заканчиваются сегодня, вчера и раньше
+    endings = [TODAY, TODAY - timedelta(days=1), TODAY - timedelta(days=2), TODAY - timedelta(days=30)]
+    habits = []
+    for i in range(40):
+        habit = Habit(user_id=user.id, name=f'Привычка {i}')
+        db.session.add(habit)
+        habits.append(habit)
+    db.session.flush()
+    for habit in habits[:-2]:  # у последних двух отметок нет
+        last = endings[habit.id % len(endings)]
+        db.session.add_all(HabitLog(habit_id=habit.id, date=day) for day in _random_dates(rng, last))
+    db.session.commit()
+    return habits
+
+
+def test_compute_all_matches_python(habits):
+    if not streak_engine.supported():
+        pytest.skip('Расчет серий в SQL не поддерживается')
+
+    expected = list(habit_streaks.iter_computed(today=TODAY))
+    assert streak_engine.compute_all(today=TODAY) == expected
+    assert len(expected) == len(habits) - 2
+    # В выборке есть и живые, и прерванные серии, и повторные отметки
+    assert any(row['current_streak'] for row in expected)
+    assert any(not row['current_streak'] for row in expected)
+    assert db.session.query(HabitLog.habit_id, HabitLog.date)\
+        .group_by(HabitLog.habit_id, HabitLog.date).having(db.func.count() > 1).count()
+
+
+def test_duplicate_log_does_not_break_streak(user):
+    _drop_unique_constraint()
+    habit = Habit(user_id=user.id, name='Зарядка')
+    db.session.add(habit)
+    db.session.flush()
+    days = [TODAY - timedelta(days=2), TODAY - timedelta(days=1), TODAY - timedelta(days=1), TODAY]
+    db.session.add_all(HabitLog(habit_id=habit.id, date=day) for day in days)
+    db.session.commit()
+
+    expected = {'id': habit.id, 'current_streak': 3, 'longest_streak': 3,
+                'last_log_date': TODAY, 'total_logs': 4}
+    assert streak_engine.compute_all(today=TODAY) == [expected]
+    assert list(habit_streaks.iter_computed(today=TODAY)) == [expected]
+
+
+def test_apply_matches_verify(habits, user):
+    assert streak_engine.apply(user.id, today=TODAY) == len(habits) - 2
+    assert streak_engine.verify(user.id, today=TODAY) == []
+    assert db.session.get(Habit, habits[-1].id).total_logs == 0
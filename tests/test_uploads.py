@@ -0,0 +1,70 @@
+import io
+import os
+
+import pytest
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+
+from models import db, User, Recipe, InventoryItem
+from services import images
+
+
+def _png():
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 48), (200, 30, 30)).save(buffer, 'PNG')
+    buffer.seek(0)
+    return FileStorage(buffer, filename='photo.png', content_type='image/png')
+
+
+@pytest.fixture
+def uploads(app, monkeypatch, tmp_path):
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path / 'uploads'))
+    return tmp_path / 'uploads'
+
+
+@pytest.fixture
+def other_user(app):
+    other = User(username='other', email='other@example.org')
+    other.set_password('secret')
+    db.session.add(other)
+    db.session.commit()
+    return other
+
+
+def test_image_variant_only_for_owner(app, login, uploads, user, other_user):
+    key = images.save_upload(_png())
+    db.session.add(InventoryItem(user_id=user.id, name='Камера', image_path=key))
+    db.session.commit()
+    url = f'/uploads/{key}/thumb.jpg'
+
+    client = login('other')
+    assert client.get(url).status_code == 404
+
+    # Тот же файл у второго пользователя - тот же ключ, теперь доступ есть
+    assert images.save_upload(_png()) == key
+    db.session.add(InventoryItem(user_id=other_user.id, name='Фото', image_path=key))
+    db.session.commit()
+    assert client.get(url).status_code == 200
+
+    owner = login('tester')
+    response = owner.get(url)
+    assert response.status_code == 200
+    assert response.mimetype == 'image/jpeg'
+
+
+def test_legacy_upload_only_for_owner(app, login, uploads, user, other_user):
+    folder = uploads / 'recipes'
+    folder.mkdir(parents=True)
+    (folder / '20240101120000_soup.jpg').write_bytes(b'jpeg')
+    image_path = os.path.join(app.config['UPLOAD_FOLDER'], 'recipes', '20240101120000_soup.jpg')
+    db.session.add(Recipe(user_id=user.id, title='Суп', ingredients='вода', instructions='варить',
+                          image_path=image_path))
+    db.session.commit()
+    url = '/uploads/recipes/20240101120000_soup.jpg'
+
+    client = login('other')
+    assert client.get(url).status_code == 404
+    assert client.get('/uploads/recipes/missing.jpg').status_code == 404
+
+    owner = login('tester')
+    assert owner.get(url).data == b'jpeg'